@@ -1,4 +1,5 @@
 import io
+import re
 
 from pip._internal.req import parse_requirements
 from setuptools import setup, find_packages
@@ -12,6 +13,12 @@ def parse_long_description():
     return io.open('README.md', encoding="utf-8").read()
 
 
+def parse_version():
+    # single source of the version (also part of the keys of the result cache)
+    init = io.open('vehicle_eco_balance/__init__.py', encoding="utf-8").read()
+    return re.search(r'^__version__ = "(.+)"', init, re.MULTILINE).group(1)
+
+
 setup(
     name="vehicle-eco-balance",
     packages=find_packages(exclude=["tests", "tests.*"]),
@@ -19,7 +26,7 @@ setup(
         "": ["*.txt"]
     },
     include_package_data=True,
-    version="0.0.1",
+    version=parse_version(),
     description="Python Utilities for estimating the eco balance of moving vehicles",
     long_description=parse_long_description(),
     long_description_content_type="text/markdown",
@@ -27,6 +34,16 @@ setup(
     url="https://github.com/MartinPontius/vehicle-eco-balance",
     keywords=["trajectory", "energy consumption", "fuel consumption", "CO2 emissions", "xFCD", "enviroCar"],
     install_requires=requirements,
+    extras_require={
+        "dask": ["dask[array]", "array-api-compat"],
+        "arrow": ["pyarrow"],
+    },
+    entry_points={
+        "console_scripts": [
+            "vehicle-eco-balance=vehicle_eco_balance.cli:main",
+            "vehicle-eco-balance-service=vehicle_eco_balance.service:main",
+        ],
+    },
     test_suite="tests",
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -0,0 +1,94 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, ConsumptionStat, Sensitivity, accumulate_consumption, \
+    calc_efficiency, error_mean, error_measure, error_100km
+from vehicle_eco_balance.backend import get_namespace
+
+try:
+    import array_api_compat
+    import dask.array as da
+except ImportError:
+    da = None
+
+try:
+    import array_api_strict
+except ImportError:
+    array_api_strict = None
+
+
+def wltc_like(n=1000):
+    rng = np.random.default_rng(1)
+    speed = np.clip(50 + np.cumsum(rng.normal(0, 1.5, n)), 0, 130)
+    acceleration = np.zeros(n)
+    acceleration[1:] = np.diff(speed) / 3.6
+    gradient_angle = rng.normal(0, 0.03, n)
+    return speed, acceleration, gradient_angle, np.ones(n)
+
+
+class TestNamespace(unittest.TestCase):
+
+    def test_numpy_default(self):
+        self.assertIs(get_namespace(np.zeros(3), 1.0, [1.0], None), np)
+        self.assertIs(get_namespace(), np)
+
+
+@unittest.skipIf(da is None, "dask and array_api_compat are not installed")
+class TestDask(unittest.TestCase):
+
+    def setUp(self):
+        self.arrays = wltc_like()
+        self.chunked = [da.from_array(array, chunks=300) for array in self.arrays]
+
+    def test_consumption_phys(self):
+        speed, acceleration, gradient_angle, dt = self.arrays
+        expected = ConsumptionPhys('fuel').calculate_consumption(speed, acceleration, gradient_angle, Car())
+        result = ConsumptionPhys('fuel').calculate_consumption(*self.chunked[:3], Car())
+        self.assertIsInstance(result, da.Array)
+        np.testing.assert_allclose(result.compute(), expected)
+        self.assertAlmostEqual(float(accumulate_consumption(result, self.chunked[3]).compute()),
+                               accumulate_consumption(expected, dt))
+
+    def test_consumption_stat(self):
+        speed, acceleration, gradient_angle, _ = self.arrays
+        expected = ConsumptionStat().calculate_consumption(speed, acceleration, gradient_angle)
+        result = ConsumptionStat().calculate_consumption(*self.chunked[:3])
+        np.testing.assert_allclose(result.compute(), expected)
+
+    def test_sensitivity(self):
+        speed, acceleration, gradient_angle, _ = self.arrays
+        sensitivity = Sensitivity()
+        np.testing.assert_allclose(sensitivity.dQ_mass(*self.chunked[:3], 100).compute(),
+                                   sensitivity.dQ_mass(speed, acceleration, gradient_angle, 100))
+        np.testing.assert_allclose(sensitivity.dQ_grad_angle(self.chunked[0], self.chunked[2], 0.01).compute(),
+                                   sensitivity.dQ_grad_angle(speed, gradient_angle, 0.01))
+
+    def test_errors(self):
+        speed, _, _, dt = self.arrays
+        other = speed * 1.1
+        chunked_other = da.from_array(other, chunks=300)
+        for function in (error_mean, error_measure):
+            self.assertAlmostEqual(float(function(self.chunked[0], chunked_other, self.chunked[3]).compute()),
+                                   function(speed, other, dt))
+        self.assertAlmostEqual(float(error_100km(self.chunked[0], chunked_other, self.chunked[3],
+                                                 self.chunked[0]).compute()),
+                               error_100km(speed, other, dt, speed))
+
+
+@unittest.skipIf(array_api_strict is None, "array_api_strict is not installed")
+class TestArrayApiStrict(unittest.TestCase):
+
+    def test_consumption_phys(self):
+        speed, acceleration, gradient_angle, _ = wltc_like()
+        expected = ConsumptionPhys('fuel').calculate_consumption(speed, acceleration, gradient_angle, Car())
+        strict = [array_api_strict.asarray(array) for array in (speed, acceleration, gradient_angle)]
+        result = ConsumptionPhys('fuel').calculate_consumption(*strict, Car())
+        np.testing.assert_allclose(np.asarray(result), expected)
+
+    def test_efficiency(self):
+        resistance = np.linspace(-3000, 3000, 13)
+        result = calc_efficiency(array_api_strict.asarray(resistance), -2000, 2000, 0.1, 0.38)
+        np.testing.assert_allclose(np.asarray(result), np.interp(resistance, [-2000, 2000], [0.1, 0.38]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, ResultCache
+
+
+class Requester:
+    """ Object with mutable request state like ElevationAPI """
+
+    def __init__(self):
+        self.params = {}
+        self.calls = 0
+
+    def get(self, values):
+        self.params['locations'] = str(values)
+        self.calls += 1
+        return np.asarray(values) * 2.0
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(self.directory.name)
+        self.speed = np.linspace(0, 120, 200)
+        self.acceleration = np.full(200, 0.1)
+        self.gradient_angle = np.full(200, 0.01)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_key(self):
+        key = self.cache.key(np.arange(3.0), Car(), cr=0.02)
+        self.assertEqual(key, self.cache.key(np.arange(3.0), Car(), cr=0.02))
+        self.assertNotEqual(key, self.cache.key(np.arange(3.0, dtype=np.float32), Car(), cr=0.02))
+        self.assertNotEqual(key, self.cache.key(np.arange(3.0), Car(mass=1600), cr=0.02))
+        self.assertNotEqual(key, self.cache.key(np.arange(3.0), Car(), cr=0.03))
+
+    def test_key_of_types(self):
+        self.assertEqual(self.cache.key(np.float32), self.cache.key(np.float32))
+        self.assertNotEqual(self.cache.key(np.float32), self.cache.key(np.float64))
+        self.assertNotEqual(self.cache.key(np.dtype('float32')), self.cache.key(np.dtype('float64')))
+
+    def test_calculate_consumption(self):
+        args = (self.speed, self.acceleration, self.gradient_angle, Car())
+        expected = self.cache.calculate_consumption(ConsumptionPhys('fuel'), *args)
+        model = ConsumptionPhys('fuel')
+        cached = self.cache.calculate_consumption(model, *args)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        np.testing.assert_array_equal(cached, expected)
+        self.assertIsNotNone(model.power)
+
+        self.cache.calculate_consumption(ConsumptionPhys('energy'), *args)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_memoize_function(self):
+        calls = []
+
+        def double(values):
+            calls.append(values)
+            return [np.asarray(values) * 2.0, np.asarray(values) * 3.0]
+
+        first = self.cache.memoize(double, [1.0, 2.0])
+        second = self.cache.memoize(double, [1.0, 2.0])
+        self.assertEqual(len(calls), 1)
+        np.testing.assert_array_equal(second[1], first[1])
+
+    def test_memoize_method_with_mutable_state(self):
+        requester = Requester()
+        self.cache.memoize(requester.get, [1.0, 2.0])
+        result = self.cache.memoize(requester.get, [1.0, 2.0])
+        self.assertEqual(requester.calls, 1)
+        np.testing.assert_array_equal(result, [2.0, 4.0])
+
+        self.cache.memoize(requester.get, [1.0, 2.0], cache_key='other')
+        self.assertEqual(requester.calls, 2)
+
+    def test_eviction(self):
+        cache = ResultCache(self.directory.name, max_bytes=3000)
+        for i in range(5):
+            cache.put(cache.key(i), {'values': np.zeros(100)})
+        self.assertLessEqual(cache._size, 3000)
+        self.assertIsNone(cache.get(cache.key(0)))
+        self.assertIsNotNone(cache.get(cache.key(4)))
+
+    def test_persistence(self):
+        key = self.cache.key('entry')
+        self.cache.put(key, {'values': np.arange(5.0)})
+        reopened = ResultCache(self.directory.name)
+        np.testing.assert_array_equal(reopened.get(key)['values'], np.arange(5.0))
+        reopened.clear()
+        self.assertIsNone(ResultCache(self.directory.name).get(key))
+
+
+    def test_writable_hits(self):
+        args = (self.speed, self.acceleration, self.gradient_angle, Car())
+        self.cache.calculate_consumption(ConsumptionPhys('fuel'), *args)
+        cached = self.cache.calculate_consumption(ConsumptionPhys('fuel'), *args)
+        self.assertTrue(cached.flags['WRITEABLE'])
+        expected = cached.copy()
+        cached[:] = 0.0
+        # changes are not written back to the cache
+        np.testing.assert_array_equal(self.cache.calculate_consumption(ConsumptionPhys('fuel'), *args), expected)
+
+    def test_index(self):
+        cache = ResultCache(self.directory.name, max_bytes=3000)
+        for i in range(3):
+            cache.put(cache.key(i), {'values': np.zeros(100)})
+        cache.get(cache.key(0))
+        with mock.patch.object(ResultCache, '_scan') as scan:
+            reopened = ResultCache(self.directory.name, max_bytes=3000)
+        scan.assert_not_called()
+        self.assertEqual(reopened._size, cache._size)
+        # entry 1 is the least recently used one
+        reopened.put(reopened.key(3), {'values': np.zeros(100)})
+        self.assertIsNone(reopened.get(reopened.key(1)))
+        self.assertIsNotNone(reopened.get(reopened.key(0)))
+
+    def test_index_compaction(self):
+        key = self.cache.key('entry')
+        self.cache.put(key, {'values': np.arange(5.0)})
+        for _ in range(1100):
+            self.cache.get(key)
+        with open(os.path.join(self.directory.name, 'index')) as file:
+            self.assertLess(len(file.readlines()), 1000)
+        self.assertIsNotNone(ResultCache(self.directory.name).get(key))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, Calibration, calibrate_fleet, error_measure
+
+
+def synthetic_track(vehicle, consumption_type='fuel', n=1500, seed=0):
+    rng = np.random.default_rng(seed)
+    speed = np.clip(60 + 30 * np.sin(np.arange(n) / 60) + np.cumsum(rng.normal(0, 0.5, n)), 0, 140)
+    acceleration = np.zeros(n)
+    acceleration[1:] = np.diff(speed) / 3.6
+    gradient_angle = 0.03 * np.sin(np.arange(n) / 150)
+    dt = np.ones(n)
+    consumption = ConsumptionPhys(consumption_type).calculate_consumption(speed, acceleration, gradient_angle,
+                                                                          vehicle)
+    return {'speed': speed, 'acceleration': acceleration, 'gradient_angle': gradient_angle, 'dt': dt,
+            'consumption': consumption}
+
+
+def arguments(track):
+    return track['speed'], track['acceleration'], track['gradient_angle'], track['dt'], track['consumption']
+
+
+class TestCalibration(unittest.TestCase):
+
+    def setUp(self):
+        self.true_vehicle = Car(mass=1800, cw=0.36)
+        self.track = synthetic_track(self.true_vehicle)
+
+    def test_recovers_parameters(self):
+        calibration = Calibration(parameters=('mass', 'cw'), seed=0)
+        vehicle = calibration.calibrate(*arguments(self.track), Car(mass=1300, cw=0.28))
+        self.assertAlmostEqual(vehicle.mass, 1800, delta=30)
+        self.assertAlmostEqual(vehicle.cw, 0.36, delta=0.01)
+        self.assertLess(calibration.error, 0.01)
+        self.assertTrue(np.all(np.diff(calibration.history) <= 0))
+
+    def test_batched_evaluation(self):
+        calibration = Calibration(parameters=('mass', 'cw', 'idle_power'), max_elements=1000)
+        candidates = np.array([[1200, 0.3, 1.0], [1800, 0.36, 2.0], [2500, 0.45, 3.0]])
+        speed, acceleration, gradient_angle, dt, consumption = arguments(self.track)
+        errors = calibration._evaluate(candidates, Car(), (speed, acceleration, gradient_angle, dt, consumption,
+                                                           0.02))
+        for candidate, error in zip(candidates, errors):
+            vehicle = Car(mass=candidate[0], cw=candidate[1], idle_power=candidate[2])
+            modelled = ConsumptionPhys('fuel').calculate_consumption(speed, acceleration, gradient_angle, vehicle)
+            self.assertAlmostEqual(error, error_measure(modelled, consumption, dt))
+
+    def test_efficiency_order(self):
+        calibration = Calibration(seed=1, n_iterations=3)
+        vehicle = calibration.calibrate(*arguments(self.track), Car())
+        self.assertLessEqual(vehicle.min_efficiency, vehicle.max_efficiency)
+
+    def test_gradient_refinement_energy(self):
+        track = synthetic_track(self.true_vehicle, 'energy')
+        initial = Car(mass=1400, cw=0.3)
+        calibration = Calibration(parameters=('mass', 'cw'), consumption_type='energy', n_candidates=1,
+                                  n_iterations=1, use_gradient=True, seed=0)
+        vehicle = calibration.calibrate(*arguments(track), initial)
+        self.assertLess(calibration.error, 0.05 * calibration.history[0])
+        self.assertAlmostEqual(vehicle.mass, 1800, delta=20)
+        self.assertAlmostEqual(vehicle.cw, 0.36, delta=0.005)
+
+    def test_unknown_metric(self):
+        with self.assertRaises(Exception):
+            Calibration(metric='unknown')
+
+    def test_calibrate_fleet(self):
+        tracks = [self.track, synthetic_track(Car(mass=1200, cw=0.3), seed=1)]
+        calibration = Calibration(parameters=('mass', 'cw'), n_iterations=5, seed=0)
+        results = calibrate_fleet(tracks, [Car(), Car()], calibration, processes=1)
+        for track, (vehicle, error) in zip(tracks, results):
+            single = Calibration(parameters=('mass', 'cw'), n_iterations=5, seed=0)
+            single.calibrate(*arguments(track), Car())
+            self.assertEqual(vehicle.mass, single.vehicle.mass)
+            self.assertEqual(error, single.error)
+        with self.assertRaises(Exception):
+            calibrate_fleet(tracks, [Car()])
+
+
+if __name__ == '__main__':
+    unittest.main()
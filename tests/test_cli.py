@@ -0,0 +1,133 @@
+import os
+import csv
+import json
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys
+from vehicle_eco_balance.cli import load_job, find_tracks, read_track, process_track, run, main, job_fingerprint
+from vehicle_eco_balance.geo import ElevationAPI, RouteCache
+from vehicle_eco_balance.kinematics import calc_acceleration
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tracks = os.path.join(self.directory.name, 'tracks')
+        os.makedirs(self.tracks)
+        self.speed = {}
+        for i in range(3):
+            time = np.arange(60.0)
+            speed = 50 + 20 * np.sin(time / 10 + i)
+            self.speed['track' + str(i)] = speed
+            with open(os.path.join(self.tracks, 'track' + str(i) + '.csv'), 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['Time in s', 'Speed in km/h', 'Gradient'])
+                writer.writerows(zip(time, speed, np.full(60, 0.01)))
+        self.job = self._write_job({'columns': {'gradient_angle': 'Gradient'}, 'output_format': 'summary'})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _write_job(self, config, name='job.json'):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as file:
+            json.dump(config, file)
+        return path
+
+    def test_load_job(self):
+        job = load_job(self.job)
+        self.assertEqual(job['model'], 'phys')
+        self.assertEqual(job['columns']['time'], 'Time in s')
+        self.assertEqual(job['columns']['gradient_angle'], 'Gradient')
+        for config in ({'model': 'other'}, {'gradient': 'other'}, {'output_format': 'xlsx'}):
+            with self.assertRaises(Exception):
+                load_job(self._write_job(config, 'invalid.json'))
+
+    def test_find_and_read_tracks(self):
+        files = find_tracks([self.tracks])
+        self.assertEqual([os.path.basename(path) for path in files], ['track0.csv', 'track1.csv', 'track2.csv'])
+        self.assertEqual(find_tracks([os.path.join(self.tracks, 'track1*')]), files[1:2])
+
+        track = read_track(files[0], load_job(self.job)['columns'])
+        self.assertEqual(set(track), {'time', 'speed', 'gradient_angle'})
+        np.testing.assert_allclose(track['speed'], self.speed['track0'])
+        with self.assertRaises(Exception):
+            read_track(files[0], {'time': 'Time in s', 'altitudes': 'Altitude in m'})
+
+    def test_process_track(self):
+        summary, results = process_track(load_job(self.job), os.path.join(self.tracks, 'track0.csv'))
+        speed = self.speed['track0']
+        dt = np.ones(60)
+        dt[0] = 0.0
+        expected = ConsumptionPhys('fuel').calculate_consumption(speed, calc_acceleration(speed, dt), np.full(60, 0.01),
+                                                           Car())
+        np.testing.assert_allclose(results['consumption'], expected)
+        self.assertEqual(summary['points'], 60)
+        self.assertAlmostEqual(summary['distance'], np.sum(speed[1:]) / 3600)
+        self.assertAlmostEqual(summary['co2'], np.sum(expected[1:]) / 3600 * Car().emission_factors['co2'])
+
+    def test_run(self):
+        job = load_job(self.job)
+        files = find_tracks([self.tracks])
+        serial = run(job, files, os.path.join(self.directory.name, 'serial'), workers=1, progress=False)
+        parallel = run(job, files, os.path.join(self.directory.name, 'parallel'), workers=2, progress=False)
+        self.assertEqual(len(serial[1]), 3)
+        self.assertEqual(serial[2], [])
+        for first, second in zip(serial[0], parallel[0]):
+            self.assertEqual(first['track'], second['track'])
+            self.assertAlmostEqual(first['consumption'], second['consumption'])
+
+    def test_checkpoint(self):
+        job = load_job(self.job)
+        files = find_tracks([self.tracks])
+        output = os.path.join(self.directory.name, 'output')
+        run(job, files[:2], output, workers=1, progress=False)
+        summaries, processed, failed, elapsed = run(job, files, output, workers=1, progress=False)
+        self.assertEqual(len(summaries), 3)
+        self.assertEqual([summary['track'] for summary in processed], ['track2.csv'])
+
+        with open(os.path.join(output, 'checkpoint.jsonl')) as file:
+            self.assertEqual(json.loads(file.readline()), {'job': job_fingerprint(job)})
+
+        with self.assertRaises(Exception):
+            run(dict(job, cr=0.03), files, output, workers=1, progress=False)
+
+    def test_route_cache(self):
+        for name, speed in self.speed.items():
+            with open(os.path.join(self.tracks, name + '.csv'), 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(['Time in s', 'Speed in km/h', 'Latitude', 'Longitude'])
+                writer.writerows(zip(np.arange(60.0), speed, 50.0 + np.arange(60) * 1e-4, np.full(60, 8.0)))
+        path = os.path.join(self.directory.name, 'routes.pkl')
+        job = load_job(self._write_job({'columns': {'lats': 'Latitude', 'lngs': 'Longitude'},
+                                        'gradient': 'elevation_api', 'route_cache': path,
+                                        'elevation': {'base_url': 'http://localhost/elevation'},
+                                        'output_format': 'summary'}))
+        download = mock.Mock(side_effect=lambda coordinates: np.linspace(100, 110, len(coordinates)))
+        with mock.patch.object(ElevationAPI, '_download_elevation', download):
+            summaries, processed, failed, elapsed = run(job, find_tracks([self.tracks]),
+                                                        os.path.join(self.directory.name, 'output'), workers=1,
+                                                        progress=False)
+        self.assertEqual(len(processed), 3)
+        # the tracks share the route, so the elevation is downloaded once and the cache is saved
+        self.assertEqual(download.call_count, 1)
+        self.assertEqual(len(RouteCache(path=path).tiles), 1)
+
+    def test_main(self):
+        output = os.path.join(self.directory.name, 'output')
+        with mock.patch('sys.stdout'):
+            self.assertEqual(main([self.job, self.tracks, '-o', output, '-w', '1', '-q']), 0)
+        with open(os.path.join(output, 'summary.csv'), newline='') as file:
+            self.assertEqual(len(list(csv.DictReader(file))), 3)
+
+        with open(os.path.join(self.tracks, 'broken.csv'), 'w') as file:
+            file.write('Time in s\n0\n1\n')
+        with mock.patch('sys.stdout'), mock.patch('sys.stderr'):
+            self.assertEqual(main([self.job, self.tracks, '-o', output, '-w', '1', '-q']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
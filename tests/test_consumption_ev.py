@@ -0,0 +1,92 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionEV, calc_state_of_charge, calc_remaining_range
+
+
+def state_of_charge_loop(consumption, dt, capacity, initial_soc):
+    """ Sequential integration limited to [0, 1] at each sampling point """
+    soc, result = initial_soc, []
+    for power, interval in zip(consumption, dt):
+        soc = min(max(soc - power * interval / 3600 / capacity, 0.0), 1.0)
+        result.append(soc)
+    return np.array(result)
+
+
+class TestConsumptionEV(unittest.TestCase):
+
+    def setUp(self):
+        self.vehicle = Car(mass=1800, fuel_type='electric')
+
+    def test_driving_and_regeneration(self):
+        model = ConsumptionEV(drive_efficiency=0.9, regen_efficiency=0.7, max_regen_power=None, auxiliary_power=0.5)
+        speed = np.full(3, 72.0)
+        acceleration = np.array([1.0, 0.0, -1.0])
+        consumption = model.calculate_consumption(speed, acceleration, np.zeros(3), self.vehicle)
+        power = model.power
+        self.assertGreater(power[0], 0)
+        self.assertLess(power[2], 0)
+        self.assertAlmostEqual(consumption[0], power[0] / 0.9 + 0.5)
+        self.assertAlmostEqual(consumption[2], power[2] * 0.7 + 0.5)
+
+    def test_regeneration_limit(self):
+        model = ConsumptionEV(max_regen_power=10.0, auxiliary_power=0.0)
+        consumption = model.calculate_consumption(np.array([100.0]), np.array([-3.0]), np.zeros(1), self.vehicle)
+        self.assertLess(model.power[0], -10.0)
+        self.assertAlmostEqual(consumption[0], -10.0 * model.regen_efficiency)
+
+    def test_fleet_matrix(self):
+        masses = np.array([[1500.0], [2000.0]])
+        speed = np.linspace(0, 120, 30)
+        acceleration = np.full(30, 0.2)
+        fleet = ConsumptionEV().calculate_consumption(speed, acceleration, np.zeros(30), Car(mass=masses,
+                                                                                             fuel_type='electric'))
+        for row, mass in enumerate(masses[:, 0]):
+            single = ConsumptionEV().calculate_consumption(speed, acceleration, np.zeros(30),
+                                                           Car(mass=mass, fuel_type='electric'))
+            np.testing.assert_allclose(fleet[row], single)
+
+
+class TestStateOfCharge(unittest.TestCase):
+
+    def test_against_loop(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            n = rng.integers(10, 500)
+            consumption = rng.normal(rng.normal(0, 5), rng.uniform(1, 200), n)
+            dt = rng.uniform(0, 3, n)
+            capacity = rng.uniform(0.01, 1.0)
+            initial_soc = rng.uniform()
+            np.testing.assert_allclose(calc_state_of_charge(consumption, dt, capacity, initial_soc),
+                                       state_of_charge_loop(consumption, dt, capacity, initial_soc), atol=1e-10)
+
+    def test_depletion_then_recovery(self):
+        # 2 kWh battery: empty after 1 h at 3 kW, then 1 h regeneration at -1 kW
+        consumption = np.concatenate([np.full(3600, 3.0), np.full(3600, -1.0)])
+        dt = np.ones(7200)
+        soc = calc_state_of_charge(consumption, dt, 2.0, 1.0)
+        np.testing.assert_allclose(soc, state_of_charge_loop(consumption, dt, 2.0, 1.0), atol=1e-10)
+        self.assertAlmostEqual(soc[-1], 0.5)
+
+    def test_full_battery_loses_regeneration(self):
+        consumption = np.concatenate([np.full(100, -5.0), np.full(100, 5.0)])
+        soc = calc_state_of_charge(consumption, np.ones(200), 10.0, 0.99)
+        self.assertEqual(soc[99], 1.0)
+        self.assertAlmostEqual(soc[-1], 1.0 - 500 / 3600 / 10.0)
+
+    def test_fleet_rows(self):
+        rng = np.random.default_rng(1)
+        consumption = rng.normal(0, 50, (3, 300))
+        dt = np.ones(300)
+        capacity = np.array([0.5, 1.0, 2.0])
+        initial_soc = np.array([0.2, 0.5, 0.9])
+        soc = calc_state_of_charge(consumption, dt, capacity, initial_soc)
+        for row in range(3):
+            np.testing.assert_allclose(soc[row], state_of_charge_loop(consumption[row], dt, capacity[row],
+                                                                      initial_soc[row]), atol=1e-10)
+
+    def test_remaining_range(self):
+        self.assertAlmostEqual(calc_remaining_range(0.5, 60.0, 15.0), 200.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
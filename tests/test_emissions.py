@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, get_emission_factor, calc_emissions, \
+    accumulate_emissions, grid_mixes
+
+
+class TestEmissions(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.speed = np.clip(50 + np.cumsum(rng.normal(0, 1, 500)), 0, None)
+        self.acceleration = np.zeros(len(self.speed))
+        self.acceleration[1:] = np.diff(self.speed) / 3.6
+        self.gradient_angle = rng.normal(0, 0.02, len(self.speed))
+        self.dt = np.ones(len(self.speed))
+
+    def test_emission_factor_per_fuel_type(self):
+        self.assertEqual(get_emission_factor(Car(fuel_type='gasoline')), 2.37)
+        self.assertEqual(get_emission_factor(Car(fuel_type='diesel')), 2.65)
+        self.assertEqual(get_emission_factor(Car(fuel_type='electric'), grid_mix='germany'), grid_mixes['germany'])
+        self.assertEqual(get_emission_factor(Car(fuel_type='electric'), grid_mix=0.1), 0.1)
+
+    def test_emission_factor_errors(self):
+        with self.assertRaises(Exception):
+            get_emission_factor(Car(fuel_type='electric'))
+        with self.assertRaises(Exception):
+            get_emission_factor(Car(fuel_type='electric'), grid_mix='unknown')
+        with self.assertRaises(Exception):
+            get_emission_factor(Car(), pollutant='nox')
+
+    def test_accumulate_emissions(self):
+        consumption = ConsumptionPhys('fuel').calculate_consumption(self.speed, self.acceleration,
+                                                                    self.gradient_angle, Car())
+        expected = np.sum(calc_emissions(consumption, 2.37) * self.dt) / 3600
+        self.assertAlmostEqual(accumulate_emissions(consumption, self.dt, 2.37), expected)
+
+        # time-varying factors
+        factor = np.linspace(0.2, 0.4, len(consumption))
+        expected = np.sum(consumption * factor * self.dt) / 3600
+        self.assertAlmostEqual(accumulate_emissions(consumption, self.dt, factor), expected)
+
+    def test_accumulate_emissions_uniform_dt(self):
+        consumption = np.array([1.0, 2.0, np.nan, 4.0])
+        self.assertAlmostEqual(accumulate_emissions(np.ones(5), 1.0, 2.37), 5 * 2.37 / 3600)
+        self.assertAlmostEqual(accumulate_emissions(consumption, 3600.0, 2.0), 14.0)
+        self.assertAlmostEqual(accumulate_emissions(consumption, 3600.0, np.array([1.0, 2.0, 3.0, 4.0])), 21.0)
+        np.testing.assert_allclose(accumulate_emissions(consumption, 3600.0, 2.0, offsets=[0, 2, 4]), [6.0, 8.0])
+
+    def test_accumulate_emissions_nan(self):
+        consumption = np.array([1.0, 2.0, np.nan, 4.0])
+        dt = np.array([3600.0, 3600.0, 3600.0, np.nan])
+        self.assertAlmostEqual(accumulate_emissions(consumption, dt, 2.0), 6.0)
+        self.assertAlmostEqual(accumulate_emissions(consumption, dt, np.array([1.0, 2.0, 3.0, 4.0])), 5.0)
+        self.assertTrue(np.isnan(accumulate_emissions(consumption, dt, 2.0, skipna=False)))
+
+    def test_accumulate_emissions_offsets(self):
+        consumption = np.array([1.0, 2.0, np.nan, 4.0, 5.0])
+        dt = np.full(5, 3600.0)
+        offsets = np.array([0, 2, 2, 5])
+        np.testing.assert_allclose(accumulate_emissions(consumption, dt, 2.0, offsets=offsets), [6.0, 0.0, 18.0])
+        for start, end, total in zip(offsets[:-1], offsets[1:],
+                                     accumulate_emissions(consumption, dt, 2.0, offsets=offsets)):
+            self.assertAlmostEqual(total, accumulate_emissions(consumption[start:end], dt[start:end], 2.0))
+
+    def test_accumulate_emissions_float32(self):
+        consumption = np.full(10 ** 6, 1.1, dtype=np.float32)
+        dt = np.ones(10 ** 6, dtype=np.float32)
+        total = accumulate_emissions(consumption, dt, np.float32(2.0))
+        self.assertAlmostEqual(total, 2.0 * 1.1 * 10 ** 6 / 3600, places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import numpy as np
+from vehicle_eco_balance import calc_distance, calc_distance_array, calc_cumulative_distance, \
+    calc_gradient_angle_array, calc_gradient_angle_smoothed, ElevationAPI, RouteCache, get_cr_from_osm
+
+
+def smoothed_reference(distance, altitudes, window):
+    """ Least squares fit per point with a loop """
+    gradient_angle = np.zeros(len(distance))
+    for i in range(len(distance)):
+        inside = np.abs(distance - distance[i]) <= window / 2
+        s, h = distance[inside], altitudes[inside]
+        if np.ptp(s) > 0:
+            gradient_angle[i] = np.arctan(np.polyfit(s, h, 1)[0])
+    return gradient_angle
+
+
+class TestGradient(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.lats = 50.0 + np.cumsum(rng.uniform(0, 1e-4, 300))
+        self.lngs = 8.0 + np.cumsum(rng.uniform(0, 1e-4, 300))
+        self.distance = calc_cumulative_distance(self.lats, self.lngs)
+        self.altitudes = 100 + 0.03 * self.distance + rng.normal(0, 0.5, 300)
+
+    def test_distance_array(self):
+        distance = calc_distance_array(self.lats, self.lngs)
+        self.assertEqual(distance[0], 0.0)
+        for i in (1, 100, 299):
+            expected = calc_distance((self.lats[i - 1], self.lngs[i - 1]), (self.lats[i], self.lngs[i]),
+                                     distance_type='great-circle')
+            self.assertAlmostEqual(distance[i], expected, delta=1e-3 * expected)
+
+    def test_cumulative_distance_offsets(self):
+        offsets = np.array([0, 120, 300])
+        distance = calc_cumulative_distance(self.lats, self.lngs, offsets=offsets)
+        np.testing.assert_allclose(distance[:120], calc_cumulative_distance(self.lats[:120], self.lngs[:120]))
+        np.testing.assert_allclose(distance[120:], calc_cumulative_distance(self.lats[120:], self.lngs[120:]))
+
+    def test_gradient_angle_array(self):
+        altitudes = 100 + 0.05 * self.distance
+        gradient_angle = calc_gradient_angle_array(self.lats, self.lngs, altitudes)
+        self.assertEqual(gradient_angle[0], 0.0)
+        np.testing.assert_allclose(gradient_angle[1:], np.arctan(0.05), rtol=1e-6)
+
+    def test_smoothed_linear_profile(self):
+        altitudes = 100 + 0.05 * self.distance
+        gradient_angle = calc_gradient_angle_smoothed(self.distance, altitudes, 100.0)
+        np.testing.assert_allclose(gradient_angle, np.arctan(0.05), rtol=1e-6)
+
+    def test_smoothed_against_loop(self):
+        for window in (30.0, 100.0, 500.0):
+            np.testing.assert_allclose(calc_gradient_angle_smoothed(self.distance, self.altitudes, window),
+                                       smoothed_reference(self.distance, self.altitudes, window), atol=1e-9)
+
+    def test_smoothed_offsets(self):
+        offsets = np.array([0, 120, 300])
+        distance = calc_cumulative_distance(self.lats, self.lngs, offsets=offsets)
+        gradient_angle = calc_gradient_angle_smoothed(distance, self.altitudes, 100.0, offsets=offsets)
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            np.testing.assert_allclose(gradient_angle[start:end],
+                                       smoothed_reference(distance[start:end], self.altitudes[start:end], 100.0),
+                                       atol=1e-9)
+
+    def test_smoothed_profiles(self):
+        profiles = self.altitudes + np.arange(3)[:, np.newaxis] * np.sin(self.distance / 50)
+        gradient_angle = calc_gradient_angle_smoothed(self.distance, profiles, 100.0)
+        self.assertEqual(gradient_angle.shape, profiles.shape)
+        for row, altitudes in zip(gradient_angle, profiles):
+            np.testing.assert_allclose(row, calc_gradient_angle_smoothed(self.distance, altitudes, 100.0), atol=1e-12)
+
+    def test_smoothed_length_mismatch(self):
+        with self.assertRaises(Exception):
+            calc_gradient_angle_smoothed(self.distance, self.altitudes[:-1])
+
+
+class TestRouteCache(unittest.TestCase):
+
+    def setUp(self):
+        self.route = [(50.0 + i * 1e-4, 8.0 + i * 1e-4) for i in range(50)]
+
+    def test_lookup_and_update(self):
+        cache = RouteCache()
+        values, missing = cache.lookup('cr', self.route)
+        self.assertEqual(values, [None] * 50)
+        np.testing.assert_array_equal(missing, np.arange(50))
+
+        cache.update('cr', self.route, list(range(50)))
+        values, missing = cache.lookup('cr', self.route)
+        self.assertEqual(values, list(range(50)))
+        self.assertEqual(len(missing), 0)
+        self.assertEqual(cache.hits, 50)
+        self.assertEqual(cache.misses, 50)
+
+    def test_partial_overlap(self):
+        cache = RouteCache()
+        cache.update('cr', self.route, [0.02] * 50)
+        # detour: another start, slightly shifted sampling points and a new segment at the end
+        detour = [(lat + 2e-5, lng - 2e-5) for lat, lng in self.route[10:]] + \
+                 [(50.005 + i * 1e-4, 8.005) for i in range(1, 30)]
+        values, missing = cache.lookup('cr', detour)
+        self.assertEqual(values[:40], [0.02] * 40)
+        np.testing.assert_array_equal(missing, np.arange(40, len(detour)))
+
+    def test_tiles(self):
+        cache = RouteCache(tile_precision=3)
+        cache.update('cr', self.route, [0.02] * 50)
+        self.assertEqual(len(cache.tiles), 5)
+        self.assertEqual(cache.changed, set(cache.tiles))
+        with self.assertRaises(Exception):
+            RouteCache(precision=3, tile_precision=4)
+
+    def test_eviction(self):
+        cache = RouteCache(max_tiles=2)
+        routes = [[(lat + i * 1e-4, 8.0) for i in range(20)] for lat in (50.0, 51.0, 52.0)]
+        for route in routes:
+            cache.update('cr', route, [0.02] * 20)
+        self.assertEqual(len(cache.tiles), 2)
+        self.assertEqual(len(cache.lookup('cr', routes[0])[1]), 20)
+        self.assertEqual(len(cache.lookup('cr', routes[2])[1]), 0)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'routes.pkl')
+            cache = RouteCache(path=path)
+            cache.update('elevation', self.route, [100.0] * 50)
+            cache.save()
+            loaded = RouteCache(path=path)
+            self.assertEqual(loaded.lookup('elevation', self.route)[0], [100.0] * 50)
+
+    def test_merge(self):
+        worker = RouteCache()
+        worker.update('cr', self.route, [0.02] * 50)
+        self.assertEqual(len(worker.changed), 1)
+
+        cache = RouteCache()
+        cache.update('elevation', self.route, [100.0] * 50)
+        cache.changed.clear()
+        cache.merge({tile: worker.tiles[tile] for tile in worker.changed})
+        self.assertEqual(cache.lookup('cr', self.route)[0], [0.02] * 50)
+        self.assertEqual(cache.lookup('elevation', self.route)[0], [100.0] * 50)
+        self.assertEqual(cache.changed, worker.changed)
+
+    def test_elevation_with_cache(self):
+        api = ElevationAPI(base_url='http://localhost/elevation')
+        cache = RouteCache()
+        download = mock.Mock(side_effect=lambda coordinates: np.arange(len(coordinates), dtype=float))
+        with mock.patch.object(api, '_download_elevation', download):
+            first = api.get_elevation(self.route[:30], cache=cache)
+            second = api.get_elevation(self.route[:30], cache=cache)
+        np.testing.assert_allclose(first, np.arange(30))
+        np.testing.assert_allclose(second, first)
+        self.assertEqual(download.call_count, 1)
+
+    def test_cr_with_cache(self):
+        cache = RouteCache()
+        match = mock.Mock(side_effect=lambda coordinates: [np.full(len(coordinates), 0.015),
+                                                           np.array(['cobblestone'] * len(coordinates)),
+                                                           [(i, i + 1, 0) for i in range(len(coordinates))]])
+        with mock.patch('vehicle_eco_balance.geo._match_cr_from_osm', match):
+            get_cr_from_osm(self.route, cache=cache)
+            cr, surface, edges = get_cr_from_osm(self.route, cache=cache, return_edges=True)
+            # only the new segment of a longer route is matched
+            longer = self.route + [(50.005 + i * 1e-4, 8.005) for i in range(1, 11)]
+            cr, surface = get_cr_from_osm(longer, cache=cache)
+        np.testing.assert_allclose(cr, 0.015)
+        self.assertEqual(list(surface), ['cobblestone'] * 60)
+        self.assertEqual(edges, [(i, i + 1, 0) for i in range(50)])
+        self.assertEqual(match.call_count, 2)
+        self.assertEqual(len(match.call_args[0][0]), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
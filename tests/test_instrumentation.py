@@ -0,0 +1,105 @@
+import types
+import logging
+import unittest
+import warnings
+import tracemalloc
+from unittest import mock
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, Metrics, RouteCache, add_callback, remove_callback, \
+    set_memory_tracking, log_event
+from vehicle_eco_balance.geo import calc_distance
+from vehicle_eco_balance.instrumentation import count, emit, stage, is_enabled
+
+try:
+    import dask.array as da
+except ImportError:
+    da = None
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(keep_events=True)
+        add_callback(self.metrics)
+
+    def tearDown(self):
+        remove_callback(self.metrics)
+        set_memory_tracking(False)
+
+    def test_disabled(self):
+        remove_callback(self.metrics)
+        self.assertFalse(is_enabled())
+        self.assertIs(stage('a'), stage('b'))
+        emit('event')
+        count('counter')
+        self.assertEqual(self.metrics.events, [])
+
+    def test_stage_and_counter(self):
+        with stage('outer', points=10):
+            count('items', 3)
+            count('items')
+        summary = self.metrics.summary()
+        self.assertEqual(summary['stages']['outer']['calls'], 1)
+        self.assertGreaterEqual(summary['stages']['outer']['duration'], 0.0)
+        self.assertEqual(summary['counters']['items'], 4)
+        self.assertEqual(self.metrics.events[-1]['points'], 10)
+
+    def test_memory_tracking(self):
+        set_memory_tracking(True)
+        with stage('allocation'):
+            values = np.ones(10 ** 6)
+        del values
+        self.assertGreater(self.metrics.stages['allocation']['peak_memory'], 8 * 10 ** 6)
+
+    def test_memory_tracking_without_reset_peak(self):
+        # tracemalloc of Python < 3.9 has no reset_peak
+        legacy = types.SimpleNamespace(is_tracing=tracemalloc.is_tracing, start=tracemalloc.start,
+                                       stop=tracemalloc.stop, get_traced_memory=tracemalloc.get_traced_memory,
+                                       clear_traces=tracemalloc.clear_traces)
+        set_memory_tracking(True)
+        with mock.patch('vehicle_eco_balance.instrumentation.tracemalloc', legacy):
+            with stage('allocation'):
+                values = np.ones(10 ** 6)
+            del values
+        self.assertGreater(self.metrics.stages['allocation']['peak_memory'], 8 * 10 ** 6)
+
+    def test_consumption_stage(self):
+        ConsumptionPhys('fuel').calculate_consumption(np.full(20, 50.0), np.zeros(20), np.zeros(20), Car())
+        self.assertEqual(self.metrics.events[-1]['name'], 'consumption_phys')
+        self.assertEqual(self.metrics.events[-1]['points'], 20)
+
+    def test_route_cache_counters(self):
+        cache = RouteCache()
+        route = [(50.0 + i * 1e-4, 8.0) for i in range(10)]
+        cache.lookup('cr', route)
+        cache.update('cr', route, [0.02] * 10)
+        cache.lookup('cr', route)
+        self.assertEqual(self.metrics.counters['cache_misses'], 10)
+        self.assertEqual(self.metrics.counters['cache_hits'], 10)
+
+    def test_log_event(self):
+        remove_callback(self.metrics)
+        add_callback(log_event)
+        try:
+            with self.assertLogs('vehicle_eco_balance', level='INFO') as logs:
+                count('items', 2)
+        finally:
+            remove_callback(log_event)
+        self.assertIn('name=items', logs.output[0])
+
+    def test_errors_are_logged_without_callback(self):
+        remove_callback(self.metrics)
+        with self.assertLogs('vehicle_eco_balance.geo', level=logging.ERROR):
+            calc_distance((50.0, 8.0), (50.1, 8.0), distance_type='unknown')
+
+    @unittest.skipIf(da is None, "dask is not installed")
+    def test_no_warning_for_dask(self):
+        speed = da.from_array(np.full(20, 50.0), chunks=10)
+        zeros = da.zeros(20, chunks=10)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            ConsumptionPhys('fuel').calculate_consumption(speed, zeros, zeros, Car())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import csv
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, ConsumptionEV, ConsumptionStat, Sensitivity, \
+    accumulate_consumption, segment_sum
+from vehicle_eco_balance.geo import calc_gradient_angle_smoothed
+from vehicle_eco_balance.kinematics import calc_acceleration
+
+wltc_directory = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'wltc')
+
+
+class TestFloat32(unittest.TestCase):
+
+    def setUp(self):
+        time = np.arange(1800.0)
+        self.speed = np.clip(60 + 50 * np.sin(time / 90) + 10 * np.sin(time / 7), 0, None)
+        self.dt = np.ones(len(time))
+        self.acceleration = calc_acceleration(self.speed, self.dt)
+        self.gradient_angle = 0.03 * np.sin(time / 200)
+
+    def _inputs(self, dtype):
+        return [self.speed.astype(dtype), self.acceleration.astype(dtype), self.gradient_angle.astype(dtype)]
+
+    def test_models(self):
+        for create, args in ((lambda dtype: ConsumptionPhys('fuel', dtype=dtype), [Car()]),
+                             (lambda dtype: ConsumptionPhys('energy', dtype=dtype), [Car()]),
+                             (lambda dtype: ConsumptionEV(dtype=dtype), [Car()]),
+                             (lambda dtype: ConsumptionStat(dtype=dtype), [])):
+            expected = create(None).calculate_consumption(*self._inputs(np.float64), *args)
+            consumption = create(np.float32).calculate_consumption(*self._inputs(np.float32), *args)
+            self.assertEqual(consumption.dtype, np.float32)
+            np.testing.assert_allclose(consumption, expected, rtol=1e-4, atol=1e-4)
+            self.assertAlmostEqual(accumulate_consumption(consumption, self.dt) /
+                                   accumulate_consumption(expected, self.dt), 1.0, places=5)
+
+    def test_sensitivity(self):
+        expected = Sensitivity().dQ_mass(*self._inputs(np.float64), 100.0)
+        sensitivity = Sensitivity(dtype=np.float32).dQ_mass(*self._inputs(np.float32), np.float32(100.0))
+        self.assertEqual(sensitivity.dtype, np.float32)
+        np.testing.assert_allclose(sensitivity, expected, rtol=1e-4, atol=1e-5)
+
+    def test_float64_sums(self):
+        values = np.full(10 ** 6, 0.1, dtype=np.float32)
+        total = accumulate_consumption(values, np.ones(len(values), dtype=np.float32))
+        self.assertEqual(np.asarray(total).dtype, np.float64)
+        self.assertAlmostEqual(total / (10 ** 6 * 0.1 / 3600), 1.0, places=6)
+
+        sums = segment_sum(values, [0, 500000, 10 ** 6])
+        self.assertEqual(sums.dtype, np.float64)
+        np.testing.assert_allclose(sums, 500000 * float(np.float32(0.1)), rtol=1e-12)
+
+    def test_kinematics_and_geo(self):
+        acceleration = calc_acceleration(self.speed, self.dt, dtype=np.float32)
+        self.assertEqual(acceleration.dtype, np.float32)
+        np.testing.assert_allclose(acceleration, self.acceleration, atol=1e-5)
+
+        distance = np.cumsum(self.speed / 3.6 * self.dt)
+        altitudes = 100 + 20 * np.sin(distance / 1000)
+        gradient_angle = calc_gradient_angle_smoothed(distance, altitudes, dtype=np.float32)
+        self.assertEqual(gradient_angle.dtype, np.float32)
+        np.testing.assert_allclose(gradient_angle, calc_gradient_angle_smoothed(distance, altitudes), atol=1e-6)
+
+
+
+class TestFloat32Wltc(unittest.TestCase):
+    """ Accuracy of float32 on the WLTC cycles as documented in the README """
+
+    def _read(self, name):
+        with open(os.path.join(wltc_directory, name), newline='') as file:
+            rows = list(csv.reader(file))
+        header, values = rows[0], np.array(rows[1:], dtype=float)
+        speed = values[:, header.index('Speed in km/h')]
+        dt = np.zeros(len(values))
+        dt[1:] = np.diff(values[:, header.index('Time in s')])
+        if 'Gradient angle in rad' in header:
+            gradient_angle = values[:, header.index('Gradient angle in rad')]
+        else:
+            gradient_angle = np.zeros(len(values))
+        return speed, dt, gradient_angle
+
+    def test_documented_bounds(self):
+        # model, arguments, relative error of the total, maximum error per sampling point
+        bounds = [(lambda dtype: ConsumptionPhys('fuel', dtype=dtype), [Car()], 1e-7, 9e-5),
+                  (lambda dtype: ConsumptionEV(dtype=dtype), [Car()], 2e-7, 4e-4),
+                  (lambda dtype: ConsumptionStat(dtype=dtype), [], 1e-7, 4e-5)]
+        for name in ('wltc_class3b.csv', 'wltc_class3b_constant_gradient_phase.csv'):
+            speed, dt, gradient_angle = self._read(name)
+            for create, args, total_error, point_error in bounds:
+                expected = create(None).calculate_consumption(speed, calc_acceleration(speed, dt), gradient_angle,
+                                                              *args)
+                consumption = create(np.float32).calculate_consumption(
+                    speed.astype(np.float32), calc_acceleration(speed, dt, dtype=np.float32),
+                    gradient_angle.astype(np.float32), *args)
+                self.assertEqual(consumption.dtype, np.float32)
+                total = accumulate_consumption(consumption, dt.astype(np.float32))
+                self.assertLess(abs(total / accumulate_consumption(expected, dt) - 1), total_error)
+                self.assertLess(np.max(np.abs(consumption - expected)), point_error)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import clean_track, drop_duplicates, find_outliers, median_filter, resample, to_seconds
+
+
+class TestPreprocessing(unittest.TestCase):
+
+    def test_to_seconds(self):
+        np.testing.assert_allclose(to_seconds(np.array([5.0, 6.5, 8.0])), [0.0, 1.5, 3.0])
+        np.testing.assert_allclose(to_seconds(np.array(['2020-07-10T07:14:51', '2020-07-10T07:15:01'])), [0.0, 10.0])
+
+    def test_drop_duplicates(self):
+        time, speed = drop_duplicates(np.array([2.0, 1.0, 2.0, 3.0]), np.array([20.0, 10.0, 21.0, 30.0]))
+        np.testing.assert_allclose(time, [1.0, 2.0, 3.0])
+        np.testing.assert_allclose(speed, [10.0, 20.0, 30.0])
+
+    def test_median_filter(self):
+        values = np.array([1.0, 1.0, 10.0, 1.0, 1.0])
+        np.testing.assert_allclose(median_filter(values, 3), np.ones(5))
+        with self.assertRaises(Exception):
+            median_filter(values, 4)
+
+    def test_find_outliers_speed(self):
+        time = np.arange(10.0)
+        speed = np.full(10, 50.0)
+        speed[3] = 400.0
+        speed[6] = -1.0
+        np.testing.assert_array_equal(np.nonzero(find_outliers(time, speed))[0], [3, 6])
+
+    def test_find_outliers_acceleration(self):
+        time = np.arange(10.0)
+        speed = np.full(10, 50.0)
+        speed[4] = 100.0  # 13.9 m/s² to and from the measurement
+        np.testing.assert_array_equal(np.nonzero(find_outliers(time, speed))[0], [4])
+
+    def test_find_outliers_teleport(self):
+        time = np.arange(10.0)
+        lats = np.full(10, 50.0)
+        lngs = 8.0 + np.arange(10) * 1e-4
+        lats[5] += 0.01  # ~1.1 km away
+        np.testing.assert_array_equal(np.nonzero(find_outliers(time, lats=lats, lngs=lngs))[0], [5])
+
+    def test_find_outliers_gradient(self):
+        time = np.arange(20.0)
+        speed = np.full(20, 36.0)  # 10 m per step
+        altitudes = np.arange(20) * 0.5
+        altitudes[10] += 10.0
+        outliers = find_outliers(time, speed, altitudes=altitudes, max_altitude_deviation=100.0)
+        np.testing.assert_array_equal(np.nonzero(outliers)[0], [10])
+
+        # altitude noise while standing is no gradient outlier
+        altitudes = np.random.default_rng(0).normal(0, 1, 20)
+        outliers = find_outliers(time, np.zeros(20), altitudes=altitudes, max_altitude_deviation=100.0)
+        self.assertFalse(np.any(outliers))
+
+    def test_resample(self):
+        time, speed = resample(np.array([0.0, 1.0, 3.0]), 1.0, np.array([0.0, 10.0, 30.0]))
+        np.testing.assert_allclose(time, [0.0, 1.0, 2.0, 3.0])
+        np.testing.assert_allclose(speed, [0.0, 10.0, 20.0, 30.0])
+
+    def test_clean_track(self):
+        time = np.array([0.0, 1.0, 1.0, 2.0, 3.5, 5.0])
+        speed = np.array([10.0, 11.0, 11.0, 900.0, 12.0, 13.0])
+        altitudes = np.array([100.0, 100.0, 100.0, 100.0, 100.0, 100.0])
+        track = clean_track(time, speed, altitudes=altitudes)
+        np.testing.assert_allclose(track['time'], np.arange(6.0))
+        self.assertTrue(np.all(track['speed'] < 20))
+        self.assertEqual(track['dt'][0], 0.0)
+        np.testing.assert_allclose(track['dt'][1:], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
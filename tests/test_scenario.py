@@ -0,0 +1,107 @@
+import copy
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, Scenario, ScenarioEngine, accumulate_consumption
+from vehicle_eco_balance.kinematics import calc_acceleration
+
+
+class TestScenarioEngine(unittest.TestCase):
+
+    def setUp(self):
+        time = np.arange(1200.0)
+        self.speed = np.clip(70 + 60 * np.sin(time / 120) + 5 * np.sin(time / 9), 0, None)
+        self.dt = np.ones(len(time))
+        self.dt[0] = 0.0
+        self.gradient_angle = 0.02 * np.sin(time / 150)
+        self.vehicle = Car()
+        self.model = ConsumptionPhys('fuel')
+
+    def _direct(self, speed, dt, gradient_angle, vehicle, cr=0.02):
+        consumption = self.model.calculate_consumption(speed, calc_acceleration(speed, dt), gradient_angle, vehicle,
+                                                       cr)
+        return accumulate_consumption(consumption, dt)
+
+    def test_baseline(self):
+        results = ScenarioEngine(self.speed, self.dt, self.gradient_angle, self.vehicle).evaluate([])
+        self.assertEqual(results['scenario'], ['baseline'])
+        self.assertAlmostEqual(results['total'][0], self._direct(self.speed, self.dt, self.gradient_angle,
+                                                                 self.vehicle))
+        self.assertAlmostEqual(results['distance'][0], np.sum(self.speed * self.dt) / 3600)
+
+    def test_vehicle_scenarios(self):
+        scenarios = [Scenario('lighter', mass_change=-200), Scenario('cw', vehicle={'cw': 0.25}),
+                     Scenario('cr', cr=0.012), Scenario('dem', gradient_angle=self.gradient_angle * 0.5)]
+        results = ScenarioEngine(self.speed, self.dt, self.gradient_angle, self.vehicle).evaluate(scenarios)
+
+        lighter = copy.copy(self.vehicle)
+        lighter.mass -= 200
+        low_drag = copy.copy(self.vehicle)
+        low_drag.cw = 0.25
+        expected = [self._direct(self.speed, self.dt, self.gradient_angle, lighter),
+                    self._direct(self.speed, self.dt, self.gradient_angle, low_drag),
+                    self._direct(self.speed, self.dt, self.gradient_angle, self.vehicle, cr=0.012),
+                    self._direct(self.speed, self.dt, self.gradient_angle * 0.5, self.vehicle)]
+        np.testing.assert_allclose(results['total'][1:], expected, rtol=1e-12)
+        np.testing.assert_allclose(results['delta'], results['total'] - results['total'][0])
+        self.assertLess(results['delta_percent'][1], 0)
+
+    def test_speed_limit(self):
+        results = ScenarioEngine(self.speed, self.dt, self.gradient_angle, self.vehicle).evaluate(
+            [Scenario('100 km/h', speed_limit=100)])
+        # the route is kept, the capped intervals take longer
+        self.assertAlmostEqual(results['distance'][1], results['distance'][0], places=10)
+
+        capped = np.minimum(self.speed, 100)
+        dt = np.where(self.speed > 100, self.dt * self.speed / capped, self.dt)
+        self.assertAlmostEqual(np.sum(capped * dt), np.sum(self.speed * self.dt))
+        self.assertAlmostEqual(results['total'][1], self._direct(capped, dt, self.gradient_angle, self.vehicle))
+        self.assertLess(results['consumption_per100km'][1], results['consumption_per100km'][0])
+
+    def test_speed_limit_per_point(self):
+        limit = np.full(len(self.speed), np.inf)
+        limit[300:600] = 50
+        results = ScenarioEngine(self.speed, self.dt, self.gradient_angle, self.vehicle).evaluate(
+            [Scenario('corridor', speed_limit=limit)])
+        self.assertAlmostEqual(results['distance'][1], results['distance'][0], places=10)
+
+    def test_offsets(self):
+        offsets = np.array([0, 400, 1200])
+        dt = self.dt.copy()
+        dt[offsets[:-1]] = 0.0
+        scenarios = [Scenario('lighter', mass_change=-200), Scenario('100 km/h', speed_limit=100)]
+        results = ScenarioEngine(self.speed, dt, self.gradient_angle, self.vehicle,
+                                 offsets=offsets).evaluate(scenarios, keep_consumption=True)
+        self.assertEqual(results['total'].shape, (3, 2))
+        self.assertEqual(results['consumption'].shape, (3, 1200))
+        for j, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            single = ScenarioEngine(self.speed[start:end], dt[start:end], self.gradient_angle[start:end],
+                                    self.vehicle).evaluate(scenarios)
+            np.testing.assert_allclose(results['total'][:, j], single['total'], rtol=1e-9)
+            np.testing.assert_allclose(results['distance'][:, j], single['distance'], rtol=1e-12)
+
+    def test_batches(self):
+        scenarios = [Scenario(str(mass), mass_change=mass) for mass in range(-300, 300, 20)]
+        engine = ScenarioEngine(self.speed, self.dt, self.gradient_angle, self.vehicle)
+        expected = engine.evaluate(scenarios, keep_consumption=True)
+        engine.max_elements = 5000
+        results = engine.evaluate(scenarios, keep_consumption=True)
+        np.testing.assert_allclose(results['total'], expected['total'])
+        np.testing.assert_allclose(results['consumption'], expected['consumption'])
+
+    def test_invalid_speed_limit(self):
+        limit = np.full(len(self.speed), np.inf)
+        limit[10] = 0.0
+        for speed_limit in (0, -50, limit, np.nan):
+            with self.assertRaises(Exception):
+                Scenario('stop', speed_limit=speed_limit)
+
+    def test_invalid_scenarios(self):
+        engine = ScenarioEngine(self.speed, self.dt, self.gradient_angle, self.vehicle)
+        with self.assertRaises(Exception):
+            engine.evaluate([Scenario('short', gradient_angle=self.gradient_angle[:10])])
+        with self.assertRaises(Exception):
+            engine.evaluate([Scenario('electric', vehicle={'fuel_type': 'electric'})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import queue
+import threading
+import unittest
+import urllib.error
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, ConsumptionEV
+from vehicle_eco_balance.service import ConsumptionService, request_consumption, pyarrow
+
+
+class TestConsumptionService(unittest.TestCase):
+
+    def setUp(self):
+        self.service = ConsumptionService(port=0, workers=2)
+        self.service.start()
+        self.url = 'http://{}:{}'.format(*self.service.address)
+        self.speed = np.linspace(0, 120, 300)
+        self.acceleration = np.sin(np.linspace(0, 20, 300))
+        self.gradient_angle = np.full(300, 0.02)
+        self.dt = np.ones(300)
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def _check(self, payload):
+        parameters = {'vehicle': {'mass': 1600, 'fuel_type': 'diesel'}, 'cr': 0.015}
+        result = request_consumption(self.url, parameters, self.speed, self.acceleration, self.gradient_angle,
+                                     dt=self.dt, payload=payload)
+        expected = ConsumptionPhys('fuel').calculate_consumption(self.speed, self.acceleration, self.gradient_angle,
+                                                                 Car(mass=1600, fuel_type='diesel'), cr=0.015)
+        np.testing.assert_allclose(result['consumption'], expected)
+        np.testing.assert_allclose(result['total'], np.sum(expected) / 3600)
+
+    def test_json(self):
+        self._check('json')
+
+    def test_npz(self):
+        self._check('npz')
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_arrow(self):
+        self._check('arrow')
+
+    def test_concurrent_models(self):
+        requests = [({'model': 'phys'}, ConsumptionPhys('fuel')), ({'model': 'ev'}, ConsumptionEV())] * 8
+        results = [None] * len(requests)
+
+        def send(i):
+            results[i] = request_consumption(self.url, requests[i][0], self.speed[i:], self.acceleration[i:],
+                                             self.gradient_angle[i:])
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(len(requests))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i, (parameters, model) in enumerate(requests):
+            expected = model.calculate_consumption(self.speed[i:], self.acceleration[i:], self.gradient_angle[i:],
+                                                   Car())
+            np.testing.assert_allclose(results[i]['consumption'], expected)
+
+    def test_invalid_request(self):
+        with self.assertRaises(Exception):
+            self.service.submit({}, self.speed, self.acceleration, np.full(300, 2.0))
+        with self.assertRaises(Exception):
+            self.service.submit({}, self.speed, self.acceleration, self.gradient_angle, cr=np.ones(3))
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            request_consumption(self.url, {}, self.speed, self.acceleration[:10], self.gradient_angle)
+        self.assertEqual(context.exception.code, 400)
+
+
+    def test_invalid_parameters(self):
+        for parameters in ({'model': 'unknown'}, {'consumption_type': 'diesel'}, {'vehicle': {'fuel_type': 'hydrogen'}},
+                           {'vehicle': {'weight': 1500}}, {'model_parameters': {'gravity': 9.81}}):
+            with self.assertRaises(Exception):
+                self.service.submit(parameters, self.speed, self.acceleration, self.gradient_angle)
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                request_consumption(self.url, parameters, self.speed, self.acceleration, self.gradient_angle)
+            self.assertEqual(context.exception.code, 400)
+        self.assertEqual(self.service.requests.qsize(), 0)
+
+class TestBackpressure(unittest.TestCase):
+
+    def test_queue_full(self):
+        service = ConsumptionService(port=0, workers=1, max_queue=2)
+        service.start()
+        release = threading.Event()
+        evaluate = service._evaluate
+
+        def slow_evaluate(requests):
+            release.wait()
+            evaluate(requests)
+
+        service._evaluate = slow_evaluate
+        speed = np.linspace(0, 100, 10)
+        zeros = np.zeros(10)
+        futures = []
+        try:
+            # 2 batches in flight for 1 worker and 2 queued requests, further requests are rejected
+            with self.assertRaises(queue.Full):
+                for _ in range(20):
+                    futures.append(service.submit({}, speed, zeros, zeros))
+                    threading.Event().wait(0.02)
+            self.assertLessEqual(len(futures), 5)
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                request_consumption('http://{}:{}'.format(*service.address), {}, speed, zeros, zeros)
+            self.assertEqual(context.exception.code, 503)
+        finally:
+            release.set()
+        for future in futures:
+            self.assertEqual(len(future.result(timeout=10)), 10)
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
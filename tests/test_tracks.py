@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, TrackCollection, accumulate_consumption, calc_acceleration, \
+    calc_distance_array, calc_gradient_angle_array, calc_gradient_angle_smoothed, calc_cumulative_distance
+
+
+def random_tracks(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for n in lengths:
+        tracks.append({
+            'speed': np.clip(50 + np.cumsum(rng.normal(0, 2, n)), 0, None),
+            'dt': np.concatenate(([0.0], rng.uniform(0.5, 1.5, n - 1))) if n > 0 else np.zeros(0),
+            'lats': 50.0 + np.cumsum(rng.uniform(0, 1e-4, n)),
+            'lngs': 8.0 + np.cumsum(rng.uniform(0, 1e-4, n)),
+            'altitudes': 100 + np.cumsum(rng.normal(0, 0.3, n))
+        })
+    return tracks
+
+
+class TestTrackCollection(unittest.TestCase):
+
+    def setUp(self):
+        self.tracks = random_tracks([120, 0, 300, 1, 80])
+        self.collection = TrackCollection.from_tracks(self.tracks)
+
+    def test_from_tracks(self):
+        self.assertEqual(len(self.collection), 5)
+        np.testing.assert_array_equal(self.collection.lengths, [120, 0, 300, 1, 80])
+        for track, split in zip(self.tracks, self.collection.to_tracks()):
+            np.testing.assert_array_equal(track['speed'], split['speed'])
+
+    def test_invalid(self):
+        with self.assertRaises(Exception):
+            TrackCollection({'speed': np.zeros(10)}, [0, 5, 11])
+        with self.assertRaises(Exception):
+            TrackCollection({'speed': np.zeros(10)}, [0, 6, 5, 10])
+        with self.assertRaises(Exception):
+            self.collection['speed'] = np.zeros(3)
+
+    def test_kernels_per_track(self):
+        self.collection.calc_acceleration()
+        self.collection.calc_distance()
+        self.collection.calc_gradient_angle()
+        for track, split in zip(self.tracks, self.collection.to_tracks()):
+            if len(track['speed']) == 0:
+                continue
+            np.testing.assert_allclose(split['acceleration'], calc_acceleration(track['speed'], track['dt']))
+            np.testing.assert_allclose(split['distance'], calc_distance_array(track['lats'], track['lngs']))
+            np.testing.assert_allclose(split['gradient_angle'],
+                                       calc_gradient_angle_array(track['lats'], track['lngs'], track['altitudes']))
+
+    def test_smoothed_gradient_per_track(self):
+        gradient_angle = self.collection.calc_gradient_angle(window=50.0)
+        for i, track in enumerate(self.tracks):
+            if len(track['speed']) == 0:
+                continue
+            start = self.collection.offsets[i]
+            distance = calc_cumulative_distance(track['lats'], track['lngs'])
+            np.testing.assert_allclose(gradient_angle[start:start + len(track['speed'])],
+                                       calc_gradient_angle_smoothed(distance, track['altitudes'], 50.0), atol=1e-9)
+
+    def test_consumption_per_track(self):
+        acceleration = self.collection.calc_acceleration()
+        consumption = ConsumptionPhys('fuel').calculate_consumption(self.collection['speed'], acceleration,
+                                                                    np.zeros(len(acceleration)), Car())
+        totals = self.collection.accumulate_consumption(consumption)
+        distances = self.collection.total_distance()
+        for i, track in enumerate(self.tracks):
+            single = consumption[self.collection.offsets[i]:self.collection.offsets[i + 1]]
+            self.assertAlmostEqual(totals[i], accumulate_consumption(single, track['dt']))
+            self.assertAlmostEqual(distances[i], np.sum(track['speed'] * track['dt']) / 3600)
+        per100km = self.collection.consumption_per100km(consumption)
+        self.assertTrue(np.isnan(per100km[1]))
+        self.assertAlmostEqual(per100km[0], 100 * totals[0] / distances[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
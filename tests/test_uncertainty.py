@@ -0,0 +1,83 @@
+import os
+import csv
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, accumulate_consumption
+from vehicle_eco_balance.kinematics import calc_acceleration
+from vehicle_eco_balance.uncertainty import Uncertainty
+
+wltc_path = os.path.join(os.path.dirname(__file__), os.pardir, 'data', 'wltc', 'wltc_class3b.csv')
+
+
+class TestUncertainty(unittest.TestCase):
+
+    def setUp(self):
+        with open(wltc_path, newline='') as file:
+            rows = np.array(list(csv.reader(file))[1:], dtype=float)
+        self.speed = rows[:, 1]
+        self.dt = np.zeros(len(rows))
+        self.dt[1:] = np.diff(rows[:, 0])
+        self.distance = np.cumsum(self.speed * self.dt / 3.6)
+        self.altitudes = 100 + 30 * np.sin(self.distance / 800)
+        self.vehicle = Car()
+
+    def _compare(self, uncertainty, rtol, **kwargs):
+        analytic = uncertainty.propagate(self.speed, self.dt, self.vehicle, altitudes=self.altitudes, **kwargs)
+        simulated = uncertainty.monte_carlo(self.speed, self.dt, self.vehicle, altitudes=self.altitudes,
+                                            n_samples=1000, seed=0, **kwargs)
+        np.testing.assert_allclose(analytic['total'], simulated['total'])
+        np.testing.assert_allclose(analytic['std'], simulated['std'], rtol=rtol)
+        return analytic, simulated
+
+    def test_total(self):
+        results = Uncertainty().propagate(self.speed, self.dt, self.vehicle)
+        consumption = ConsumptionPhys('fuel').calculate_consumption(self.speed, calc_acceleration(self.speed, self.dt),
+                                                                    np.zeros(len(self.speed)), self.vehicle)
+        np.testing.assert_allclose(results['total'], accumulate_consumption(consumption, self.dt))
+        np.testing.assert_allclose(results['std'], 0.0)
+
+    def test_vehicle_parameters(self):
+        self._compare(Uncertainty(mass_std=100.0), 0.1)
+        self._compare(Uncertainty(cw_std=0.02), 0.1)
+
+    def test_speed_bias(self):
+        self._compare(Uncertainty(speed_bias=1.0), 0.1)
+        self._compare(Uncertainty(speed_scale=0.02), 0.1)
+
+    def test_small_altitude_error(self):
+        # the gradient between consecutive points is linear in the altitude only for errors small to the steps
+        self._compare(Uncertainty(altitude_std=0.001), 0.15, window=None)
+
+    def test_smoothed_altitude_error(self):
+        self._compare(Uncertainty(altitude_std=0.5), 0.15, window=100.0)
+
+    def test_interval(self):
+        results = Uncertainty(mass_std=100.0, confidence=0.9).propagate(self.speed, self.dt, self.vehicle)
+        np.testing.assert_allclose(results['upper'] - results['total'], 1.6448536 * results['std'], rtol=1e-6)
+        np.testing.assert_allclose(results['variance']['mass'], results['std'] ** 2)
+
+    def test_fleet(self):
+        speed = np.concatenate([self.speed, self.speed])
+        dt = np.concatenate([self.dt, self.dt])
+        offsets = np.array([0, len(self.speed), len(speed)])
+        single = Uncertainty(mass_std=100.0, speed_std=0.5).propagate(self.speed, self.dt, self.vehicle)
+        shared = Uncertainty(mass_std=100.0, speed_std=0.5).propagate(speed, dt, self.vehicle, offsets=offsets)
+        independent = Uncertainty(mass_std=100.0, speed_std=0.5, shared=False).propagate(speed, dt, self.vehicle,
+                                                                                         offsets=offsets)
+        np.testing.assert_allclose(shared['std'], single['std'][0])
+        np.testing.assert_allclose(shared['fleet_variance']['mass'], 4 * single['variance']['mass'][0])
+        np.testing.assert_allclose(independent['fleet_variance']['mass'], 2 * single['variance']['mass'][0])
+        np.testing.assert_allclose(shared['fleet_variance']['speed'], 2 * single['variance']['speed'][0])
+
+    def test_monte_carlo_batches(self):
+        uncertainty = Uncertainty(speed_std=1.0, mass_std=100.0)
+        expected = uncertainty.monte_carlo(self.speed, self.dt, self.vehicle, n_samples=50, seed=1)
+        results = uncertainty.monte_carlo(self.speed, self.dt, self.vehicle, n_samples=50, seed=1,
+                                          max_elements=10 * len(self.speed))
+        self.assertEqual(results['samples'].shape, (50, 1))
+        self.assertGreater(results['std'][0], 0.0)
+        np.testing.assert_allclose(results['total'], expected['total'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import error_mean, error_measure, error_100km, error_batch, segment_sum, \
+    segment_weighted_percentile, segment_starts, smoothing_windows, window_sum
+
+
+def weighted_percentile_loop(values, weights, q):
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(weights[order])
+    return values[order][np.searchsorted(cumulative, q / 100 * cumulative[-1], side='left')]
+
+
+class TestSegments(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.offsets = np.array([0, 5, 5, 40, 41, 100])
+        self.values = rng.normal(0, 1, 100)
+        self.weights = rng.uniform(0.5, 2, 100)
+
+    def test_segment_sum(self):
+        sums = segment_sum(self.values, self.offsets)
+        expected = [np.sum(self.values[start:end]) for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+        np.testing.assert_allclose(sums, expected)
+        self.assertEqual(sums[1], 0.0)
+
+    def test_segment_sum_2d(self):
+        matrix = np.stack([self.values, 2 * self.values, self.weights])
+        sums = segment_sum(matrix, self.offsets)
+        self.assertEqual(sums.shape, (3, 5))
+        for row, values in zip(sums, matrix):
+            np.testing.assert_allclose(row, segment_sum(values, self.offsets))
+
+    def test_smoothing_windows(self):
+        np.testing.assert_array_equal(segment_starts(self.offsets), [0, 0, 5, 40, 41])
+        distance = np.cumsum(np.full(100, 10.0))
+        lower, upper, local = smoothing_windows(distance, 45.0, self.offsets)
+        sums = window_sum(self.values, lower, upper)
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            np.testing.assert_allclose(local[start:end], distance[start:end] - distance[start] if end > start else [])
+            for i in range(start, end):
+                window = (np.abs(distance[start:end] - distance[i]) <= 22.5)
+                self.assertAlmostEqual(sums[i], np.sum(self.values[start:end][window]))
+
+    def test_segment_weighted_percentile(self):
+        for q in (0, 25, 50, 90, 100):
+            percentiles = segment_weighted_percentile(self.values, self.weights, self.offsets, q)
+            self.assertTrue(np.isnan(percentiles[1]))
+            for i, (start, end) in enumerate(zip(self.offsets[:-1], self.offsets[1:])):
+                if end > start:
+                    self.assertEqual(percentiles[i],
+                                     weighted_percentile_loop(self.values[start:end], self.weights[start:end], q))
+
+
+class TestErrorBatch(unittest.TestCase):
+
+    def test_against_single_tracks(self):
+        rng = np.random.default_rng(1)
+        offsets = np.array([0, 300, 700, 1000])
+        consumption1 = rng.uniform(1, 10, 1000)
+        consumption2 = consumption1 * rng.uniform(0.8, 1.2, 1000)
+        dt = rng.uniform(0.5, 1.5, 1000)
+        speed = rng.uniform(10, 100, 1000)
+
+        table = error_batch(consumption1, consumption2, dt, speed, offsets, percentiles=[50, 95])
+        np.testing.assert_array_equal(table['n_points'], [300, 400, 300])
+        for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            track = slice(start, end)
+            args = (consumption1[track], consumption2[track], dt[track])
+            self.assertAlmostEqual(table['error_mean'][i], error_mean(*args))
+            self.assertAlmostEqual(table['error_measure'][i], error_measure(*args))
+            self.assertAlmostEqual(table['error_100km'][i], error_100km(*args, speed[track]))
+            self.assertAlmostEqual(table['error_p50'][i],
+                                   weighted_percentile_loop(np.abs(args[0] - args[1]), dt[track], 50))
+            self.assertAlmostEqual(table['distance'][i], np.sum(speed[track] * dt[track]) / 3600)
+
+    def test_axis(self):
+        rng = np.random.default_rng(2)
+        consumption1, consumption2 = rng.uniform(1, 10, (2, 4, 50))
+        dt = np.ones(50)
+        errors = error_measure(consumption1, consumption2, dt, axis=-1)
+        for row in range(4):
+            self.assertAlmostEqual(errors[row], error_measure(consumption1[row], consumption2[row], dt))
+
+    def test_length_mismatch(self):
+        with self.assertRaises(Exception):
+            error_batch(np.zeros(10), np.zeros(10), np.ones(10), np.ones(10), [0, 5, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from vehicle_eco_balance import Car, ConsumptionPhys, ConsumptionStat, accumulate_consumption
+from vehicle_eco_balance.validation import as_float_array, validate_arrays, check_gradient_angle
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+class TestValidation(unittest.TestCase):
+
+    def test_as_float_array(self):
+        values = np.arange(5.0)
+        self.assertIs(as_float_array(values), values)
+        np.testing.assert_array_equal(as_float_array([1, 2]), [1.0, 2.0])
+        self.assertEqual(as_float_array(np.arange(3)).dtype, np.float64)
+        self.assertTrue(as_float_array(values[::2]).flags['C_CONTIGUOUS'])
+        self.assertEqual(as_float_array(0.5), 0.5)
+
+    @unittest.skipIf(pd is None, 'pandas is not installed')
+    def test_pandas_series(self):
+        values = as_float_array(pd.Series([1, 2, 3]))
+        self.assertIsInstance(values, np.ndarray)
+        self.assertEqual(values.dtype, np.float64)
+
+    def test_validate_arrays(self):
+        speed, acceleration = validate_arrays(['speed', 'acceleration'], [1, 2, 3], np.zeros(3))
+        self.assertEqual(speed.dtype, np.float64)
+        with self.assertRaises(Exception):
+            validate_arrays(['speed', 'acceleration'], np.zeros(3), np.zeros(4))
+
+    def test_check_gradient_angle(self):
+        check_gradient_angle(np.array([-0.1, 0.0, 0.1, np.nan]))
+        with self.assertRaises(Exception):
+            check_gradient_angle(np.array([0.0, 5.0]))  # degrees
+
+    def test_models_reject_invalid_inputs(self):
+        with self.assertRaises(Exception):
+            ConsumptionPhys('fuel').calculate_consumption(np.zeros(3), np.zeros(2), np.zeros(3), Car())
+        with self.assertRaises(Exception):
+            ConsumptionStat().calculate_consumption(np.zeros(3), np.zeros(3), np.full(3, 10.0))
+
+    def test_trusted(self):
+        speed = np.linspace(0, 120, 50)
+        acceleration = np.full(50, 0.3)
+        gradient_angle = np.full(50, 0.02)
+        expected = ConsumptionPhys('fuel').calculate_consumption(list(speed), list(acceleration),
+                                                                 list(gradient_angle), Car())
+        result = ConsumptionPhys('fuel').calculate_consumption(speed, acceleration, gradient_angle, Car(),
+                                                               trusted=True)
+        np.testing.assert_allclose(result, expected)
+
+    def test_nan(self):
+        speed = np.array([50.0, np.nan, 60.0, 70.0])
+        zeros = np.zeros(4)
+        consumption = ConsumptionPhys('fuel').calculate_consumption(speed, zeros, zeros, Car())
+        np.testing.assert_array_equal(np.isnan(consumption), [False, True, False, False])
+
+        dt = np.array([1.0, 1.0, np.nan, 1.0])
+        expected = (consumption[0] + consumption[3]) / 3600
+        self.assertAlmostEqual(accumulate_consumption(consumption, dt), expected)
+        self.assertTrue(np.isnan(accumulate_consumption(consumption, dt, skipna=False)))
+
+
+if __name__ == '__main__':
+    unittest.main()
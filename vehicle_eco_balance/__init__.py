@@ -1,9 +1,19 @@
-from .consumption import ConsumptionPhys, ConsumptionStat, accumulate_consumption, consumption_per100km
-from .geo import calc_distance, calc_gradient_angle, get_cr_from_osm, ElevationAPI
-from .utils import get_interval_time, calc_efficiency, error_mean, error_measure, error_100km
+__version__ = "0.0.1"
+
+from .consumption import ConsumptionPhys, ConsumptionStat, ConsumptionEV, accumulate_consumption, consumption_per100km, \
+    calc_state_of_charge, calc_remaining_range
+from .geo import calc_distance, calc_gradient_angle, get_cr_from_osm, ElevationAPI, calc_distance_array, \
+    calc_gradient_angle_array, calc_cumulative_distance, calc_gradient_angle_smoothed, RouteCache
+from .utils import get_interval_time, calc_efficiency, error_mean, error_measure, error_100km, error_batch, \
+    segment_sum, segment_weighted_percentile, segment_starts, smoothing_windows, window_sum
 from .kinematics import calc_acceleration
 from .vehicle import Car
 from .sensitivity import Sensitivity
-
-
-
+from .preprocessing import clean_track, drop_duplicates, find_outliers, median_filter, resample, to_seconds
+from .emissions import get_emission_factor, calc_emissions, accumulate_emissions, grid_mixes
+from .instrumentation import Metrics, add_callback, remove_callback, set_memory_tracking, log_event
+from .calibration import Calibration, calibrate_fleet
+from .tracks import TrackCollection
+from .cache import ResultCache
+from .scenario import Scenario, ScenarioEngine
+from .uncertainty import Uncertainty
@@ -0,0 +1,32 @@
+import numpy as np
+
+
+def get_namespace(*arrays):
+    """ Get the array API namespace of the given arrays
+
+    NumPy arrays, lists and scalars use NumPy. Other arrays (e.g. Dask arrays or arrays of any array API compatible
+    library) use their namespace as returned by array_api_compat, which has to be installed for this purpose.
+
+    Parameters
+    ----------
+    arrays: numpy arrays, scalars or arrays of an array API compatible library
+        arrays used in a calculation
+
+    Returns
+    -------
+    namespace: module
+        array API namespace (numpy by default)
+    """
+
+    arrays = [array for array in arrays if array is not None and not isinstance(array, (int, float, list, tuple,
+                                                                                         np.ndarray, np.generic))]
+    if len(arrays) == 0:
+        return np
+
+    try:
+        from array_api_compat import array_namespace
+    except ImportError:
+        raise ImportError("array_api_compat is needed for arrays other than numpy arrays "
+                          "(pip install array-api-compat)")
+
+    return array_namespace(*arrays)
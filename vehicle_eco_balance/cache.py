@@ -0,0 +1,348 @@
+import os
+import shutil
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+from vehicle_eco_balance.instrumentation import count
+
+# Attributes of the consumption models holding results (not parameters)
+_result_attributes = ('consumption', 'power', 'driving_resistance', 'aerodynamic_drag', 'rolling_resistance',
+                      'climbing_resistance', 'inertial_resistance', 'efficiency')
+
+
+class ResultCache:
+    """
+    Content-addressed disk cache for results of consumption runs and geo enrichment
+
+    Results are stored under a key which is a hash of the input arrays (content, dtype and shape), the parameters
+    (e.g. vehicle and model attributes) and the package version, i.e. a changed input, parameter or package version
+    leads to a new entry. Result arrays are stored as .npy files and loaded memory-mapped (copy-on-write, i.e. writable
+    like calculated results, but changes are not written back). Sizes and the order of access of the entries are kept
+    in an append-only index file, so opening a cache reads one file instead of the whole directory. If the total size
+    of the cache exceeds max_bytes, the least recently used entries are removed when a result is stored.
+
+    Example:
+        cache = ResultCache('~/.cache/vehicle_eco_balance')
+        consumption = cache.calculate_consumption(ConsumptionPhys('fuel'), speed, acceleration, gradient_angle, Car())
+        cr, surface = cache.memoize(get_cr_from_osm, coordinates)
+        elevation = cache.memoize(api.get_elevation, coordinates, cache_key=api.base_url)
+
+    Parameters
+    ----------
+    directory: str
+        cache directory (created if it does not exist)
+    max_bytes: int
+        maximum size of the cache in bytes (default 2**30, i.e. 1 GiB)
+
+    Attributes
+    ----------
+    hits: int
+        number of results loaded from the cache
+    misses: int
+        number of results calculated
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Size of each entry, ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._size = 0
+        self._index_lines = 0
+        if os.path.exists(self._index_path()):
+            self._read_index()
+        else:
+            # cache directory without index (e.g. new or written by an older version)
+            self._scan()
+            self._write_index()
+
+    def key(self, *args, **kwargs):
+        """ Calculate the key of arbitrary inputs
+
+        Arrays are hashed by content, dtype and shape, classes and dtypes by their qualified name, objects (e.g. class
+        Car) by their attributes and all other values by their representation. The package version is part of every
+        key.
+
+        Returns
+        -------
+        key: str
+            hexadecimal hash
+        """
+
+        from vehicle_eco_balance import __version__
+
+        hash_ = hashlib.blake2b(digest_size=20)
+        hash_.update(__version__.encode())
+        for value in args:
+            self._update_hash(hash_, value)
+        for name in sorted(kwargs):
+            hash_.update(name.encode())
+            self._update_hash(hash_, kwargs[name])
+
+        return hash_.hexdigest()
+
+    def get(self, key):
+        """ Load a cached result
+
+        Parameters
+        ----------
+        key: str
+            key of the result
+
+        Returns
+        -------
+        result: dictionary of numpy arrays or None
+            memory-mapped (copy-on-write) result arrays (object arrays are loaded into memory), None if the key is not
+            cached
+        """
+
+        path = self._path(key)
+        if not os.path.isdir(path):
+            if key in self._entries:
+                # removed by another process
+                self._size -= self._entries.pop(key)
+            self.misses += 1
+            count('cache_misses', cache='result')
+            return None
+
+        result = {}
+        for file_name in os.listdir(path):
+            name = file_name[:-len('.npy')]
+            file_path = os.path.join(path, file_name)
+            try:
+                result[name] = np.load(file_path, mmap_mode='c')
+            except ValueError:
+                # object arrays (e.g. surface names) can not be memory-mapped
+                result[name] = np.load(file_path, allow_pickle=True)
+
+        if key not in self._entries:
+            # stored by another process
+            self._entries[key] = self._entry_size(path)
+            self._size += self._entries[key]
+        self._entries.move_to_end(key)
+        self._append_index('* ' + key)
+        self.hits += 1
+        count('cache_hits', cache='result')
+
+        return result
+
+    def put(self, key, result):
+        """ Store a result
+
+        Parameters
+        ----------
+        key: str
+            key of the result
+        result: dictionary of numpy arrays
+            result arrays
+        """
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write into a temporary directory first, so that readers never see incomplete entries
+        temporary = tempfile.mkdtemp(dir=self.directory)
+        size = 0
+        for name, values in result.items():
+            values = np.asarray(values)
+            file_path = os.path.join(temporary, name + '.npy')
+            np.save(file_path, values, allow_pickle=values.dtype.hasobject)
+            size += os.path.getsize(file_path)
+        try:
+            os.replace(temporary, path)
+        except OSError:
+            # stored concurrently by another process
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+
+        self._entries[key] = size
+        self._size += size
+        self._append_index('+ ' + key + ' ' + str(size))
+        self._evict()
+
+    def memoize(self, func, *args, cache_key=None, **kwargs):
+        """ Call a function or return its cached result
+
+        The key consists of the module and qualified name of the function, the arguments and cache_key. The object of a
+        method is not part of the key (its state may change between calls, e.g. request parameters), parameters of the
+        object which change the result have to be passed as cache_key.
+
+        Parameters
+        ----------
+        func: callable
+            function returning a numpy array or a list/tuple of numpy arrays (e.g. get_cr_from_osm)
+        args, kwargs:
+            arguments of the function (part of the key)
+        cache_key: any
+            additional values of the key, e.g. the base URL of an ElevationAPI (default None)
+
+        Returns
+        -------
+        result: numpy array or list of numpy arrays
+            (cached) result of the function
+        """
+
+        key = self.key(func.__module__, func.__qualname__, cache_key, *args, **kwargs)
+        result = self.get(key)
+        if result is not None:
+            if '0' in result:
+                return [result[str(i)] for i in range(len(result))]
+            return result['result']
+
+        values = func(*args, **kwargs)
+        if isinstance(values, (list, tuple)):
+            self.put(key, {str(i): value for i, value in enumerate(values)})
+        else:
+            self.put(key, {'result': values})
+
+        return values
+
+    def calculate_consumption(self, model, *args, **kwargs):
+        """ Calculate the consumption with a consumption model or load it from the cache
+
+        The result attributes of the model (consumption, power, efficiency, ...) are set as if the model was evaluated.
+
+        Parameters
+        ----------
+        model: class ConsumptionPhys, ConsumptionStat or ConsumptionEV
+            consumption model (its parameters are part of the key)
+        args, kwargs:
+            arguments of model.calculate_consumption (part of the key)
+
+        Returns
+        -------
+        consumption: numpy array
+            instantaneous consumption for each sampling point
+        """
+
+        key = self.key(type(model).__name__, self._parameters(model), *args, **kwargs)
+        result = self.get(key)
+        if result is not None:
+            for name, values in result.items():
+                setattr(model, name, values)
+            return model.consumption
+
+        model.calculate_consumption(*args, **kwargs)
+        self.put(key, {name: getattr(model, name) for name in _result_attributes
+                       if isinstance(getattr(model, name, None), np.ndarray)})
+
+        return model.consumption
+
+    def clear(self):
+        """ Remove all entries """
+        for key in list(self._entries):
+            self._remove(key)
+        self._size = 0
+        self._write_index()
+
+    def _evict(self):
+        """ Remove least recently used entries until the cache is smaller than max_bytes """
+        while self._size > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key)
+        shutil.rmtree(self._path(key), ignore_errors=True)
+        self._append_index('- ' + key)
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index')
+
+    def _read_index(self):
+        """ Replay the index: '+ key size' (stored), '* key' (accessed) and '- key' (removed) """
+        with open(self._index_path()) as file:
+            for line in file:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue
+                operation, key = fields[0], fields[1]
+                if operation == '+' and len(fields) == 3:
+                    self._entries[key] = int(fields[2])
+                    self._entries.move_to_end(key)
+                elif operation == '*' and key in self._entries:
+                    self._entries.move_to_end(key)
+                elif operation == '-':
+                    self._entries.pop(key, None)
+                self._index_lines += 1
+        self._size = sum(self._entries.values())
+
+    def _write_index(self):
+        """ Compact the index to one line per entry """
+        temporary = self._index_path() + '.' + str(os.getpid())
+        with open(temporary, 'w') as file:
+            file.writelines('+ {} {}\n'.format(key, size) for key, size in self._entries.items())
+        os.replace(temporary, self._index_path())
+        self._index_lines = len(self._entries)
+
+    def _append_index(self, line):
+        # single appended lines of concurrent processes do not interleave
+        with open(self._index_path(), 'a') as file:
+            file.write(line + '\n')
+        self._index_lines += 1
+        if self._index_lines > 2 * len(self._entries) + 1000:
+            self._write_index()
+
+    def _scan(self):
+        """ Read the entries from the cache directory, ordered by their modification time """
+        entries = []
+        for prefix in os.listdir(self.directory):
+            prefix_path = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_path):
+                continue
+            for key in os.listdir(prefix_path):
+                path = os.path.join(prefix_path, key)
+                entries.append([os.path.getmtime(path), key, self._entry_size(path)])
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+        self._size = sum(self._entries.values())
+
+    def _entry_size(self, path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _parameters(self, obj):
+        return {name: value for name, value in vars(obj).items() if name not in _result_attributes}
+
+    def _update_hash(self, hash_, value):
+        if hasattr(value, 'to_numpy'):
+            value = value.to_numpy()
+        if isinstance(value, np.ndarray):
+            hash_.update(b'array')
+            hash_.update(str(value.dtype).encode())
+            hash_.update(str(value.shape).encode())
+            if value.dtype.hasobject:
+                hash_.update(repr(value.tolist()).encode())
+            else:
+                hash_.update(np.ascontiguousarray(value).data)
+        elif isinstance(value, dict):
+            hash_.update(b'dict')
+            for name in sorted(value):
+                hash_.update(str(name).encode())
+                self._update_hash(hash_, value[name])
+        elif isinstance(value, (list, tuple)):
+            hash_.update(b'list')
+            values = np.asarray(value) if len(value) > 0 else None
+            if values is not None and values.dtype.kind in 'biuf':
+                # e.g. list of coordinates
+                self._update_hash(hash_, values)
+            else:
+                for item in value:
+                    self._update_hash(hash_, item)
+        elif isinstance(value, type):
+            hash_.update(b'type')
+            hash_.update((value.__module__ + '.' + value.__qualname__).encode())
+        elif isinstance(value, np.dtype):
+            hash_.update(b'dtype')
+            hash_.update(value.str.encode())
+        elif hasattr(value, '__dict__'):
+            hash_.update(type(value).__name__.encode())
+            self._update_hash(hash_, vars(value))
+        else:
+            hash_.update(repr(value).encode())
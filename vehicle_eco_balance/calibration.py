@@ -0,0 +1,278 @@
+import copy
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from vehicle_eco_balance.consumption import ConsumptionPhys
+from vehicle_eco_balance.sensitivity import Sensitivity
+from vehicle_eco_balance.utils import error_mean, error_measure, error_100km
+from vehicle_eco_balance.validation import validate_arrays, as_float_array
+
+default_bounds = {
+    'mass': (800.0, 3500.0),  # in kg
+    'cw': (0.2, 0.5),
+    'cross_section': (1.5, 4.0),  # in m²
+    'idle_power': (0.5, 6.0),  # in kW
+    'min_efficiency': (0.05, 0.3),
+    'max_efficiency': (0.2, 0.5)
+}
+
+error_metrics = {
+    'error_mean': error_mean,
+    'error_measure': error_measure,
+    'error_100km': error_100km
+}
+
+
+class Calibration:
+    """ Calibration of vehicle parameters for the physical consumption model (class ConsumptionPhys) against measured
+    consumption (e.g. OBD consumption of enviroCar tracks).
+
+    The parameters are fitted by the cross-entropy method: in each iteration a batch of candidate parameter sets is
+    sampled and evaluated as one matrix (candidates x sampling points), the best candidates (elite) define the
+    sampling distribution of the next iteration. Optionally the result is refined by Gauss-Newton steps for mass and cw
+    using the analytic derivatives of class Sensitivity.
+
+    Parameters
+    ----------
+    parameters: list of str
+        names of the vehicle parameters to calibrate (default mass, cw, idle_power, min_efficiency, max_efficiency)
+    bounds: dictionary
+        (lower, upper) bounds per parameter (default see default_bounds)
+    metric: str
+        'error_mean', 'error_measure' or 'error_100km' (default 'error_measure')
+    consumption_type: str
+        'energy' or 'fuel' (default 'fuel')
+    n_candidates: int
+        number of candidate parameter sets per iteration (default 64)
+    n_elite: int
+        number of best candidates defining the next sampling distribution (default 8)
+    n_iterations: int
+        maximum number of iterations (default 30)
+    tol: float
+        stop if the standard deviation of all parameters is below tol times the bound width (default 1e-3)
+    use_gradient: bool
+        refine mass and cw by Gauss-Newton steps with the derivatives of class Sensitivity (default False)
+    max_elements: int
+        maximum number of matrix elements (candidates x sampling points) evaluated at once (default 2**23)
+    seed: int
+        seed of the random number generator (default None)
+    g: float
+        gravitational acceleration in m/s² (default 9.81)
+    rho_air: float
+        air mass density in kg/m³ (default 1.225)
+
+    Attributes
+    ----------
+    vehicle: class Car
+        calibrated vehicle (copy of the given vehicle)
+    error: float
+        error of the calibrated vehicle
+    history: list of float
+        best error after each iteration
+    """
+
+    def __init__(self, parameters=('mass', 'cw', 'idle_power', 'min_efficiency', 'max_efficiency'), bounds=None,
+                 metric='error_measure', consumption_type='fuel', n_candidates=64, n_elite=8, n_iterations=30,
+                 tol=1e-3, use_gradient=False, max_elements=2 ** 23, seed=None, g=9.81, rho_air=1.225):
+
+        if metric not in error_metrics:
+            raise Exception("metric " + metric + " is unknown!")
+
+        self.parameters = list(parameters)
+        self.bounds = dict(default_bounds)
+        if bounds is not None:
+            self.bounds.update(bounds)
+        self.metric = metric
+        self.consumption_type = consumption_type
+        self.n_candidates = n_candidates
+        self.n_elite = n_elite
+        self.n_iterations = n_iterations
+        self.tol = tol
+        self.use_gradient = use_gradient
+        self.max_elements = max_elements
+        self.seed = seed
+        self.g = g
+        self.rho_air = rho_air
+        self.vehicle = None
+        self.error = None
+        self.history = []
+
+    def calibrate(self, speed, acceleration, gradient_angle, dt, consumption, vehicle, cr=0.02):
+        """ Calibrate the vehicle parameters
+
+        Parameters
+        ----------
+        speed: numpy array
+            vehicle speed in km/h
+        acceleration: numpy array
+            vehicle acceleration in m/s²
+        gradient_angle: numpy array
+            gradient angle (of the road) in radians
+        dt: numpy array
+            interval times between measurements in seconds
+        consumption: numpy array
+            measured consumption in l/h (fuel) or kW (energy)
+        vehicle: class Car
+            vehicle with initial parameters (parameters which are not calibrated are kept)
+        cr: float or numpy array
+            rolling resistance coefficient (default 0.02)
+
+        Returns
+        -------
+        self.vehicle: class Car
+            calibrated vehicle
+        """
+
+        speed, acceleration, gradient_angle, dt, consumption = validate_arrays(
+            ['speed', 'acceleration', 'gradient_angle', 'dt', 'consumption'],
+            speed, acceleration, gradient_angle, dt, consumption)
+        cr = as_float_array(cr)
+        track = (speed, acceleration, gradient_angle, dt, consumption, cr)
+
+        rng = np.random.default_rng(self.seed)
+        lower = np.array([self.bounds[name][0] for name in self.parameters])
+        upper = np.array([self.bounds[name][1] for name in self.parameters])
+
+        # First iteration: uniform samples within the bounds and the initial parameters
+        initial = np.array([getattr(vehicle, name) for name in self.parameters], dtype=float)
+        candidates = np.vstack([initial, rng.uniform(lower, upper, (self.n_candidates - 1, len(self.parameters)))])
+
+        best, best_error = initial, np.inf
+        self.history = []
+        for _ in range(self.n_iterations):
+            candidates = self._fix_efficiency_order(np.clip(candidates, lower, upper))
+            errors = self._evaluate(candidates, vehicle, track)
+            order = np.argsort(errors)
+            if errors[order[0]] < best_error:
+                best, best_error = candidates[order[0]], errors[order[0]]
+            self.history.append(best_error)
+
+            elite = candidates[order[:self.n_elite]]
+            std = elite.std(axis=0)
+            if np.all(std <= self.tol * (upper - lower)):
+                break
+            candidates = rng.normal(elite.mean(axis=0), std, (self.n_candidates, len(self.parameters)))
+
+        self.vehicle = self._create_vehicle(vehicle, best)
+        self.error = best_error
+
+        if self.use_gradient:
+            self._refine(track, lower, upper)
+
+        return self.vehicle
+
+    def _evaluate(self, candidates, vehicle, track):
+        """ Evaluate the error metric for a matrix of candidate parameter sets """
+
+        speed, acceleration, gradient_angle, dt, consumption, cr = track
+        batch_size = max(1, self.max_elements // max(1, len(speed)))
+        cons = ConsumptionPhys(self.consumption_type, g=self.g, rho_air=self.rho_air)
+
+        errors = np.empty(len(candidates))
+        for start in range(0, len(candidates), batch_size):
+            # Parameters as column vectors broadcast against the sampling points
+            batch = self._create_vehicle(vehicle, candidates[start:start + batch_size].T[:, :, np.newaxis])
+            modelled = cons.calculate_consumption(speed, acceleration, gradient_angle, batch, cr, trusted=True)
+            errors[start:start + batch_size] = self._error(modelled, consumption, dt, speed, axis=-1)
+
+        return errors
+
+    def _refine(self, track, lower, upper, n_steps=10):
+        """ Refine mass and cw by Gauss-Newton steps minimizing the time-weighted squared error """
+
+        names = [name for name in ('mass', 'cw') if name in self.parameters]
+        if len(names) == 0:
+            return
+
+        speed, acceleration, gradient_angle, dt, consumption, cr = track
+        cons = ConsumptionPhys(self.consumption_type, g=self.g, rho_air=self.rho_air)
+        indices = [self.parameters.index(name) for name in names]
+
+        for _ in range(n_steps):
+            vehicle = self.vehicle
+            modelled = cons.calculate_consumption(speed, acceleration, gradient_angle, vehicle, cr, trusted=True)
+            sensitivity = Sensitivity.from_vehicle(vehicle, cr, cons.efficiency, self.rho_air, self.g)
+            if self.consumption_type == 'energy':
+                sensitivity.calorific_value = 1.0  # derivatives in kW instead of l/h
+
+            # Derivatives vanish where the power is limited to the idle power
+            active = cons.power > vehicle.idle_power
+            derivatives = {'mass': sensitivity.dQ_mass(speed, acceleration, gradient_angle, 1.0),
+                           'cw': sensitivity.dQ_cw(speed, 1.0)}
+            jacobian = np.stack([derivatives[name] * active for name in names], axis=1)
+
+            residual = modelled - consumption
+            normal = jacobian.T @ (jacobian * dt[:, np.newaxis])
+            if np.linalg.matrix_rank(normal) < len(names):
+                return
+            step = np.linalg.solve(normal, -jacobian.T @ (residual * dt))
+
+            values = np.array([getattr(vehicle, name) for name in self.parameters], dtype=float)
+            values[indices] = np.clip(values[indices] + step, lower[indices], upper[indices])
+            candidate = self._create_vehicle(vehicle, values)
+            modelled = cons.calculate_consumption(speed, acceleration, gradient_angle, candidate, cr, trusted=True)
+            error = self._error(modelled, consumption, dt, speed)
+            if error >= self.error:
+                return
+            self.vehicle, self.error = candidate, error
+            self.history.append(error)
+
+    def _error(self, modelled, consumption, dt, speed, axis=None):
+        if self.metric == 'error_100km':
+            return error_100km(modelled, consumption, dt, speed, axis=axis)
+        return error_metrics[self.metric](modelled, consumption, dt, axis=axis)
+
+    def _fix_efficiency_order(self, candidates):
+        """ Swap min_efficiency and max_efficiency where min_efficiency is larger """
+        if 'min_efficiency' in self.parameters and 'max_efficiency' in self.parameters:
+            i, j = self.parameters.index('min_efficiency'), self.parameters.index('max_efficiency')
+            low = np.minimum(candidates[:, i], candidates[:, j])
+            candidates[:, j] = np.maximum(candidates[:, i], candidates[:, j])
+            candidates[:, i] = low
+        return candidates
+
+    def _create_vehicle(self, vehicle, values):
+        vehicle = copy.copy(vehicle)
+        for name, value in zip(self.parameters, values):
+            setattr(vehicle, name, value)
+        return vehicle
+
+
+def _calibrate_track(arguments):
+    calibration, track, vehicle = arguments
+    calibration.calibrate(track['speed'], track['acceleration'], track['gradient_angle'], track['dt'],
+                          track['consumption'], vehicle, track.get('cr', 0.02))
+    return [calibration.vehicle, calibration.error]
+
+
+def calibrate_fleet(tracks, vehicles, calibration=None, processes=None):
+    """ Calibrate the parameters of many vehicles in parallel processes
+
+    Parameters
+    ----------
+    tracks: list of dictionaries
+        one track per vehicle with the keys 'speed', 'acceleration', 'gradient_angle', 'dt', 'consumption' and
+        optionally 'cr' (see Calibration.calibrate)
+    vehicles: list of class Car
+        vehicles with initial parameters
+    calibration: class Calibration
+        calibration settings (default Calibration())
+    processes: int
+        number of processes, 1 to calibrate in the current process (default None, i.e. number of CPUs)
+
+    Returns
+    -------
+    results: list of lists [vehicle, error]
+        calibrated vehicle and its error for each track
+    """
+
+    if len(tracks) != len(vehicles):
+        raise Exception("The lists tracks and vehicles must have the same length!")
+    if calibration is None:
+        calibration = Calibration()
+
+    arguments = [(copy.copy(calibration), track, vehicle) for track, vehicle in zip(tracks, vehicles)]
+    if processes == 1:
+        return [_calibrate_track(argument) for argument in arguments]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_calibrate_track, arguments))
@@ -0,0 +1,497 @@
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import hashlib
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from vehicle_eco_balance.consumption import ConsumptionPhys, ConsumptionStat, ConsumptionEV, accumulate_consumption
+from vehicle_eco_balance.emissions import get_emission_factor, accumulate_emissions
+from vehicle_eco_balance.geo import calc_cumulative_distance, calc_gradient_angle_smoothed, get_cr_from_osm, \
+    ElevationAPI, RouteCache
+from vehicle_eco_balance.kinematics import calc_acceleration
+from vehicle_eco_balance.preprocessing import to_seconds, clean_track
+from vehicle_eco_balance.vehicle import Car
+
+default_job = {
+    'vehicle': {},
+    'model': 'phys',
+    'consumption_type': 'fuel',
+    'model_parameters': {},
+    'columns': {
+        'time': 'Time in s',
+        'speed': 'Speed in km/h',
+        'lats': None,
+        'lngs': None,
+        'altitudes': None,
+        'gradient_angle': None
+    },
+    'gradient': 'column',
+    'gradient_window': 100.0,
+    'elevation': None,
+    'cr': 0.02,
+    'route_cache': None,
+    'clean': None,
+    'grid_mix': None,
+    'output_format': 'csv',
+    'dtype': None
+}
+
+summary_fields = ['track', 'points', 'duration', 'distance', 'consumption', 'consumption_per100km', 'co2',
+                  'processing_time']
+
+
+def load_job(path):
+    """ Load a job configuration (JSON) and complete it with the default values
+
+    Example job configuration:
+        {
+            "vehicle": {"mass": 1600, "fuel_type": "diesel"},
+            "model": "phys",
+            "consumption_type": "fuel",
+            "columns": {"time": "Time in s", "speed": "Speed in km/h", "altitudes": "Altitude in m"},
+            "gradient": "altitude",
+            "gradient_window": 100.0,
+            "cr": 0.02,
+            "clean": {"step": 1.0},
+            "output_format": "csv"
+        }
+
+    Keys
+    ----
+    vehicle: parameters of class Car
+    model: 'phys' (ConsumptionPhys), 'stat' (ConsumptionStat) or 'ev' (ConsumptionEV)
+    consumption_type: 'fuel' or 'energy' (only for model 'phys')
+    model_parameters: parameters of the model class (e.g. g, rho_air or the coefficients of ConsumptionStat)
+    columns: names of the CSV columns for time (seconds or ISO timestamps), speed (km/h), lats, lngs (degrees),
+        altitudes (m) and gradient_angle (rad)
+    gradient: 'column' (gradient_angle column), 'altitude' (altitudes column), 'elevation_api' (elevation from
+        ElevationAPI at lats/lngs) or 'none'
+    gradient_window: distance window in meters for the smoothed gradient from altitudes
+    elevation: parameters of class ElevationAPI (base_url, dataset, api_key)
+    cr: rolling resistance coefficient or 'osm' (get_cr_from_osm)
+    route_cache: file of a RouteCache for the geo enrichment
+    clean: None for no cleaning or parameters of clean_track (e.g. step, max_speed)
+    grid_mix: grid mix for the CO2 emissions of electric cars (see emissions.grid_mixes)
+    output_format: 'csv' or 'npz' (per point results) or 'summary' (only the summary)
+    dtype: float type of the calculation, e.g. 'float32' to halve the memory (default None, i.e. float64)
+
+    Parameters
+    ----------
+    path: str
+        path of the JSON file
+
+    Returns
+    -------
+    job: dictionary
+        job configuration
+    """
+
+    with open(path) as file:
+        config = json.load(file)
+
+    job = dict(default_job)
+    job.update(config)
+    job['columns'] = dict(default_job['columns'], **config.get('columns', {}))
+
+    if job['model'] not in ('phys', 'stat', 'ev'):
+        raise Exception("model " + str(job['model']) + " is unknown!")
+    if job['gradient'] not in ('column', 'altitude', 'elevation_api', 'none'):
+        raise Exception("gradient " + str(job['gradient']) + " is unknown!")
+    if job['output_format'] not in ('csv', 'npz', 'summary'):
+        raise Exception("output_format " + str(job['output_format']) + " is unknown!")
+
+    return job
+
+
+def find_tracks(patterns):
+    """ Find track files (CSV) from directories and glob patterns
+
+    Parameters
+    ----------
+    patterns: list of str
+        directories (all *.csv files), files or glob patterns
+
+    Returns
+    -------
+    files: list of str
+        sorted list of track files
+    """
+
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            files.update(glob.glob(os.path.join(pattern, '*.csv')))
+        else:
+            files.update(glob.glob(pattern))
+
+    return sorted(files)
+
+
+def read_track(path, columns):
+    """ Read the configured columns of a track from a CSV file
+
+    Parameters
+    ----------
+    path: str
+        CSV file with a header row
+    columns: dictionary
+        column names per quantity (see load_job), quantities with column name None are skipped
+
+    Returns
+    -------
+    track: dictionary of numpy arrays
+        values per quantity, time in seconds since the first point
+    """
+
+    with open(path, newline='') as file:
+        rows = list(csv.reader(file))
+    header, rows = rows[0], rows[1:]
+
+    track = {}
+    for quantity, name in columns.items():
+        if name is None:
+            continue
+        if name not in header:
+            raise Exception("Column " + name + " not found in " + path + "!")
+        index = header.index(name)
+        values = [row[index] for row in rows]
+        if quantity == 'time':
+            try:
+                track[quantity] = to_seconds(np.array(values, dtype=float))
+            except ValueError:
+                track[quantity] = to_seconds(np.array(values))
+        else:
+            track[quantity] = np.array([value if value != '' else 'nan' for value in values], dtype=float)
+
+    return track
+
+
+def create_model(model='phys', consumption_type='fuel', parameters=None):
+    """ Create a consumption model by name
+
+    Parameters
+    ----------
+    model: str
+        'phys' (ConsumptionPhys), 'stat' (ConsumptionStat) or 'ev' (ConsumptionEV) (default 'phys')
+    consumption_type: str
+        'fuel' or 'energy', only for model 'phys' (default 'fuel')
+    parameters: dictionary
+        parameters of the model class (default None)
+
+    Returns
+    -------
+    model: class ConsumptionPhys, ConsumptionStat or ConsumptionEV
+    """
+
+    parameters = parameters or {}
+    if model == 'phys':
+        return ConsumptionPhys(consumption_type, **parameters)
+    if model == 'ev':
+        return ConsumptionEV(**parameters)
+    if model == 'stat':
+        return ConsumptionStat(**parameters)
+    raise Exception("model " + str(model) + " is unknown!")
+
+
+def calculate_consumption(model, speed, acceleration, gradient_angle, vehicle, cr=0.02, trusted=False):
+    """ Calculate the consumption with any consumption model (ConsumptionStat ignores vehicle and cr) """
+
+    if isinstance(model, ConsumptionStat):
+        return model.calculate_consumption(speed, acceleration, gradient_angle, trusted=trusted)
+    return model.calculate_consumption(speed, acceleration, gradient_angle, vehicle, cr, trusted=trusted)
+
+
+def process_track(job, path, route_cache=None):
+    """ Run the eco balance pipeline for a single track file
+
+    Parameters
+    ----------
+    job: dictionary
+        job configuration (see load_job)
+    path: str
+        track file
+    route_cache: class RouteCache
+        cache for the geo enrichment, which is not saved (default None, i.e. the cache file of the job is loaded and
+        saved after the track)
+
+    Returns
+    -------
+    [summary, results]: list of dictionaries
+        summary values of the track (see summary_fields) and per point results (numpy arrays)
+    """
+
+    start = time.perf_counter()
+    track = read_track(path, job['columns'])
+
+    if job['clean'] is not None:
+        cleaned = clean_track(track['time'], track['speed'], track.get('lats'), track.get('lngs'),
+                              track.get('altitudes'), **job['clean'])
+        if 'gradient_angle' in track:
+            cleaned['gradient_angle'] = np.interp(cleaned['time'], track['time'], track['gradient_angle'])
+        track = cleaned
+    else:
+        track['dt'] = np.zeros(len(track['time']))
+        track['dt'][1:] = np.diff(track['time'])
+
+    speed, dt = track['speed'], track['dt']
+    acceleration = calc_acceleration(speed, dt, dtype=job['dtype'])
+    coordinates = list(zip(track['lats'], track['lngs'])) if 'lats' in track and 'lngs' in track else None
+    save_cache = route_cache is None and job['route_cache'] is not None
+    if save_cache:
+        route_cache = RouteCache(path=job['route_cache'])
+
+    # Gradient angle
+    if job['gradient'] == 'column':
+        gradient_angle = track['gradient_angle']
+    elif job['gradient'] == 'none':
+        gradient_angle = np.zeros(len(speed))
+    else:
+        if job['gradient'] == 'elevation_api':
+            altitude = ElevationAPI(**(job['elevation'] or {})).get_elevation(coordinates, cache=route_cache)
+        else:
+            altitude = track['altitudes']
+        if coordinates is not None:
+            distance = calc_cumulative_distance(track['lats'], track['lngs'])
+        else:
+            distance = np.cumsum(speed / 3.6 * dt)
+        gradient_angle = calc_gradient_angle_smoothed(distance, altitude, job['gradient_window'], dtype=job['dtype'])
+
+    # Rolling resistance coefficient
+    cr = job['cr']
+    if cr == 'osm':
+        cr = get_cr_from_osm(coordinates, cache=route_cache)[0]
+    if save_cache:
+        route_cache.save()
+
+    # Consumption and emissions
+    vehicle = Car(**job['vehicle'])
+    model = create_model(job['model'], job['consumption_type'], dict(job['model_parameters'], dtype=job['dtype']))
+    consumption = calculate_consumption(model, speed, acceleration, gradient_angle, vehicle, cr)
+
+    total = accumulate_consumption(consumption, dt)
+    distance_total = np.sum(speed * dt) / 3600
+    co2 = np.nan
+    if _has_emission_factor(vehicle, job['grid_mix']):
+        emission_factor = get_emission_factor(vehicle, grid_mix=job['grid_mix'])
+        co2 = accumulate_emissions(consumption, dt, emission_factor)
+
+    summary = {
+        'track': os.path.basename(path),
+        'points': len(speed),
+        'duration': float(np.sum(dt)),
+        'distance': float(distance_total),
+        'consumption': float(total),
+        'consumption_per100km': float(100 * total / distance_total) if distance_total > 0 else np.nan,
+        'co2': float(co2),
+        'processing_time': time.perf_counter() - start
+    }
+    results = {'time': track['time'], 'speed': speed, 'acceleration': acceleration, 'gradient_angle': gradient_angle,
+               'consumption': consumption}
+
+    return [summary, results]
+
+
+def _has_emission_factor(vehicle, grid_mix):
+    """ Check if the CO2 emissions of a vehicle can be calculated (grid mix of electric cars, factor of others) """
+    if vehicle.fuel_type == 'electric':
+        return grid_mix is not None
+    return vehicle.emission_factors.get('co2') is not None
+
+
+def job_fingerprint(job):
+    """ Hash of a job configuration, e.g. to detect checkpoints of another job """
+    return hashlib.sha1(json.dumps(job, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# Route cache of a worker process, loaded once by _init_worker
+_route_cache = None
+
+
+def _init_worker(route_cache):
+    """ Load the route cache once per worker process (or use the cache of the parent process) """
+    global _route_cache
+    if isinstance(route_cache, str):
+        route_cache = RouteCache(path=route_cache)
+    _route_cache = route_cache
+
+
+def _pop_changes():
+    """ Changed tiles of the route cache of the worker since the last call """
+    if _route_cache is None:
+        return {}
+    changes = {tile: _route_cache.tiles[tile] for tile in _route_cache.changed if tile in _route_cache.tiles}
+    _route_cache.changed.clear()
+    return changes
+
+
+def _run_track(job, output, path):
+    """ Process a track in a worker and write its per point results, the changed tiles of the route cache are
+    returned for the parent process """
+
+    try:
+        summary, results = process_track(job, path, _route_cache)
+    except Exception as err:
+        return [path, None, str(err), _pop_changes()]
+    changes = _pop_changes()
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    if job['output_format'] == 'csv':
+        with open(os.path.join(output, name + '_consumption.csv'), 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(list(results.keys()))
+            writer.writerows(zip(*results.values()))
+    elif job['output_format'] == 'npz':
+        np.savez(os.path.join(output, name + '_consumption.npz'), **results)
+
+    return [path, summary, None, changes]
+
+
+def run(job, files, output, workers=None, checkpoint=None, progress=True):
+    """ Process track files with a worker pool
+
+    Finished tracks are appended to a checkpoint file (JSON lines), so that an interrupted run resumes with the
+    remaining tracks when it is started again with the same checkpoint. The first line holds the fingerprint of the job
+    configuration (see job_fingerprint), a checkpoint of another job is not resumed.
+
+    The route cache of the job is loaded once per worker process, the parent process merges the changed tiles of the
+    workers and saves the cache once at the end of the run.
+
+    Parameters
+    ----------
+    job: dictionary
+        job configuration (see load_job)
+    files: list of str
+        track files
+    output: str
+        output directory (created if it does not exist)
+    workers: int
+        number of worker processes, 1 to process in the current process (default None, i.e. number of CPUs)
+    checkpoint: str
+        checkpoint file (default <output>/checkpoint.jsonl)
+    progress: bool
+        print the progress to stderr (default True)
+
+    Returns
+    -------
+    [summaries, processed, failed, elapsed]: list
+        summaries of all finished tracks (including the ones of earlier runs), summaries of the tracks processed in this
+        run, list of [file, error message] of failed tracks and the runtime in seconds
+
+    Raises
+    ------
+    Exception
+        if the checkpoint was written by another job configuration
+    """
+
+    os.makedirs(output, exist_ok=True)
+    checkpoint = checkpoint if checkpoint is not None else os.path.join(output, 'checkpoint.jsonl')
+    fingerprint = job_fingerprint(job)
+
+    entries = []
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+    if len(entries) > 0 and entries[0].get('job') != fingerprint:
+        raise Exception("The checkpoint " + checkpoint + " was written by another job configuration, remove it or use "
+                        "another output directory!")
+    summaries = {entry['path']: entry['summary'] for entry in entries[1:]}
+
+    pending = [path for path in files if path not in summaries]
+    if progress and len(summaries) > 0:
+        print('Resuming: {} of {} tracks already processed'.format(len(files) - len(pending), len(files)),
+              file=sys.stderr)
+
+    processed, failed = [], []
+    start = time.perf_counter()
+    route_cache = RouteCache(path=job['route_cache']) if job['route_cache'] is not None else None
+    modified = False
+    worker = partial(_run_track, job, output)
+    with open(checkpoint, 'a') as checkpoint_file:
+        if len(entries) == 0:
+            checkpoint_file.write(json.dumps({'job': fingerprint}) + '\n')
+            checkpoint_file.flush()
+        if workers == 1:
+            executor = None
+            _init_worker(route_cache)
+            results = map(worker, pending)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(job['route_cache'],))
+            results = (future.result() for future in as_completed([executor.submit(worker, path) for path in pending]))
+        try:
+            for i, (path, summary, error, changes) in enumerate(results):
+                if len(changes) > 0 and executor is not None:
+                    route_cache.merge(changes)
+                modified = modified or len(changes) > 0
+                if summary is None:
+                    failed.append([path, error])
+                else:
+                    summaries[path] = summary
+                    processed.append(summary)
+                    checkpoint_file.write(json.dumps({'path': path, 'summary': summary}) + '\n')
+                    checkpoint_file.flush()
+                if progress:
+                    print('[{}/{}] {} {}'.format(i + 1, len(pending), os.path.basename(path),
+                                                 'failed: ' + error if error else ''), file=sys.stderr)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            else:
+                _init_worker(None)
+            if modified:
+                route_cache.save()
+
+    return [[summaries[path] for path in files if path in summaries], processed, failed, time.perf_counter() - start]
+
+
+def write_summary(summaries, path):
+    """ Write the summaries of all tracks to a CSV file """
+
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=summary_fields)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def main(argv=None):
+    """ Command line entry point (vehicle-eco-balance) """
+
+    parser = argparse.ArgumentParser(prog='vehicle-eco-balance',
+                                     description='Estimate the consumption and CO2 emissions of directories of tracks.')
+    parser.add_argument('job', help='job configuration (JSON), see vehicle_eco_balance.cli.load_job')
+    parser.add_argument('tracks', nargs='+', help='track files (CSV), directories or glob patterns')
+    parser.add_argument('-o', '--output', default='output', help='output directory (default: output)')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint file to resume from (default: <output>/checkpoint.jsonl)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not print the progress')
+    args = parser.parse_args(argv)
+
+    job = load_job(args.job)
+    files = find_tracks(args.tracks)
+    if len(files) == 0:
+        parser.error('no track files found')
+
+    summaries, processed, failed, elapsed = run(job, files, args.output, args.workers, args.checkpoint,
+                                                not args.quiet)
+    write_summary(summaries, os.path.join(args.output, 'summary.csv'))
+
+    points = sum(summary['points'] for summary in processed)
+    print('Processed {} tracks ({} points) in {:.2f} s, {} failed, {} of {} tracks finished'.format(
+        len(processed), points, elapsed, len(failed), len(summaries), len(files)))
+    if elapsed > 0:
+        print('Throughput: {:.1f} tracks/s, {:.0f} points/s'.format(len(processed) / elapsed, points / elapsed))
+    for path, error in failed:
+        print('Failed: {}: {}'.format(path, error), file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import numpy as np
-from vehicle_eco_balance.utils import calc_efficiency
+from vehicle_eco_balance.utils import calc_efficiency, segment_sum
+from vehicle_eco_balance.backend import get_namespace
+from vehicle_eco_balance.instrumentation import stage
+from vehicle_eco_balance.validation import validate_arrays, as_float_array, check_gradient_angle
 
 
 class ConsumptionPhys:
@@ -14,6 +17,9 @@ class ConsumptionPhys:
         gravitational acceleration in m/s² (default 9.81)
     rho_air²: float
         air mass density in kg/m³ (default 1.225)
+    dtype: numpy dtype
+        float type of the calculation, e.g. np.float32 to halve the memory of inputs and results; inputs and vehicle
+        parameters are converted (default None, i.e. the float type of the inputs)
 
 
     Attributes
@@ -32,6 +38,8 @@ class ConsumptionPhys:
         gravitational acceleration in m/s² (default 9.81)
     rho_air²: float
         air mass density in kg/m³ (default 1.225)
+    dtype: numpy dtype
+        float type of the calculation (default None)
 
     References for default values:
     ¹ Martin Treiber and Arne Kesting. “Traffic flow dynamics.” In: Traffic Flow Dynamics: Data, Models and Simulation,
@@ -39,7 +47,7 @@ class ConsumptionPhys:
     ² Stefan Pischinger und Ulrich Seiffert. Vieweg Handbuch Kraftfahrzeugtechnik. Springer, 2016. Page 63.
     """
 
-    def __init__(self, consumption_type, g=9.81, rho_air=1.225):
+    def __init__(self, consumption_type, g=9.81, rho_air=1.225, dtype=None):
         self.consumption_type = consumption_type
         self.consumption = None
         self.power = None
@@ -49,10 +57,11 @@ class ConsumptionPhys:
         self.climbing_resistance = None
         self.inertial_resistance = None
         self.efficiency = None
-        self.g = g
-        self.rho_air = rho_air
+        self.dtype = dtype
+        self.g = as_float_array(g, dtype)
+        self.rho_air = as_float_array(rho_air, dtype)
 
-    def calculate_consumption(self, speed, acceleration, gradient_angle, vehicle, cr=0.02, **kwargs):
+    def calculate_consumption(self, speed, acceleration, gradient_angle, vehicle, cr=0.02, trusted=False, **kwargs):
         """ Calculate energy/fuel consumption
 
         Parameters
@@ -67,62 +76,69 @@ class ConsumptionPhys:
             vehicle containing parameters like mass, air drag coefficient, etc.
         cr¹: float or numpy array
             rolling resistance coefficient (default 0.02)
+        trusted: bool
+            skip the conversion and validation of the inputs, e.g. for clean numpy arrays in batch runs (default False)
         kwargs: dictionary
             efficiency: float or numpy array
 
         Returns
         -------
         self.consumption: numpy array
-            instantaneous consumption for each sampling point (in l/h if consumption_type is 'fuel', in kW if consumption_type is 'energy')
+            instantaneous consumption for each sampling point (in l/h if consumption_type is 'fuel', in kW if consumption_type is 'energy'),
+            NaN where an input value is NaN
 
         References for default values:
         ¹ Martin Treiber and Arne Kesting. “Traffic flow dynamics.” In: Traffic Flow Dynamics: Data, Models and Simulation,
           Springer-Verlag Berlin Heidelberg (2013). Page 395.
         """
 
-        # TODO: check input type and convert lists to numpy arrays?
-        # TODO: check units?
-        # TODO: check NaN?
+        if not trusted:
+            speed, acceleration, gradient_angle = validate_arrays(['speed', 'acceleration', 'gradient_angle'],
+                                                                  speed, acceleration, gradient_angle,
+                                                                  dtype=self.dtype)
+            check_gradient_angle(gradient_angle)
+            cr = as_float_array(cr, self.dtype)
 
-        if len(speed) != len(acceleration) or len(speed) != len(gradient_angle) or len(acceleration) != len(
-                gradient_angle):
-            raise Exception("The arrays speed, acceleration and gradient_angle must have the same length!")
+        with stage('consumption_phys', points=getattr(speed, 'size', 1)):
+            # Extract parameters from vehicle
+            mass, cw, cross_section, idle_power, calorific_value, min_efficiency, max_efficiency = self._cast(
+                vehicle.mass, vehicle.cw, vehicle.cross_section, vehicle.idle_power, vehicle.calorific_value,
+                vehicle.min_efficiency, vehicle.max_efficiency)
+            fuel_type = vehicle.fuel_type
 
-        # Extract parameters from vehicle
-        mass = vehicle.mass
-        cw = vehicle.cw
-        cross_section = vehicle.cross_section
-        idle_power = vehicle.idle_power
-        calorific_value = vehicle.calorific_value
-        fuel_type = vehicle.fuel_type
-        min_efficiency = vehicle.min_efficiency
-        max_efficiency = vehicle.max_efficiency
+            # Transform speed from km/h to m/s
+            speed = speed / 3.6
 
-        # Transform speed from km/h to m/s
-        speed = speed / 3.6
+            self.calc_driving_resistance(speed, acceleration, gradient_angle, mass, cross_section, cw, cr)
 
-        self.calc_driving_resistance(speed, acceleration, gradient_angle, mass, cross_section, cw, cr)
+            efficiency = kwargs.get('efficiency', None)
+            if efficiency is None:
+                efficiency = calc_efficiency(self.driving_resistance, -2000, 2000, min_efficiency, max_efficiency)
+            self.efficiency = self._cast(efficiency)[0]
 
-        efficiency = kwargs.get('efficiency', None)
-        if efficiency is None:
-            efficiency = calc_efficiency(self.driving_resistance, -2000, 2000, min_efficiency, max_efficiency)
-        self.efficiency = efficiency
-
-        self.calc_engine_power(speed, self.driving_resistance, idle_power, fuel_type)
-        if self.consumption_type == 'energy':
-            self.consumption = self.power / efficiency
-        else:
-            self.consumption = self.power / (calorific_value * efficiency)
+            self.calc_engine_power(speed, self.driving_resistance, idle_power, fuel_type)
+            if self.consumption_type == 'energy':
+                self.consumption = self.power / efficiency
+            else:
+                self.consumption = self.power / (calorific_value * efficiency)
 
         return self.consumption
 
+    def _cast(self, *values):
+        """ Convert parameters to the float type of the calculation (float64 scalars would promote float32 arrays) """
+        if self.dtype is None:
+            return list(values)
+        return [as_float_array(value, self.dtype) for value in values]
+
     def calc_engine_power(self, speed, driving_resistance, idle_power, fuel_type):
         """ Calculate engine power in kW """
 
+        xp = get_namespace(speed, driving_resistance)
+
         self.power = speed * driving_resistance / 1000
         # Allow negative consumption for electric cars
         if fuel_type != 'electric':
-            self.power = np.maximum(self.power, idle_power)
+            self.power = xp.clip(self.power, idle_power, None)
 
         return self.power
 
@@ -137,17 +153,19 @@ class ConsumptionPhys:
 
     def calc_aerodynamic_drag(self, speed, cross_section, cw):
         """ Calculate aerodynamic drag in N """
-        self.aerodynamic_drag = 0.5 * cw * cross_section * self.rho_air * np.square(speed)
+        self.aerodynamic_drag = 0.5 * cw * cross_section * self.rho_air * speed * speed
         return self.aerodynamic_drag
 
     def calc_rolling_resistance(self, gradient_angle, mass, cr):
         """ Calculate rolling resistance in N """
-        self.rolling_resistance = mass * self.g * cr * np.cos(gradient_angle)
+        xp = get_namespace(gradient_angle)
+        self.rolling_resistance = mass * self.g * cr * xp.cos(gradient_angle)
         return self.rolling_resistance
 
     def calc_climbing_resistance(self, gradient_angle, mass):
         """ Calculate climbing resistance in N """
-        self.climbing_resistance = mass * self.g * np.sin(gradient_angle)
+        xp = get_namespace(gradient_angle)
+        self.climbing_resistance = mass * self.g * xp.sin(gradient_angle)
         return self.climbing_resistance
 
     def calc_inertial_resistance(self, acceleration, mass):
@@ -156,6 +174,105 @@ class ConsumptionPhys:
         return self.inertial_resistance
 
 
+class ConsumptionEV(ConsumptionPhys):
+    """ Energy model for battery-electric cars.
+
+    Extends the physical model (class ConsumptionPhys) by separate efficiencies for driving and regeneration, a limit
+    of the regenerative power and an auxiliary power (e.g. air conditioning, electronics). The consumption is the
+    electric power drawn from (positive) or fed into (negative) the battery:
+
+    consumption = max(power, 0) / drive_efficiency + max(min(power, 0), -max_regen_power) * regen_efficiency
+                  + auxiliary_power
+
+    All inputs may be numpy arrays of any shape, e.g. vehicles x sampling points for a whole fleet.
+
+    Parameters
+    ----------
+    drive_efficiency: float
+        efficiency from battery to wheel (default 0.9)
+    regen_efficiency: float
+        efficiency from wheel to battery during regeneration (default 0.7)
+    max_regen_power: float
+        maximum regenerative power at the wheel in kW, None for no limit (default 50.0)
+    auxiliary_power: float or numpy array
+        auxiliary power in kW (default 0.5)
+    g: float
+        gravitational acceleration in m/s² (default 9.81)
+    rho_air: float
+        air mass density in kg/m³ (default 1.225)
+    dtype: numpy dtype
+        float type of the calculation, e.g. np.float32 (default None, i.e. the float type of the inputs)
+
+    Attributes
+    ----------
+    consumption : numpy array
+        battery power in kW
+    power: numpy array
+        power at the wheel in kW
+    driving_resistance: numpy array
+        driving resistance in N
+    drive_efficiency, regen_efficiency, max_regen_power, auxiliary_power, g, rho_air, dtype:
+        identical to parameters
+    """
+
+    def __init__(self, drive_efficiency=0.9, regen_efficiency=0.7, max_regen_power=50.0, auxiliary_power=0.5,
+                 g=9.81, rho_air=1.225, dtype=None):
+        super().__init__('energy', g=g, rho_air=rho_air, dtype=dtype)
+        self.drive_efficiency = drive_efficiency
+        self.regen_efficiency = regen_efficiency
+        self.max_regen_power = max_regen_power
+        self.auxiliary_power = auxiliary_power
+
+    def calculate_consumption(self, speed, acceleration, gradient_angle, vehicle, cr=0.02, trusted=False, **kwargs):
+        """ Calculate the battery power
+
+        Parameters
+        ----------
+        speed: numpy array
+            vehicle speed in km/h
+        acceleration: numpy array
+            vehicle acceleration in m/s²
+        gradient_angle: numpy array
+            gradient angle (of the road) in radians
+        vehicle : class Vehicle
+            vehicle containing parameters like mass, air drag coefficient, etc.
+        cr: float or numpy array
+            rolling resistance coefficient (default 0.02)
+        trusted: bool
+            skip the conversion and validation of the inputs, e.g. for clean numpy arrays in batch runs (default False)
+
+        Returns
+        -------
+        self.consumption: numpy array
+            battery power for each sampling point in kW (negative during regeneration)
+        """
+
+        if not trusted:
+            speed, acceleration, gradient_angle = validate_arrays(['speed', 'acceleration', 'gradient_angle'],
+                                                                  speed, acceleration, gradient_angle,
+                                                                  dtype=self.dtype)
+            check_gradient_angle(gradient_angle)
+            cr = as_float_array(cr, self.dtype)
+
+        with stage('consumption_ev', points=getattr(speed, 'size', 1)):
+            xp = get_namespace(speed, acceleration, gradient_angle)
+            mass, cross_section, cw, drive_efficiency, regen_efficiency, auxiliary_power = self._cast(
+                vehicle.mass, vehicle.cross_section, vehicle.cw, self.drive_efficiency, self.regen_efficiency,
+                self.auxiliary_power)
+
+            # Transform speed from km/h to m/s
+            speed = speed / 3.6
+
+            self.calc_driving_resistance(speed, acceleration, gradient_angle, mass, cross_section, cw, cr)
+            self.power = speed * self.driving_resistance / 1000
+
+            min_power = None if self.max_regen_power is None else -self._cast(self.max_regen_power)[0]
+            self.consumption = xp.clip(self.power, 0.0, None) / drive_efficiency + \
+                xp.clip(self.power, min_power, 0.0) * regen_efficiency + auxiliary_power
+
+        return self.consumption
+
+
 class ConsumptionStat:
     """ Statistical consumption model.
 
@@ -173,6 +290,8 @@ class ConsumptionStat:
         fourth coefficent (default 1.90)
     e : float
         fifth coefficent (default 0.197)
+    dtype: numpy dtype
+        float type of the calculation, e.g. np.float32 (default None, i.e. the float type of the inputs)
 
     Attributes
     ----------
@@ -190,10 +309,12 @@ class ConsumptionStat:
         fourth coefficent (default 1.90)
     e : float
         fifth coefficent (default 0.197)
+    dtype: numpy dtype
+        float type of the calculation (default None)
 
     """
 
-    def __init__(self, a=1.41, b=0.000134, c=0.0670, d=1.90, e=0.197, idle_consumption=1.5):
+    def __init__(self, a=1.41, b=0.000134, c=0.0670, d=1.90, e=0.197, idle_consumption=1.5, dtype=None):
         self.consumption = None
         self.idle_consumption = idle_consumption
         self.a = a
@@ -201,8 +322,9 @@ class ConsumptionStat:
         self.c = c
         self.d = d
         self.e = e
+        self.dtype = dtype
 
-    def calculate_consumption(self, speed, acceleration, gradient_angle):
+    def calculate_consumption(self, speed, acceleration, gradient_angle, trusted=False):
         """ Calculate fuel consumption
 
         Parameters
@@ -213,25 +335,38 @@ class ConsumptionStat:
             vehicle speed in km/h
         acceleration: numpy array
             vehicle acceleration in m/s²
+        trusted: bool
+            skip the conversion and validation of the inputs, e.g. for clean numpy arrays in batch runs (default False)
 
         Returns
         -------
         self.consumption: numpy array
-            instantaneous consumption for each sampling point in l/h
+            instantaneous consumption for each sampling point in l/h, NaN where an input value is NaN
         """
 
-        # Transform speed from km/h to m/s
-        speed = speed/3.6
+        if not trusted:
+            speed, acceleration, gradient_angle = validate_arrays(['speed', 'acceleration', 'gradient_angle'],
+                                                                  speed, acceleration, gradient_angle,
+                                                                  dtype=self.dtype)
+            check_gradient_angle(gradient_angle)
+
+        with stage('consumption_stat', points=getattr(speed, 'size', 1)):
+            xp = get_namespace(speed, acceleration, gradient_angle)
+            a, b, c, d, e, idle_consumption = [as_float_array(value, self.dtype) for value in
+                                               (self.a, self.b, self.c, self.d, self.e, self.idle_consumption)]
+
+            # Transform speed from km/h to m/s
+            speed = speed/3.6
 
-        self.consumption = self.a + self.b * np.power(speed, 3) + self.c * speed * np.cos(gradient_angle) + \
-                           self.d * speed * np.sin(gradient_angle) + self.e * speed * acceleration
+            self.consumption = a + b * speed ** 3 + c * speed * xp.cos(gradient_angle) + \
+                               d * speed * xp.sin(gradient_angle) + e * speed * acceleration
 
-        self.consumption = np.maximum(self.consumption, self.idle_consumption)
+            self.consumption = xp.clip(self.consumption, idle_consumption, None)
 
         return self.consumption
 
 
-def accumulate_consumption(consumption, dt):
+def accumulate_consumption(consumption, dt, skipna=True, offsets=None):
     """ Sum instantaneous consumption values over a whole track
 
     Parameters
@@ -240,19 +375,39 @@ def accumulate_consumption(consumption, dt):
         instantaneous consumption in l/h or kW
     dt : numpy array
         interval times between measurements
+    skipna: bool
+        ignore sampling points where consumption or dt is NaN (default True)
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks
+        (default None, i.e. a single track)
 
     Returns
     -------
-    accumulated consumption in l or kWh depending on input
+    accumulated consumption in l or kWh depending on input (numpy array with one value per track if offsets are given),
+    always summed in float64 (also for float32 inputs)
     """
 
     # equation is applicable for both consumption types:
     # units: kW * s = kW * 1/3600 h = kWh / 3600
     # units: l/h * s = l/(3600 s) * s = l / 3600
-    return np.sum(consumption * dt / 3600)
-
-
-def consumption_per100km(consumption, dt, distance):
+    consumption, dt = as_float_array(consumption), as_float_array(dt)
+    xp = get_namespace(consumption, dt)
+    consumption = consumption * dt / 3600
+
+    if offsets is not None:
+        if skipna:
+            consumption[np.isnan(consumption)] = 0.0
+        return segment_sum(consumption, offsets)
+    if not skipna:
+        return xp.sum(consumption, dtype=xp.float64)
+    if xp is np:
+        # NaN values are only searched for if the plain sum is NaN, i.e. clean input is not copied
+        total = np.sum(consumption, dtype=np.float64)
+        return np.nansum(consumption, dtype=np.float64) if np.isnan(total) else total
+    return xp.sum(xp.where(xp.isnan(consumption), 0.0, consumption), dtype=xp.float64)
+
+
+def consumption_per100km(consumption, dt, distance, offsets=None):
     """ Sum instantaneous consumption values over a whole track
 
     Parameters
@@ -261,12 +416,86 @@ def consumption_per100km(consumption, dt, distance):
         instantaneous consumption in l/h or kW
     dt : numpy array
         interval times between measurements
-    distance: float
-        total trajectory distance in km
+    distance: float or numpy array
+        total trajectory distance in km (one value per track if offsets are given)
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks
+        (default None, i.e. a single track)
 
     Returns
     -------
     accumulated consumption in l or kWh depending on input
     """
 
-    return 100 * accumulate_consumption(consumption, dt) / distance
+    return 100 * accumulate_consumption(consumption, dt, offsets=offsets) / distance
+
+
+def calc_state_of_charge(consumption, dt, capacity, initial_soc=1.0):
+    """ Integrate the state of charge of a battery over a track
+
+    Regenerated energy is lost while the battery is full and consumption is not covered while the battery is empty,
+    i.e. the state of charge is limited to 0 and 1 at each sampling point as in a sequential integration, and energy
+    regenerated after a depletion charges the battery from 0. Both limits are applied vectorized (cumulative sum and
+    cumulative maximum), so whole fleets can be processed at once. The limits are applied alternately, each pass
+    corrects the track up to the next switch between a full and an empty battery.
+
+    Parameters
+    ----------
+    consumption : numpy array
+        battery power in kW (negative during regeneration), e.g. ConsumptionEV.consumption; a 2d array holds one
+        vehicle per row
+    dt : numpy array
+        interval times between measurements in seconds
+    capacity: float or numpy array
+        usable battery capacity in kWh (one value per vehicle for 2d consumption)
+    initial_soc: float or numpy array
+        state of charge at the beginning of the track between 0 and 1 (one value per vehicle for 2d consumption)
+        (default 1.0)
+
+    Returns
+    -------
+    soc: numpy array
+        state of charge (between 0 and 1) after each sampling point
+    """
+
+    consumption = np.asarray(consumption, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    initial_soc = np.asarray(initial_soc, dtype=float)
+    if consumption.ndim > 1:
+        capacity = capacity[..., np.newaxis] if capacity.ndim > 0 else capacity
+        initial_soc = initial_soc[..., np.newaxis] if initial_soc.ndim > 0 else initial_soc
+
+    soc = initial_soc - np.cumsum(consumption * dt / 3600, axis=-1) / capacity
+
+    # Energy exceeding the full battery is lost (reflection at the upper limit), consumption of the empty battery is
+    # not covered (reflection at the lower limit)
+    while True:
+        soc -= np.maximum(np.maximum.accumulate(soc - 1.0, axis=-1), 0.0)
+        if not np.any(soc < -1e-12):
+            break
+        soc += np.maximum(np.maximum.accumulate(-soc, axis=-1), 0.0)
+        if not np.any(soc > 1.0 + 1e-12):
+            break
+
+    return np.clip(soc, 0.0, 1.0)
+
+
+def calc_remaining_range(soc, capacity, consumption_per100km):
+    """ Estimate the remaining range of an electric car
+
+    Parameters
+    ----------
+    soc: float or numpy array
+        state of charge between 0 and 1
+    capacity: float or numpy array
+        usable battery capacity in kWh
+    consumption_per100km: float or numpy array
+        expected consumption in kWh per 100 km (e.g. from consumption_per100km)
+
+    Returns
+    -------
+    remaining range: float or numpy array
+        remaining range in km
+    """
+
+    return 100 * soc * capacity / consumption_per100km
@@ -0,0 +1,119 @@
+import numpy as np
+from vehicle_eco_balance.utils import segment_sum
+from vehicle_eco_balance.validation import as_float_array
+
+
+# Approximate CO2 emission factors of the electricity grid mix in kg/kWh (year 2019)
+grid_mixes = {
+    'germany': 0.408,
+    'eu': 0.275,
+    'france': 0.052
+}
+
+
+def get_emission_factor(vehicle, pollutant='co2', grid_mix=None):
+    """ Get the emission factor of a vehicle for a specific pollutant
+
+    For combustion engines the factor is taken from the vehicle (kg/l). For electric cars the factor depends on the
+    grid mix (kg/kWh) which can be given by name, as constant value or as time-varying numpy array.
+
+    Parameters
+    ----------
+    vehicle: class Vehicle
+        vehicle containing the fuel type and the emission factors
+    pollutant: str
+        pollutant, e.g. 'co2' (default 'co2')
+    grid_mix: str, float or numpy array
+        name of a grid mix in grid_mixes or emission factor of the grid mix in kg/kWh (only used for electric cars)
+
+    Returns
+    -------
+    emission_factor: float or numpy array
+        emission factor in kg/l (fuel) or kg/kWh (electric)
+    """
+
+    if vehicle.fuel_type == 'electric':
+        if grid_mix is None:
+            raise Exception("A grid mix is needed to calculate the emissions of electric cars!")
+        if isinstance(grid_mix, str):
+            if grid_mix not in grid_mixes:
+                raise Exception("grid_mix " + grid_mix + " is unknown!")
+            return grid_mixes[grid_mix]
+        return grid_mix
+
+    emission_factor = vehicle.emission_factors.get(pollutant)
+    if emission_factor is None:
+        raise Exception("No emission factor for pollutant " + pollutant + " available!")
+    return emission_factor
+
+
+def calc_emissions(consumption, emission_factor):
+    """ Calculate instantaneous emissions from instantaneous consumption
+
+    Parameters
+    ----------
+    consumption : numpy array
+        instantaneous consumption in l/h or kW
+    emission_factor: float or numpy array
+        emission factor in kg/l or kg/kWh, an array gives time-varying factors (one per sampling point)
+
+    Returns
+    -------
+    emissions: numpy array
+        instantaneous emissions in kg/h
+    """
+
+    return consumption * emission_factor
+
+
+def accumulate_emissions(consumption, dt, emission_factor, skipna=True, offsets=None):
+    """ Sum emissions over a whole track
+
+    The emissions are accumulated directly from the consumption in a single pass, i.e. without allocating an
+    intermediate array of instantaneous emissions (except for concatenated tracks).
+
+    Parameters
+    ----------
+    consumption : numpy array
+        instantaneous consumption in l/h or kW
+    dt : float or numpy array
+        interval times between measurements, a float for a uniform time step
+    emission_factor: float or numpy array
+        emission factor in kg/l or kg/kWh, an array gives time-varying factors (one per sampling point)
+    skipna: bool
+        ignore sampling points where consumption, dt or the emission factor is NaN (default True)
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks
+        (default None, i.e. a single track)
+
+    Returns
+    -------
+    accumulated emissions in kg (numpy array with one value per track if offsets are given), always summed in float64
+    """
+
+    consumption, dt, emission_factor = as_float_array(consumption), as_float_array(dt), as_float_array(emission_factor)
+
+    if offsets is not None:
+        emissions = consumption * dt * emission_factor / 3600
+        if skipna:
+            emissions[np.isnan(emissions)] = 0.0
+        return segment_sum(emissions, offsets)
+
+    # uniform time steps and factors are broadcast without copying
+    dt = np.broadcast_to(dt, consumption.shape)
+    if np.ndim(emission_factor) > 0:
+        emission_factor = np.broadcast_to(emission_factor, consumption.shape)
+    total = _weighted_sum(consumption, dt, emission_factor)
+    if skipna and np.isnan(total):
+        # NaN values are only searched for if the plain sum is NaN, i.e. clean input is not copied
+        valid = ~(np.isnan(consumption) | np.isnan(dt) | np.isnan(emission_factor))
+        total = _weighted_sum(consumption[valid], dt[valid],
+                              emission_factor[valid] if np.ndim(emission_factor) > 0 else emission_factor)
+    return total
+
+
+def _weighted_sum(consumption, dt, emission_factor):
+    """ Sum of consumption * dt * emission_factor in kg, accumulated in float64 """
+    if np.ndim(emission_factor) == 0:
+        return float(emission_factor) * np.einsum('i,i->', consumption, dt, dtype=np.float64) / 3600
+    return np.einsum('i,i,i->', consumption, dt, emission_factor, dtype=np.float64) / 3600
@@ -1,9 +1,17 @@
+import logging
 import numpy as np
 import requests as req
 from requests.exceptions import HTTPError
 import time
+import os
+import pickle
+from collections import OrderedDict
 from geopy import distance
 import osmnx as ox
+from vehicle_eco_balance.instrumentation import emit, count, stage
+from vehicle_eco_balance.utils import segment_starts, smoothing_windows, window_sum
+
+logger = logging.getLogger(__name__)
 
 
 def calc_gradient_angle(point1, point2):
@@ -61,7 +69,9 @@ def calc_distance(coord1, coord2, distance_type="geodetic", ellipsoid="WGS-84"):
     elif distance_type == "great-circle":
         return distance.great_circle(coord1, coord2).km * 1000
     else:
-        print("distance_type " + distance_type + " is unknown!")
+        message = "distance_type " + distance_type + " is unknown!"
+        logger.error(message)
+        emit('error', source='calc_distance', message=message)
 
 
 class ElevationAPI:
@@ -111,13 +121,15 @@ class ElevationAPI:
             self.base_url = self.base_url + dataset
         self.params = {'key': api_key}
 
-    def get_elevation(self, coordinates):
+    def get_elevation(self, coordinates, cache=None):
         """ Get elevation for the given coordinates from an elevation API
 
         Parameters
         ----------
         coordinates: list of tuples (latitude, longitude)
             coordinates in EPSG:4326 (WGS-84)
+        cache: class RouteCache
+            cache of already downloaded elevations, only missing coordinates are requested (default None)
 
         Returns
         -------
@@ -125,20 +137,35 @@ class ElevationAPI:
             elevation for each coordinate
         """
 
+        if cache is None:
+            return self._download_elevation(coordinates)
+
+        kind = 'elevation:' + self.base_url
+        values, missing = cache.lookup(kind, coordinates)
+        if len(missing) > 0:
+            downloaded = self._download_elevation([coordinates[i] for i in missing])
+            for i, value in zip(missing, downloaded):
+                values[i] = value
+            cache.update(kind, coordinates, values)
+
+        return np.array(values, dtype=float)
+
+    def _download_elevation(self, coordinates):
         elevation = np.zeros(len(coordinates))
 
         if self.location_limit is None:
-            print('Download elevation for all {} coordinates'.format(len(coordinates)))
-            elevation[0, len(coordinates)] = self._make_request(coordinates)
+            emit('elevation_download', start=1, end=len(coordinates))
+            elevation[:] = self._make_request(coordinates)
             return elevation
 
         # Split request into multiple requests if location limit is provided
         for i in range(int(len(coordinates) / self.location_limit) + 1):
             start = i * self.location_limit
             end = (i + 1) * self.location_limit
-            print('Download elevation for coordinates {start} to {end}'.format(start=start + 1, end=end))
+            emit('elevation_download', start=start + 1, end=min(end, len(coordinates)))
             elevation[start:end] = self._make_request(coordinates[start:end])
-            time.sleep(1)  # for OpenTopoData the limit is max 1 call per second
+            with stage('elevation_rate_limit_wait'):
+                time.sleep(1)  # for OpenTopoData the limit is max 1 call per second
 
         return elevation
 
@@ -147,13 +174,22 @@ class ElevationAPI:
         self.params.update({'locations': locations_str})
         elevation_list = []
 
+        count('api_calls', service='elevation')
+        count('points_requested', len(coordinates), service='elevation')
         try:
-            response = req.get(self.base_url, params=self.params)
-            response.raise_for_status()
+            with stage('elevation_request', points=len(coordinates)):
+                response = req.get(self.base_url, params=self.params)
+                response.raise_for_status()
         except HTTPError as http_err:
-            print('An http error occurred during the request: {}'.format(http_err))
+            message = 'An http error occurred during the request: {}'.format(http_err)
+            logger.error(message)
+            count('api_errors', service='elevation')
+            emit('error', source='elevation_request', message=message)
         except Exception as err:
-            print('An error occurred during the request: {}'.format(err))
+            message = 'An error occurred during the request: {}'.format(err)
+            logger.error(message)
+            count('api_errors', service='elevation')
+            emit('error', source='elevation_request', message=message)
         else:
             results = response.json()['results']
             elevation_list = [result['elevation'] for result in results]
@@ -165,7 +201,7 @@ class ElevationAPI:
         return ''.join([str(coordinate[0]) + ',' + str(coordinate[1]) + '|' for coordinate in coordinates])
 
 
-def get_cr_from_osm(coordinates):
+def get_cr_from_osm(coordinates, cache=None, return_edges=False):
     """ Get rolling coefficient (cr) from osm surface attribute
 
     1) Determine nearest osm edge for each coordinate
@@ -178,13 +214,38 @@ def get_cr_from_osm(coordinates):
     ----------
     coordinates: list of tuples (latitude, longitude)
         coordinates
+    cache: class RouteCache
+        cache of already matched coordinates, their cr values, surfaces and edges are reused and only missing
+        coordinates are matched (default None)
+    return_edges: bool
+        also return the matched osm edges (default False)
 
     Returns
     -------
     [cr, surface]: list of numpy arrays
-        first array are rolling coefficient (cr) values and second array are surface attributes
+        first array are rolling coefficient (cr) values and second array are surface attributes, with return_edges a
+        third list holds the osm edge (u, v, key) of each coordinate
     """
 
+    if cache is None:
+        cr, surface, edges = _match_cr_from_osm(coordinates)
+    else:
+        values, missing = cache.lookup('cr', coordinates)
+        if len(missing) > 0:
+            matched = _match_cr_from_osm([coordinates[i] for i in missing])
+            for i, value in zip(missing, zip(*matched)):
+                values[i] = value
+            cache.update('cr', coordinates, values)
+        cr = np.array([value[0] for value in values])
+        surface = np.array([value[1] for value in values])
+        edges = [value[2] for value in values]
+
+    if return_edges:
+        return [cr, surface, edges]
+    return [cr, surface]
+
+
+def _match_cr_from_osm(coordinates):
     # TODO: Improve performance
     # TODO: Check scientific literature for rolling coefficient values
 
@@ -198,17 +259,28 @@ def get_cr_from_osm(coordinates):
 
     ox.settings.useful_tags_way = ["surface"]
 
-    print('Get graph from bounding box: min_y={}, max_y={}, min_x={}, max_x={}'.format(min_y, max_y, min_x, max_x))
-    graph = ox.graph_from_bbox(max_y, min_y, max_x, min_x, network_type='drive')
+    with stage('osm_graph_download', min_y=min_y, max_y=max_y, min_x=min_x, max_x=max_x):
+        graph = ox.graph_from_bbox(max_y, min_y, max_x, min_x, network_type='drive')
+
+    with stage('osm_edge_matching', points=len(coordinates)):
+        cr, surface, edges = _match_edges(graph, coordinates)
+    count('points_matched', len(coordinates))
+
+    return [np.array(cr), np.array(surface), edges]
+
+
+def _match_edges(graph, coordinates):
+    """ Find nearest osm edge and set rolling coefficient according to the surface type of the edge """
 
     surface = []
     cr = []
+    edges = []
     i = 0
 
-    print('Find nearest osm edge and set rolling coefficient according to the surface type of the edge.')
     for lat, lng in coordinates:
 
         x = ox.get_nearest_edge(graph, (lat, lng))
+        edges.append(tuple(x[:3]))
         p = [x[0], x[1]]
         a = ox.utils_graph.get_route_edge_attributes(graph, p)
         dic = a[0]
@@ -232,4 +304,310 @@ def get_cr_from_osm(coordinates):
             cr.append(0.02)
         i = i + 1
 
-    return [np.array(cr), np.array(surface)]
+    return cr, surface, edges
+
+
+class RouteCache:
+    """
+    Cache for geo enrichment (elevation, rolling coefficient and OSM edges) of repeatedly driven roads
+
+    Values are stored per fine grid cell and grouped into coarse tiles, which are looked up independently. Tracks
+    that share only some segments with cached tracks (detours, other start or end points) therefore reuse the values
+    of the shared tiles and only coordinates in new cells have to be resolved, also if their sampling points differ.
+    The number of tiles is bounded (least recently used tiles are evicted) and the cache can be persisted to disk.
+
+    Parameters
+    ----------
+    max_tiles: int
+        maximum number of cached tiles (default 100000)
+    precision: int
+        number of decimal places of latitude/longitude of the cells storing the values (default 4, i.e. ~10 m)
+    tile_precision: int
+        number of decimal places of latitude/longitude of the tiles grouping the cells, at most precision (default 2,
+        i.e. ~1 km)
+    path: str
+        file the cache is loaded from (if it exists) and saved to (default None)
+
+    Attributes
+    ----------
+    tiles: OrderedDict
+        cached values per tile and kind, e.g. tiles[tile]['cr'][cell], ordered from least to most recently used
+    hits: int
+        number of coordinates found in the cache
+    misses: int
+        number of coordinates not found in the cache
+    changed: set
+        tiles updated since the cache was loaded or created (see merge)
+    """
+
+    def __init__(self, max_tiles=100000, precision=4, tile_precision=2, path=None):
+        if tile_precision > precision:
+            raise Exception("The tile_precision must not be larger than the precision!")
+        self.max_tiles = max_tiles
+        self.precision = precision
+        self.tile_precision = tile_precision
+        self.path = path
+        self.tiles = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.changed = set()
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as file:
+                self.tiles = pickle.load(file)
+
+    def lookup(self, kind, coordinates):
+        """ Look up cached values for coordinates
+
+        Parameters
+        ----------
+        kind: str
+            kind of the values, e.g. 'cr' or 'elevation'
+        coordinates: list of tuples (latitude, longitude)
+            coordinates of the track
+
+        Returns
+        -------
+        [values, missing]: list
+            list of values (None for coordinates not in the cache) and numpy array of indices of missing coordinates
+        """
+
+        values = [None] * len(coordinates)
+        for tile, indices, cells in self._group(coordinates):
+            entry = self.tiles.get(tile)
+            if entry is None or kind not in entry:
+                continue
+            self.tiles.move_to_end(tile)
+            cached = entry[kind]
+            for i, cell in zip(indices, cells):
+                values[i] = cached.get(cell)
+
+        missing = np.array([i for i, value in enumerate(values) if value is None], dtype=int)
+        self.hits += len(coordinates) - len(missing)
+        self.misses += len(missing)
+        count('cache_hits', len(coordinates) - len(missing), cache='route')
+        count('cache_misses', len(missing), cache='route')
+
+        return [values, missing]
+
+    def update(self, kind, coordinates, values):
+        """ Store values for coordinates
+
+        Parameters
+        ----------
+        kind: str
+            kind of the values, e.g. 'cr' or 'elevation'
+        coordinates: list of tuples (latitude, longitude)
+            coordinates of the track
+        values: list
+            one value per coordinate
+        """
+
+        for tile, indices, cells in self._group(coordinates):
+            entry = self.tiles.setdefault(tile, {})
+            self.tiles.move_to_end(tile)
+            entry.setdefault(kind, {}).update(zip(cells, (values[i] for i in indices)))
+            self.changed.add(tile)
+
+        self._evict()
+
+    def merge(self, tiles):
+        """ Merge cached tiles, e.g. the changed tiles of a cache in another process
+
+        Example:
+            changes = {tile: worker_cache.tiles[tile] for tile in worker_cache.changed if tile in worker_cache.tiles}
+            cache.merge(changes)
+
+        Parameters
+        ----------
+        tiles: dictionary
+            cached values per tile (see attribute tiles)
+        """
+
+        for tile, entry in tiles.items():
+            cached = self.tiles.setdefault(tile, {})
+            self.tiles.move_to_end(tile)
+            for kind, values in entry.items():
+                cached.setdefault(kind, {}).update(values)
+            self.changed.add(tile)
+
+        self._evict()
+
+    def save(self, path=None):
+        """ Save the cache to disk (default path is the path given at initialization) """
+
+        path = self.path if path is None else path
+        if path is None:
+            raise Exception("No path given to save the route cache!")
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(self.tiles, file)
+        os.replace(path + '.tmp', path)
+
+    def _evict(self):
+        """ Remove the least recently used tiles if the cache is full """
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+
+    def _group(self, coordinates):
+        """ Cells of the coordinates grouped by tile: list of [tile, indices, cells] """
+        cells = np.round(np.asarray(coordinates, dtype=float).reshape(len(coordinates), -1)[:, :2] *
+                         10 ** self.precision).astype(np.int64)
+        # Tiles are derived from the cells, so that a cell always belongs to the same tile
+        tiles = np.floor_divide(cells, 10 ** (self.precision - self.tile_precision))
+        groups = {}
+        for i, (tile, cell) in enumerate(zip(map(tuple, tiles.tolist()), map(tuple, cells.tolist()))):
+            group = groups.setdefault(tile, [[], []])
+            group[0].append(i)
+            group[1].append(cell)
+        return [[tile, indices, cells] for tile, (indices, cells) in groups.items()]
+
+
+def calc_distance_array(lats, lngs, radius=6371000.0, offsets=None):
+    """ Calculate distances between consecutive points on the earth's surface
+
+    Vectorized alternative to calc_distance for whole tracks. The distance is calculated using the haversine formula
+    for a spherical earth.
+
+    Parameters
+    ----------
+    lats: numpy array
+        latitudes in degrees
+    lngs: numpy array
+        longitudes in degrees
+    radius: float
+        earth radius in meters (default 6371000.0)
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks
+        (default None, i.e. a single track)
+
+    Returns
+    -------
+    distance: numpy array
+        distance in meters between each point and its predecessor (0 for the first point of each track)
+    """
+
+    lats = np.radians(lats)
+    lngs = np.radians(lngs)
+
+    distance = np.zeros(len(lats))
+    a = np.square(np.sin(np.diff(lats) / 2)) + \
+        np.cos(lats[:-1]) * np.cos(lats[1:]) * np.square(np.sin(np.diff(lngs) / 2))
+    distance[1:] = 2 * radius * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    if offsets is not None:
+        starts = np.asarray(offsets[:-1])
+        distance[starts[starts < len(distance)]] = 0.0
+
+    return distance
+
+
+def calc_gradient_angle_array(lats, lngs, altitudes, offsets=None, dtype=None):
+    """ Calculate gradient angles between consecutive points on the earth's surface
+
+    Vectorized alternative to calc_gradient_angle for whole tracks.
+
+    Parameters
+    ----------
+    lats: numpy array
+        latitudes in degrees
+    lngs: numpy array
+        longitudes in degrees
+    altitudes: numpy array
+        altitudes in meters
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks
+        (default None, i.e. a single track)
+    dtype: numpy dtype
+        float type of the result, e.g. np.float32; the calculation is always done in float64 because differences of
+        coordinates need its precision (default None, i.e. float64)
+
+    Returns
+    -------
+    gradient_angle: numpy array
+        gradient angle in radians between each point and its predecessor (0 for the first point of each track and for
+        points without horizontal distance)
+    """
+
+    dist = calc_distance_array(lats, lngs, offsets=offsets)
+
+    gradient_angle = np.zeros(len(dist))
+    np.arctan(np.divide(np.diff(altitudes), dist[1:], out=np.zeros(len(dist) - 1), where=dist[1:] != 0),
+              out=gradient_angle[1:])
+
+    return gradient_angle if dtype is None else gradient_angle.astype(dtype)
+
+
+def calc_cumulative_distance(lats, lngs, offsets=None):
+    """ Calculate the cumulative distance along a track
+
+    Parameters
+    ----------
+    lats: numpy array
+        latitudes in degrees
+    lngs: numpy array
+        longitudes in degrees
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks
+        (default None, i.e. a single track)
+
+    Returns
+    -------
+    distance: numpy array
+        distance in meters from the first point of the (respective) track
+    """
+
+    distance = np.cumsum(calc_distance_array(lats, lngs, offsets=offsets))
+    if offsets is not None:
+        distance -= np.repeat(distance[segment_starts(offsets)], np.diff(offsets))
+
+    return distance
+
+
+def calc_gradient_angle_smoothed(distance, altitudes, window=100.0, offsets=None, dtype=None):
+    """ Estimate gradient angles from an elevation profile smoothed over a distance window
+
+    For each point a straight line is fitted (least squares) to all points whose distance along the track lies within
+    +/- window/2 of the point. The gradient angle is the arctangent of the slope of this line. In contrast to
+    calc_gradient_angle the estimate does not depend on the sampling rate, i.e. altitude noise is not amplified at low
+    speed. The window sums are calculated from cumulative sums, so the runtime does not depend on the window size.
+
+    Parameters
+    ----------
+    distance: numpy array
+        cumulative distance along the track in meters (non-decreasing, see calc_cumulative_distance)
+    altitudes: numpy array
+        altitudes in meters, a 2d array holds one altitude profile per row (e.g. samples of a Monte Carlo simulation)
+    window: float
+        length of the distance window in meters (default 100.0)
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks, the windows do not
+        cross track boundaries (default None, i.e. a single track)
+    dtype: numpy dtype
+        float type of the result, e.g. np.float32; the cumulative sums are always calculated in float64
+        (default None, i.e. float64)
+
+    Returns
+    -------
+    gradient_angle: numpy array
+        gradient angle in radians for each point (0 where the window contains no horizontal distance)
+    """
+
+    distance = np.asarray(distance, dtype=float)
+    altitudes = np.asarray(altitudes, dtype=float)
+
+    if len(distance) != altitudes.shape[-1]:
+        raise Exception("The arrays distance and altitudes must have the same length!")
+
+    lower, upper, distance = smoothing_windows(distance, window, offsets)
+
+    n = upper - lower
+    sum_s = window_sum(distance, lower, upper)
+    sum_h = window_sum(altitudes, lower, upper)
+    sum_ss = window_sum(distance * distance, lower, upper)
+    sum_sh = window_sum(distance * altitudes, lower, upper)
+
+    var_s = sum_ss - sum_s * sum_s / n
+    cov_sh = sum_sh - sum_s * sum_h / n
+
+    slope = np.divide(cov_sh, var_s, out=np.zeros(cov_sh.shape), where=var_s > 1e-9 * n)
+
+    return np.arctan(slope) if dtype is None else np.arctan(slope).astype(dtype)
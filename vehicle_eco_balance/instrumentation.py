@@ -0,0 +1,214 @@
+import time
+import logging
+import tracemalloc
+
+_callbacks = []
+_memory_peaks = []
+_track_memory = False
+
+
+def add_callback(callback):
+    """ Register a callback for instrumentation events
+
+    Instrumentation is disabled as long as no callback is registered. Each event is passed to the callback as
+    dictionary with at least the keys 'event' ('stage', 'counter' or a specific event name) and 'time'
+    (unix timestamp). Stage events additionally contain 'name', 'duration' in seconds and, if memory tracking is
+    enabled, 'peak_memory' in bytes. Counter events contain 'name' and 'value'.
+
+    Parameters
+    ----------
+    callback: callable
+        function called with the event dictionary
+    """
+
+    if callback not in _callbacks:
+        _callbacks.append(callback)
+
+
+def remove_callback(callback):
+    """ Unregister a callback for instrumentation events """
+
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+def is_enabled():
+    """ Check whether instrumentation is enabled (i.e. at least one callback is registered) """
+    return len(_callbacks) > 0
+
+
+def set_memory_tracking(enabled):
+    """ Enable or disable the capture of peak memory per stage using tracemalloc
+
+    Tracing memory allocations slows down Python code considerably, so it should only be enabled for profiling runs.
+    Nested stages report the peak including the allocations of their inner stages.
+
+    Parameters
+    ----------
+    enabled: bool
+        True to start tracemalloc and capture peak memory, False to stop it
+    """
+
+    global _track_memory
+    _track_memory = enabled
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def emit(event, **fields):
+    """ Send an event to all registered callbacks
+
+    Parameters
+    ----------
+    event: str
+        event name
+    fields: dictionary
+        additional event fields
+    """
+
+    if not _callbacks:
+        return
+    fields['event'] = event
+    fields['time'] = time.time()
+    for callback in list(_callbacks):
+        callback(fields)
+
+
+def count(name, value=1, **fields):
+    """ Increase a counter (e.g. points processed, API calls, cache hits) by value """
+
+    if _callbacks:
+        emit('counter', name=name, value=value, **fields)
+
+
+def stage(name, **fields):
+    """ Measure the duration of a pipeline stage
+
+    To be used as context manager, e.g. `with stage('elevation_request', points=100): ...`. If instrumentation is
+    disabled a shared no-op context manager is returned.
+
+    Parameters
+    ----------
+    name: str
+        stage name
+    fields: dictionary
+        additional event fields
+
+    Returns
+    -------
+    context manager
+    """
+
+    if not _callbacks:
+        return _NO_STAGE
+    return _Stage(name, fields)
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class _Stage:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.start = None
+
+    def __enter__(self):
+        if _track_memory and tracemalloc.is_tracing():
+            if _memory_peaks:
+                _memory_peaks[-1] = max(_memory_peaks[-1], tracemalloc.get_traced_memory()[1])
+            _reset_peak()
+            _memory_peaks.append(0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        duration = time.perf_counter() - self.start
+        if _track_memory and tracemalloc.is_tracing() and _memory_peaks:
+            peak = max(_memory_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if _memory_peaks:
+                _memory_peaks[-1] = max(_memory_peaks[-1], peak)
+            self.fields['peak_memory'] = peak
+        emit('stage', name=self.name, duration=duration, **self.fields)
+        return False
+
+
+def _reset_peak():
+    # tracemalloc.reset_peak is available since Python 3.9, before clear_traces resets the peak as well (the peak then
+    # only counts the allocations of the stage instead of the memory in use plus these allocations)
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.clear_traces()
+
+
+def log_event(event):
+    """ Callback writing events to the logger 'vehicle_eco_balance' (level INFO) """
+
+    fields = ', '.join('{}={}'.format(key, value) for key, value in event.items() if key not in ('event', 'time'))
+    logging.getLogger('vehicle_eco_balance').info('%s: %s', event['event'], fields)
+
+
+class Metrics:
+    """
+    Callback aggregating instrumentation events
+
+    Example:
+        metrics = Metrics()
+        add_callback(metrics)
+        ...
+        remove_callback(metrics)
+        print(metrics.summary())
+
+    Parameters
+    ----------
+    keep_events: bool
+        keep all received events in the attribute events (default False)
+
+    Attributes
+    ----------
+    stages: dictionary
+        per stage name: number of calls, total duration in seconds and maximum peak memory in bytes
+    counters: dictionary
+        per counter name: total value
+    events: list of dictionaries
+        all received events (only if keep_events is True)
+    """
+
+    def __init__(self, keep_events=False):
+        self.keep_events = keep_events
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+
+    def __call__(self, event):
+        if self.keep_events:
+            self.events.append(event)
+        if event['event'] == 'stage':
+            stats = self.stages.setdefault(event['name'], {'calls': 0, 'duration': 0.0, 'peak_memory': None})
+            stats['calls'] += 1
+            stats['duration'] += event['duration']
+            if 'peak_memory' in event:
+                stats['peak_memory'] = max(stats['peak_memory'] or 0, event['peak_memory'])
+        elif event['event'] == 'counter':
+            self.counters[event['name']] = self.counters.get(event['name'], 0) + event['value']
+
+    def summary(self):
+        """ Summary of stages and counters as dictionary """
+        return {'stages': {name: dict(stats) for name, stats in self.stages.items()}, 'counters': dict(self.counters)}
+
+    def reset(self):
+        """ Remove all collected values """
+        self.stages = {}
+        self.counters = {}
+        self.events = []
@@ -1,15 +1,20 @@
 import numpy as np
 
 
-def calc_acceleration(speed, dt):
+def calc_acceleration(speed, dt, offsets=None, dtype=None):
     """ Calculate acceleration from speed and time
 
     Parameters
     ----------
     speed: numpy array
        speed in km/h
-    dt: numpy array
-       interval times between measurements in seconds
+    dt: numpy array or float
+       interval times between measurements in seconds, a float for a constant sampling time (uniform time base)
+    offsets: numpy array
+       start index of each track and the total length as last element for concatenated tracks, the acceleration is 0
+       at the first point of each track (default None, i.e. a single track)
+    dtype: numpy dtype
+       float type of the calculation and the result, e.g. np.float32 (default None, i.e. float64)
 
     Returns
     -------
@@ -17,17 +22,28 @@ def calc_acceleration(speed, dt):
         acceleration in m/s²
     """
 
-    # Check if arrays are of same length
-    if len(speed) != len(dt):
-        raise Exception("The arrays speed and dt must have the same length!")
-
     # Convert speed from km/h to m/s
-    speed = speed / 3.6
-
-    # Calculate acceleration
-    acceleration = np.zeros(len(speed))
-    for i in range(1, len(speed)):
-        if dt[i] != 0.0:
-            acceleration[i] = ((speed[i] - speed[i-1]) / dt[i])
+    dtype = float if dtype is None else dtype
+    speed = np.asarray(speed, dtype=dtype) / 3.6
+
+    acceleration = np.zeros(len(speed), dtype=dtype)
+
+    if np.ndim(dt) == 0:
+        # Constant sampling time
+        if dt != 0.0:
+            acceleration[1:] = np.diff(speed) / dt
+    else:
+        # Check if arrays are of same length
+        if len(speed) != len(dt):
+            raise Exception("The arrays speed and dt must have the same length!")
+
+        # Calculate acceleration, intervals with dt = 0 are skipped
+        dt = np.asarray(dt)
+        np.divide(np.diff(speed), dt[1:], out=acceleration[1:], where=dt[1:] != 0.0)
+
+    # Reset the acceleration at the track boundaries
+    if offsets is not None:
+        starts = np.asarray(offsets[:-1])
+        acceleration[starts[starts < len(acceleration)]] = 0.0
 
     return acceleration
@@ -0,0 +1,249 @@
+import numpy as np
+from vehicle_eco_balance.geo import calc_distance_array
+
+
+def to_seconds(time):
+    """ Convert points in time to seconds since the first point in time
+
+    Parameters
+    ----------
+    time: numpy array
+        seconds (float), numpy datetime64 or strings in the format 2020-07-10T07:14:51
+
+    Returns
+    -------
+    seconds: numpy array
+        seconds since the first point in time
+    """
+
+    time = np.asarray(time)
+    if time.dtype.kind in 'UO':
+        time = time.astype('datetime64[s]')
+    if time.dtype.kind == 'M':
+        return (time - time[0]) / np.timedelta64(1, 's')
+    return time.astype(float) - time[0]
+
+
+def drop_duplicates(time, *arrays):
+    """ Sort measurements by time and drop measurements with duplicate timestamps
+
+    The first measurement of each timestamp is kept.
+
+    Parameters
+    ----------
+    time: numpy array
+        time in seconds
+    arrays: numpy arrays
+        measurements (e.g. speed, latitude, longitude, altitude) with the same length as time
+
+    Returns
+    -------
+    [time, *arrays]: list of numpy arrays
+        sorted measurements without duplicate timestamps
+    """
+
+    time = np.asarray(time)
+    order = np.argsort(time, kind='stable')
+    time = time[order]
+    keep = np.ones(len(time), dtype=bool)
+    keep[1:] = np.diff(time) != 0
+
+    return [time[keep]] + [np.asarray(array)[order][keep] for array in arrays]
+
+
+def median_filter(values, window=5):
+    """ Apply a moving median filter
+
+    Parameters
+    ----------
+    values: numpy array
+        values to filter
+    window: int
+        odd number of samples in the moving window (default 5)
+
+    Returns
+    -------
+    filtered values: numpy array
+        the borders are padded with the first and last value respectively
+    """
+
+    if window % 2 != 1:
+        raise Exception("The window of the median filter must be odd!")
+
+    values = np.asarray(values, dtype=float)
+    if window == 1 or len(values) == 0:
+        return values.copy()
+    padded = np.pad(values, window // 2, mode='edge')
+
+    return np.median(np.lib.stride_tricks.sliding_window_view(padded, window), axis=1)
+
+
+def find_outliers(time, speed=None, lats=None, lngs=None, altitudes=None, max_speed=250.0, max_acceleration=10.0,
+                  max_altitude_deviation=20.0, median_window=5, max_gradient=0.35, min_gradient_distance=10.0):
+    """ Find outliers in a track
+
+    A measurement is marked as outlier if
+    1) its speed is negative or exceeds max_speed,
+    2) the acceleration to or from the measurement exceeds max_acceleration,
+    3) the speed implied by the distance to the previous and to the next position exceeds max_speed (teleport),
+    4) its altitude deviates more than max_altitude_deviation from the moving median of the altitude,
+    5) the gradient (altitude difference per distance) to the previous and to the next measurement exceeds
+       max_gradient; the distance is taken from the positions or, without positions, from the speed.
+
+    Parameters
+    ----------
+    time: numpy array
+        time in seconds (sorted, without duplicates)
+    speed: numpy array
+        speed in km/h (default None)
+    lats: numpy array
+        latitudes in degrees (default None)
+    lngs: numpy array
+        longitudes in degrees (default None)
+    altitudes: numpy array
+        altitudes in m (default None)
+    max_speed: float
+        maximum speed in km/h (default 250.0)
+    max_acceleration: float
+        maximum absolute acceleration in m/s² (default 10.0)
+    max_altitude_deviation: float
+        maximum deviation from the moving median of the altitude in m (default 20.0)
+    median_window: int
+        odd number of samples of the moving median (default 5)
+    max_gradient: float
+        maximum absolute gradient as altitude difference per distance, e.g. 0.35 for 35 % (default 0.35)
+    min_gradient_distance: float
+        distance in m the gradient of shorter steps is related to, so that altitude noise while standing is no
+        outlier (default 10.0)
+
+    Returns
+    -------
+    outliers: numpy array
+        boolean mask, True for outliers
+    """
+
+    time = np.asarray(time, dtype=float)
+    outliers = np.zeros(len(time), dtype=bool)
+    dt = np.diff(time)
+
+    if speed is not None:
+        speed = np.asarray(speed, dtype=float)
+        outliers |= (speed < 0) | (speed > max_speed)
+        jump = np.abs(np.diff(speed) / 3.6) > max_acceleration * dt
+        outliers |= _mark_jumps(jump)
+
+    distance = None
+    if lats is not None and lngs is not None:
+        distance = calc_distance_array(lats, lngs)[1:]
+        jump = distance > max_speed / 3.6 * dt
+        outliers |= _mark_jumps(jump)
+    elif speed is not None:
+        distance = speed[1:] / 3.6 * dt
+
+    if altitudes is not None:
+        altitudes = np.asarray(altitudes, dtype=float)
+        outliers |= np.abs(altitudes - median_filter(altitudes, median_window)) > max_altitude_deviation
+        if distance is not None:
+            jump = np.abs(np.diff(altitudes)) > max_gradient * np.maximum(distance, min_gradient_distance)
+            outliers |= _mark_jumps(jump)
+
+    return outliers
+
+
+def _mark_jumps(jump):
+    """ Mark measurements whose transitions to the previous and to the next measurement are both implausible """
+
+    outliers = np.zeros(len(jump) + 1, dtype=bool)
+    if len(jump) == 0:
+        return outliers
+    outliers[1:-1] = jump[:-1] & jump[1:]
+    # The first and last measurements only have one neighbour
+    outliers[0] = jump[0]
+    outliers[-1] = jump[-1]
+    return outliers
+
+
+def resample(time, step, *arrays):
+    """ Resample measurements to a uniform time base by linear interpolation
+
+    Parameters
+    ----------
+    time: numpy array
+        time in seconds (sorted, without duplicates)
+    step: float
+        sampling time of the uniform time base in seconds
+    arrays: numpy arrays
+        measurements with the same length as time
+
+    Returns
+    -------
+    [time, *arrays]: list of numpy arrays
+        resampled time and measurements
+    """
+
+    time = np.asarray(time, dtype=float)
+    new_time = np.arange(time[0], time[-1] + step / 2, step)
+
+    return [new_time] + [np.interp(new_time, time, array) for array in arrays]
+
+
+def clean_track(time, speed, lats=None, lngs=None, altitudes=None, step=1.0, median_window=5, **kwargs):
+    """ Clean a track before applying the consumption models
+
+    1) Sort the measurements and drop duplicate timestamps
+    2) Drop outliers (see find_outliers)
+    3) Smooth the altitude by a moving median
+    4) Resample all measurements to a uniform time base
+
+    Parameters
+    ----------
+    time: numpy array
+        seconds (float), numpy datetime64 or strings in the format 2020-07-10T07:14:51
+    speed: numpy array
+        speed in km/h
+    lats: numpy array
+        latitudes in degrees (default None)
+    lngs: numpy array
+        longitudes in degrees (default None)
+    altitudes: numpy array
+        altitudes in m (default None)
+    step: float
+        sampling time of the uniform time base in seconds, None for no resampling (default 1.0)
+    median_window: int
+        odd number of samples of the moving median (default 5)
+    kwargs: dictionary
+        bounds passed to find_outliers (max_speed, max_acceleration, max_altitude_deviation, max_gradient,
+        min_gradient_distance)
+
+    Returns
+    -------
+    track: dictionary
+        'time', 'dt', 'speed' and, if given, 'lats', 'lngs', 'altitudes' as numpy arrays.
+        With resampling, dt is constant (except for the first value which is 0) and step can be passed to
+        calc_acceleration directly.
+    """
+
+    names = [name for name, column in zip(['speed', 'lats', 'lngs', 'altitudes'], [speed, lats, lngs, altitudes])
+             if column is not None]
+    columns = [column for column in [speed, lats, lngs, altitudes] if column is not None]
+
+    time, *columns = drop_duplicates(to_seconds(time), *columns)
+    track = dict(zip(names, columns))
+
+    outliers = find_outliers(time, track.get('speed'), track.get('lats'), track.get('lngs'), track.get('altitudes'),
+                             median_window=median_window, **kwargs)
+    time = time[~outliers]
+    track = {name: column[~outliers] for name, column in track.items()}
+
+    if 'altitudes' in track:
+        track['altitudes'] = median_filter(track['altitudes'], median_window)
+
+    if step is not None and len(time) > 1:
+        time, *columns = resample(time, step, *[track[name] for name in names])
+        track = dict(zip(names, columns))
+
+    track['time'] = time
+    track['dt'] = np.zeros(len(time))
+    track['dt'][1:] = np.diff(time)
+
+    return track
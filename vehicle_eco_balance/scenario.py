@@ -0,0 +1,282 @@
+import copy
+import numpy as np
+from vehicle_eco_balance.consumption import ConsumptionPhys
+from vehicle_eco_balance.kinematics import calc_acceleration
+from vehicle_eco_balance.utils import calc_efficiency, segment_sum
+from vehicle_eco_balance.validation import validate_arrays, as_float_array, check_gradient_angle
+
+
+class Scenario:
+    """
+    Intervention on a base trajectory and vehicle for class ScenarioEngine
+
+    Example:
+        lighter = Scenario('200 kg lighter', mass_change=-200)
+        capped = Scenario('100 km/h', speed_limit=100)
+        dem = Scenario('DEM gradient', gradient_angle=gradient_angle_dem)
+
+    Parameters
+    ----------
+    name: str
+        name of the scenario
+    mass_change: float
+        change of the vehicle mass in kg, e.g. -200 for a 200 kg lighter vehicle (default 0.0)
+    vehicle: dictionary
+        new values of vehicle attributes (class Car), e.g. {'cw': 0.27, 'idle_power': 1.5} (default None)
+    cr: float or numpy array
+        rolling resistance coefficient replacing the one of the base trajectory (default None)
+    speed_limit: float or numpy array
+        positive speed limit in km/h, an array holds a limit per sampling point (e.g. np.inf outside of a corridor);
+        the interval times of capped points are stretched by speed / capped speed, so that the distance of each
+        interval and thus the route is kept, and the acceleration is recalculated from the capped speed (default None)
+    gradient_angle: numpy array
+        gradient angle in radians replacing the one of the base trajectory, e.g. from a digital elevation model
+        (default None)
+
+    Attributes
+    ----------
+    identical to parameters
+    """
+
+    def __init__(self, name, mass_change=0.0, vehicle=None, cr=None, speed_limit=None, gradient_angle=None):
+        if speed_limit is not None and not np.all(np.asarray(speed_limit, dtype=float) > 0):
+            # a limit of 0 would stretch the interval times infinitely
+            raise Exception("The speed_limit must be positive (np.inf for no limit)!")
+        self.name = name
+        self.mass_change = mass_change
+        self.vehicle = vehicle or {}
+        self.cr = cr
+        self.speed_limit = speed_limit
+        self.gradient_angle = gradient_angle
+
+
+class ScenarioEngine:
+    """
+    Evaluation of many scenarios (class Scenario) against a base trajectory with the physical consumption model
+
+    The driving resistance is decomposed into terms which are calculated once per distinct input and reused:
+    aerodynamic drag depends only on speed (and cw * cross section), rolling and climbing resistance only on the
+    gradient angle (and cr), inertial resistance only on the acceleration. E.g. for a mass change only the mass is
+    multiplied with the cached terms, for a speed limit speed, acceleration and aerodynamic drag are derived from the
+    capped speed (with stretched interval times) while the gradient terms are reused. Modified inputs are derived
+    lazily on first use and cached.
+    Scenarios with the same inputs are evaluated in one pass as a matrix (scenarios x sampling points).
+
+    Example:
+        engine = ScenarioEngine(speed, dt, gradient_angle, Car(), offsets=offsets)
+        results = engine.evaluate([Scenario('200 kg lighter', mass_change=-200), Scenario('100 km/h', speed_limit=100)])
+        results['delta_percent']
+
+    Parameters
+    ----------
+    speed: numpy array
+        vehicle speed in km/h
+    dt: numpy array
+        interval times between measurements in seconds
+    gradient_angle: numpy array
+        gradient angle (of the road) in radians
+    vehicle: class Car
+        base vehicle
+    cr: float or numpy array
+        rolling resistance coefficient (default 0.02)
+    acceleration: numpy array
+        vehicle acceleration in m/s² (default None, i.e. calculated from speed and dt)
+    model: class ConsumptionPhys
+        model defining consumption type, g and rho_air (default ConsumptionPhys('fuel'))
+    offsets: numpy array
+        start index of each track and the total length as last element for concatenated tracks, results are reported
+        per track (default None, i.e. a single track)
+    max_elements: int
+        maximum number of matrix elements (scenarios x sampling points) evaluated at once (default 2**23)
+    """
+
+    def __init__(self, speed, dt, gradient_angle, vehicle, cr=0.02, acceleration=None, model=None, offsets=None,
+                 max_elements=2 ** 23):
+        speed, dt, gradient_angle = validate_arrays(['speed', 'dt', 'gradient_angle'], speed, dt, gradient_angle)
+        check_gradient_angle(gradient_angle)
+
+        self.speed = speed
+        self.dt = dt
+        self.gradient_angle = gradient_angle
+        self.vehicle = vehicle
+        self.cr = as_float_array(cr)
+        self.acceleration = acceleration
+        self.model = model if model is not None else ConsumptionPhys('fuel')
+        self.offsets = offsets
+        self.max_elements = max_elements
+
+        # Cached terms per speed limit and per gradient angle (None for the base trajectory)
+        self._speed_terms = {}
+        self._gradient_terms = {}
+
+    def evaluate(self, scenarios, keep_consumption=False):
+        """ Evaluate scenarios and compare them to the baseline
+
+        Parameters
+        ----------
+        scenarios: list of class Scenario
+            scenarios to evaluate
+        keep_consumption: bool
+            return the instantaneous consumption of all scenarios as matrix (default False)
+
+        Returns
+        -------
+        results: dictionary
+            'scenario': names (the baseline first),
+            'total': consumption in l or kWh,
+            'distance': distance in km,
+            'consumption_per100km': consumption in l or kWh per 100 km,
+            'delta', 'delta_per100km': difference to the baseline in l or kWh (per 100 km),
+            'delta_percent': relative difference of the total to the baseline in percent,
+            'consumption': consumption in l/h or kW (scenarios x sampling points, only if keep_consumption is True);
+            one row per scenario, with offsets one column per track
+        """
+
+        scenarios = [Scenario('baseline')] + list(scenarios)
+        n_tracks = None if self.offsets is None else len(self.offsets) - 1
+        shape = (len(scenarios),) if n_tracks is None else (len(scenarios), n_tracks)
+        total = np.empty(shape)
+        distance = np.empty(shape)
+        consumption = np.empty((len(scenarios), len(self.speed))) if keep_consumption else None
+
+        # Scenarios with the same speed and gradient inputs are evaluated together
+        groups = {}
+        for i, scenario in enumerate(scenarios):
+            groups.setdefault((self._key(scenario.speed_limit), self._key(scenario.gradient_angle)), []).append(i)
+
+        batch_size = max(1, self.max_elements // max(1, len(self.speed)))
+        for indices in groups.values():
+            first = scenarios[indices[0]]
+            speed_terms = self._get_speed_terms(first.speed_limit)
+            gradient_terms = self._get_gradient_terms(first.gradient_angle)
+            distance[indices] = self._sum(speed_terms['speed_kmh'], speed_terms['dt'])
+            for start in range(0, len(indices), batch_size):
+                batch = indices[start:start + batch_size]
+                values = self._calculate(speed_terms, gradient_terms, [scenarios[i] for i in batch])
+                total[batch] = self._sum(values, speed_terms['dt'])
+                if keep_consumption:
+                    consumption[batch] = values
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            per100km = 100 * total / distance
+            results = {
+                'scenario': [scenario.name for scenario in scenarios],
+                'total': total,
+                'distance': distance,
+                'consumption_per100km': per100km,
+                'delta': total - total[0],
+                'delta_per100km': per100km - per100km[0],
+                'delta_percent': 100 * (total - total[0]) / total[0]
+            }
+        if keep_consumption:
+            results['consumption'] = consumption
+
+        return results
+
+    def _calculate(self, speed_terms, gradient_terms, scenarios):
+        """ Calculate the consumption of scenarios with the same inputs as matrix (scenarios x sampling points) """
+
+        vehicles = [self._create_vehicle(scenario) for scenario in scenarios]
+        fuel_types = {vehicle.fuel_type for vehicle in vehicles}
+        if len(fuel_types) > 1:
+            raise Exception("All scenarios must have the same fuel type!")
+
+        def column(name):
+            return np.array([getattr(vehicle, name) for vehicle in vehicles], dtype=float)[:, np.newaxis]
+
+        # Aerodynamic drag: cached per speed, only scaled by cw * cross section
+        drag_area = column('cw') * column('cross_section')
+        if np.all(drag_area == drag_area[0]):
+            drag_area = drag_area[0]
+        aerodynamic_drag = drag_area * speed_terms['drag']
+
+        # Rolling, climbing and inertial resistance per kg: cached per input, recalculated only for changed cr
+        crs = [self.cr if scenario.cr is None else as_float_array(scenario.cr) for scenario in scenarios]
+        if all(cr is crs[0] for cr in crs):
+            cr = crs[0]
+        else:
+            cr = np.stack([np.broadcast_to(cr, self.speed.shape) for cr in crs])
+        mass_terms = cr * gradient_terms['rolling'] + gradient_terms['climbing'] + speed_terms['acceleration']
+
+        driving_resistance = aerodynamic_drag + column('mass') * mass_terms
+
+        efficiency = calc_efficiency(driving_resistance, -2000, 2000, column('min_efficiency'),
+                                     column('max_efficiency'))
+        power = self.model.calc_engine_power(speed_terms['speed'], driving_resistance, column('idle_power'),
+                                             fuel_types.pop())
+        if self.model.consumption_type == 'energy':
+            return power / efficiency
+        return power / (column('calorific_value') * efficiency)
+
+    def _get_speed_terms(self, speed_limit):
+        """ Speed (km/h and m/s), interval times, acceleration and aerodynamic drag per drag area for a speed limit
+        (cached) """
+
+        key = self._key(speed_limit)
+        if not self._is_cached(self._speed_terms, key, speed_limit):
+            speed = self.speed
+            dt = self.dt
+            acceleration = self.acceleration
+            if speed_limit is not None:
+                speed = np.minimum(speed, speed_limit)
+                # Same distance per interval at the capped speed
+                capped = speed < self.speed
+                dt = np.where(capped, self.dt * self.speed / np.where(capped, speed, 1.0), self.dt)
+                acceleration = None
+            if acceleration is None:
+                acceleration = calc_acceleration(speed, dt, offsets=self.offsets)
+            speed_ms = speed / 3.6
+            self._speed_terms[key] = [speed_limit, {
+                'speed_kmh': speed,
+                'dt': dt,
+                'speed': speed_ms,
+                'acceleration': np.asarray(acceleration, dtype=float),
+                'drag': 0.5 * self.model.rho_air * speed_ms * speed_ms
+            }]
+        return self._speed_terms[key][1]
+
+    def _get_gradient_terms(self, gradient_angle):
+        """ Rolling (per cr) and climbing resistance per kg for a gradient angle (cached) """
+
+        key = self._key(gradient_angle)
+        if not self._is_cached(self._gradient_terms, key, gradient_angle):
+            values = self.gradient_angle
+            if gradient_angle is not None:
+                values, = validate_arrays(['gradient_angle'], gradient_angle)
+                check_gradient_angle(values)
+                if values.shape != self.speed.shape:
+                    raise Exception("The gradient_angle of a scenario must have the length of the base trajectory!")
+            self._gradient_terms[key] = [gradient_angle, {
+                'rolling': self.model.g * np.cos(values),
+                'climbing': self.model.g * np.sin(values)
+            }]
+        return self._gradient_terms[key][1]
+
+    def _create_vehicle(self, scenario):
+        vehicle = copy.copy(self.vehicle)
+        for name, value in scenario.vehicle.items():
+            setattr(vehicle, name, value)
+        vehicle.mass = vehicle.mass + scenario.mass_change
+        return vehicle
+
+    def _sum(self, values, dt):
+        """ Time integral along the sampling points (per track with offsets), e.g. in l or kWh, ignoring NaN values """
+        if self.offsets is None:
+            # matrix product without a temporary matrix, NaN values are only replaced if present
+            total = values @ dt
+            if np.any(np.isnan(total)):
+                total = np.where(np.isnan(values), 0.0, values) @ np.nan_to_num(dt)
+            return total / 3600
+        values = values * dt
+        values[np.isnan(values)] = 0.0
+        return segment_sum(values, self.offsets) / 3600
+
+    def _is_cached(self, cache, key, value):
+        """ Check the cache, arrays are identified by id and must be the cached object itself """
+        return key in cache and (np.ndim(value) == 0 or cache[key][0] is value)
+
+    def _key(self, value):
+        """ Cache key of an input: None for the base input, the value for scalars and the identity for arrays """
+        if value is None or np.ndim(value) == 0:
+            return value
+        return id(value)
@@ -1,4 +1,5 @@
-import numpy as np
+from vehicle_eco_balance.backend import get_namespace
+from vehicle_eco_balance.validation import as_float_array
 
 
 class Sensitivity:
@@ -24,13 +25,16 @@ class Sensitivity:
         vehicle height in m (default 1.55)
     width: float
         vehicle width in m (default 1.7)
+    dtype: numpy dtype
+        float type of the parameters, e.g. np.float32 for float32 inputs (default None, i.e. parameters are kept)
 
     Attributes
     ----------
     identical to parameters
     """
 
-    def __init__(self, rho_air=1.225, g=9.81, calorific_value=9.12, cr=0.02, cw=0.3, mass=1500, height=1.55, width=1.7, efficiency=0.25):
+    def __init__(self, rho_air=1.225, g=9.81, calorific_value=9.12, cr=0.02, cw=0.3, mass=1500, height=1.55, width=1.7, efficiency=0.25,
+                 dtype=None):
         self.rho_air = rho_air
         self.g = g
         self.calorific_value = calorific_value
@@ -40,6 +44,41 @@ class Sensitivity:
         self.height = height
         self.width = width
         self.efficiency = efficiency
+        if dtype is not None:
+            # float64 parameters would promote float32 inputs
+            for name, value in list(vars(self).items()):
+                setattr(self, name, as_float_array(value, dtype))
+        self.dtype = dtype
+
+    @classmethod
+    def from_vehicle(cls, vehicle, cr=0.02, efficiency=0.25, rho_air=1.225, g=9.81, dtype=None):
+        """ Create a sensitivity analysis for the parameters of a vehicle (class Car)
+
+        The cross section of the vehicle is used as width with a height of 1 m, so that width * height equals the
+        cross section.
+
+        Parameters
+        ----------
+        vehicle: class Car
+            vehicle containing parameters like mass, air drag coefficient, etc.
+        cr: float or numpy array
+            rolling coefficient (default 0.02)
+        efficiency: float or numpy array
+            efficiency (dimensionless), e.g. ConsumptionPhys.efficiency (default 0.25)
+        rho_air: float
+            air mass density in kg/m³ (default 1.225)
+        g: float
+            gravitational acceleration in m/s² (default 9.81)
+        dtype: numpy dtype
+            float type of the parameters (default None)
+
+        Returns
+        -------
+        sensitivity: class Sensitivity
+        """
+
+        return cls(rho_air=rho_air, g=g, calorific_value=vehicle.calorific_value, cr=cr, cw=vehicle.cw,
+                   mass=vehicle.mass, height=1.0, width=vehicle.cross_section, efficiency=efficiency, dtype=dtype)
 
     def dQ_mass(self, speed, acceleration, gradient_angle, dm):
         """ Calculate first order variation of consumption for a specified vehicle mass variation
@@ -60,7 +99,8 @@ class Sensitivity:
         numpy array
             consumption difference caused by vehicle mass variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * (self.g * (self.cr * np.cos(gradient_angle) + np.sin(gradient_angle)) + acceleration) * speed/3.6 * dm
+        xp = get_namespace(gradient_angle)
+        return 1 / (1000 * self.calorific_value * self.efficiency) * (self.g * (self.cr * xp.cos(gradient_angle) + xp.sin(gradient_angle)) + acceleration) * speed/3.6 * dm
 
     def dQ_width(self, speed, dw):
         """ Calculate first order variation of consumption for a specified vehicle width variation
@@ -77,7 +117,7 @@ class Sensitivity:
         numpy array
             consumption difference caused by vehicle width variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.height * self.cw * self.rho_air * np.power(speed/3.6, 3) * dw
+        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.height * self.cw * self.rho_air * (speed/3.6) ** 3 * dw
 
     def dQ_height(self, speed, dh):
         """ Calculate first order variation of consumption for a specified vehicle height variation
@@ -95,7 +135,7 @@ class Sensitivity:
         numpy array
             consumption difference caused by vehicle height variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.width * self.cw * self.rho_air * np.power(speed/3.6, 3) * dh
+        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.width * self.cw * self.rho_air * (speed/3.6) ** 3 * dh
 
     def dQ_cw(self, speed, dcw):
         """ Calculate first order variation of consumption for a specified air drag coefficient variation
@@ -112,7 +152,7 @@ class Sensitivity:
         numpy array
             consumption difference caused by air drag coefficient variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.width * self.height * self.rho_air * np.power(speed/3.6, 3) * dcw
+        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.width * self.height * self.rho_air * (speed/3.6) ** 3 * dcw
 
     def dQ_cr(self, speed, gradient_angle, dcr):
         """ Calculate first order variation of consumption for a specified rolling coefficient variation
@@ -131,7 +171,8 @@ class Sensitivity:
         numpy array
             consumption difference caused by rolling coefficient variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * self.mass * self.g * np.cos(gradient_angle) * speed/3.6 * dcr
+        xp = get_namespace(gradient_angle)
+        return 1 / (1000 * self.calorific_value * self.efficiency) * self.mass * self.g * xp.cos(gradient_angle) * speed/3.6 * dcr
 
     def dQ_g(self, speed, gradient_angle, dg):
         """ Calculate first order variation of consumption for a specified gravitational acceleration variation
@@ -150,7 +191,8 @@ class Sensitivity:
         numpy array
             consumption difference caused by gravitational acceleration variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * self.mass * (self.cr * np.cos(gradient_angle) + np.sin(gradient_angle)) * speed/3.6 * dg
+        xp = get_namespace(gradient_angle)
+        return 1 / (1000 * self.calorific_value * self.efficiency) * self.mass * (self.cr * xp.cos(gradient_angle) + xp.sin(gradient_angle)) * speed/3.6 * dg
 
     def dQ_rho_air(self, speed, drho):
         """ Calculate first order variation of consumption for a specified air mass density variation
@@ -167,7 +209,7 @@ class Sensitivity:
         numpy array
             consumption difference caused by air mass density variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.height * self.width * self.cw * np.power(speed/3.6, 3) * drho
+        return 1 / (1000 * self.calorific_value * self.efficiency) * 0.5 * self.height * self.width * self.cw * (speed/3.6) ** 3 * drho
 
     def dQ_calorific_value(self, speed, acceleration, gradient_angle, dcal):
         """ Calculate first order variation of consumption for a specified calorific value variation
@@ -188,8 +230,9 @@ class Sensitivity:
         numpy array
             consumption difference caused by calorific value variation in l/h
         """
-        return - 1 / (np.power(1000 * self.calorific_value, 2) * self.efficiency) * ( 0.5 * self.height * self.width * self.cw * self.rho_air * np.power(speed/3.6, 3) +
-                self.mass * self.g * (self.cr * np.cos(gradient_angle) + np.sin(gradient_angle)) * speed/3.6 + self.mass * acceleration * speed/3.6 ) * 1000 * dcal
+        xp = get_namespace(gradient_angle)
+        return - 1 / ((1000 * self.calorific_value) ** 2 * self.efficiency) * ( 0.5 * self.height * self.width * self.cw * self.rho_air * (speed/3.6) ** 3 +
+                self.mass * self.g * (self.cr * xp.cos(gradient_angle) + xp.sin(gradient_angle)) * speed/3.6 + self.mass * acceleration * speed/3.6 ) * 1000 * dcal
 
     def dQ_efficiency(self, speed, acceleration, gradient_angle, deff):
         """ Calculate first order variation of consumption for a specified efficiency variation
@@ -210,8 +253,9 @@ class Sensitivity:
         numpy array
             consumption difference caused by efficiency variation in l/h
         """
-        return - 1 / (1000 * self.calorific_value * np.power(self.efficiency, 2)) * ( 0.5 * self.height * self.width * self.cw * self.rho_air * np.power(speed/3.6, 3) +
-                self.mass * self.g * (self.cr * np.cos(gradient_angle) + np.sin(gradient_angle)) * speed/3.6 + self.mass * acceleration * speed/3.6) * deff
+        xp = get_namespace(gradient_angle)
+        return - 1 / (1000 * self.calorific_value * self.efficiency ** 2) * ( 0.5 * self.height * self.width * self.cw * self.rho_air * (speed/3.6) ** 3 +
+                self.mass * self.g * (self.cr * xp.cos(gradient_angle) + xp.sin(gradient_angle)) * speed/3.6 + self.mass * acceleration * speed/3.6) * deff
 
     def dQ_speed(self, speed, acceleration, gradient_angle, dspeed):
         """ Calculate first order variation of consumption for a specified speed variation
@@ -232,8 +276,9 @@ class Sensitivity:
         numpy array
             consumption difference caused by speed variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * ( 1.5 * self.height * self.width * self.cw * self.rho_air * np.power(speed/3.6, 2) +
-                self.mass * self.g * (self.cr * np.cos(gradient_angle) + np.sin(gradient_angle)) + self.mass * acceleration) * dspeed/3.6
+        xp = get_namespace(gradient_angle)
+        return 1 / (1000 * self.calorific_value * self.efficiency) * ( 1.5 * self.height * self.width * self.cw * self.rho_air * (speed/3.6) ** 2 +
+                self.mass * self.g * (self.cr * xp.cos(gradient_angle) + xp.sin(gradient_angle)) + self.mass * acceleration) * dspeed/3.6
 
     def dQ_acceleration(self, speed, dacc):
         """ Calculate first order variation of consumption for a specified acceleration variation
@@ -269,6 +314,7 @@ class Sensitivity:
         numpy array
             consumption difference caused by gradient angle variation in l/h
         """
-        return 1 / (1000 * self.calorific_value * self.efficiency) * self.mass * self.g * (np.cos(gradient_angle) - self.cr * np.sin(gradient_angle)) * speed/3.6 * dgrad
+        xp = get_namespace(gradient_angle)
+        return 1 / (1000 * self.calorific_value * self.efficiency) * self.mass * self.g * (xp.cos(gradient_angle) - self.cr * xp.sin(gradient_angle)) * speed/3.6 * dgrad
 
 
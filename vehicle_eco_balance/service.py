@@ -0,0 +1,537 @@
+import io
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from vehicle_eco_balance.cli import create_model, calculate_consumption
+from vehicle_eco_balance.consumption import accumulate_consumption
+from vehicle_eco_balance.instrumentation import count, stage
+from vehicle_eco_balance.validation import validate_arrays, check_gradient_angle
+from vehicle_eco_balance.vehicle import Car
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+JSON_TYPE = 'application/json'
+NPZ_TYPE = 'application/x-npz'
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Parameters of a request which select the model, requests with the same parameters are evaluated together
+_model_parameters = ('model', 'consumption_type', 'model_parameters', 'vehicle')
+
+
+class _Request:
+    def __init__(self, parameters, speed, acceleration, gradient_angle, cr):
+        self.key = json.dumps({name: parameters.get(name) for name in _model_parameters}, sort_keys=True)
+        self.parameters = parameters
+        self.speed = speed
+        self.acceleration = acceleration
+        self.gradient_angle = gradient_angle
+        self.cr = cr
+        self.future = Future()
+
+
+class ConsumptionService:
+    """
+    HTTP service for the evaluation of the consumption models
+
+    Requests are queued and collected by a batching thread: concurrent requests with the same model and vehicle are
+    concatenated and evaluated by a single vectorized call of the model in a (pre-warmed) thread pool, the results are
+    split again per request. At most 2 * workers batches are evaluated or waiting for a thread at once, further requests
+    stay in the queue. If the queue is full, requests are rejected with status 503 (backpressure).
+
+    Endpoints:
+        POST /consumption: evaluate a consumption model
+        GET /health: status and queue length
+
+    Request body (JSON, Content-Type application/json):
+        {
+            "model": "phys",  # 'phys', 'stat' or 'ev' (see cli.create_model)
+            "consumption_type": "fuel",
+            "model_parameters": {},
+            "vehicle": {"mass": 1600, "fuel_type": "diesel"},  # parameters of class Car
+            "cr": 0.02,  # float or list
+            "speed": [...], "acceleration": [...], "gradient_angle": [...],
+            "dt": [...]  # optional, to calculate the total consumption
+        }
+    The response contains "consumption" and, if dt is given, "total".
+
+    Binary payloads: arrays as .npz file (Content-Type application/x-npz) or as Arrow stream (Content-Type
+    application/vnd.apache.arrow.stream, requires pyarrow) with the columns speed, acceleration, gradient_angle and
+    optionally cr and dt. The other parameters are passed as JSON in the npz member 'parameters' or in the Arrow schema
+    metadata 'parameters'. The response has the same format as the request.
+
+    Example:
+        service = ConsumptionService(port=8080)
+        service.serve_forever()
+
+    Parameters
+    ----------
+    host: str
+        host name (default '127.0.0.1')
+    port: int
+        port, 0 for any free port (default 8080)
+    workers: int
+        number of threads evaluating batches (default 4)
+    max_queue: int
+        maximum number of queued requests, further requests are rejected (default 1024)
+    max_batch_points: int
+        maximum number of sampling points per batch (default 2**20)
+    batch_wait: float
+        time in seconds to wait for further requests before a batch is evaluated (default 0.002)
+    timeout: float
+        time in seconds after which a queued request fails (default 30.0)
+
+    Attributes
+    ----------
+    address: tuple
+        (host, port) of the running server
+    """
+
+    def __init__(self, host='127.0.0.1', port=8080, workers=4, max_queue=1024, max_batch_points=2 ** 20,
+                 batch_wait=0.002, timeout=30.0):
+        self.max_batch_points = max_batch_points
+        self.batch_wait = batch_wait
+        self.timeout = timeout
+        self.requests = queue.Queue(maxsize=max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Batches in flight, the executor queue is unbounded
+        self._slots = threading.BoundedSemaphore(2 * workers)
+        self._warm_up(workers)
+
+        self.server = _Server((host, port), _Handler)
+        self.server.service = self
+        self.address = self.server.server_address
+
+        self._running = True
+        self._batcher = threading.Thread(target=self._collect_batches, daemon=True)
+        self._batcher.start()
+
+    def serve_forever(self):
+        """ Handle requests until shutdown() is called """
+        self.server.serve_forever()
+
+    def start(self):
+        """ Handle requests in a background thread """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        """ Stop the server, the batching thread and the thread pool """
+        self.server.shutdown()
+        self.server.server_close()
+        self._running = False
+        self._batcher.join()
+        self.executor.shutdown()
+
+    def submit(self, parameters, speed, acceleration, gradient_angle, cr=0.02):
+        """ Queue a request for evaluation
+
+        Parameters
+        ----------
+        parameters: dictionary
+            model, consumption_type, model_parameters and vehicle (see class description)
+        speed, acceleration, gradient_angle: numpy arrays
+            inputs of the consumption model
+        cr: float or numpy array
+            rolling resistance coefficient (default 0.02)
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            future of the consumption (numpy array)
+
+        Raises
+        ------
+        queue.Full
+            if the queue is full
+        Exception
+            if the inputs or the model and vehicle parameters are invalid (the batches are evaluated without
+            validation, so that an invalid request does not fail the other requests of its batch)
+        """
+
+        _check_parameters(parameters)
+
+        speed, acceleration, gradient_angle = validate_arrays(['speed', 'acceleration', 'gradient_angle'],
+                                                              speed, acceleration, gradient_angle)
+        if speed.ndim != 1:
+            raise Exception("The arrays speed, acceleration and gradient_angle must be one-dimensional!")
+        check_gradient_angle(gradient_angle)
+        try:
+            cr = np.broadcast_to(np.asarray(cr, dtype=float), speed.shape)
+        except ValueError:
+            raise Exception("The cr must be a float or an array with the length of speed!")
+        request = _Request(parameters, speed, acceleration, gradient_angle, cr)
+        self.requests.put_nowait(request)
+        return request.future
+
+    def _warm_up(self, workers):
+        """ Start all threads of the pool and evaluate each model once """
+        speed = np.linspace(0, 100, 16)
+        zeros = np.zeros(len(speed))
+        futures = [self.executor.submit(self._evaluate, [_Request({'model': model}, speed, zeros, zeros, zeros + 0.02)])
+                   for model in ('phys', 'stat', 'ev') for _ in range(workers)]
+        for future in futures:
+            future.result()
+
+    def _collect_batches(self):
+        """ Collect queued requests into batches of requests with the same model and vehicle """
+
+        while self._running:
+            try:
+                first = self.requests.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch, points = [first], len(first.speed)
+            deadline = time.perf_counter() + self.batch_wait
+            while points < self.max_batch_points:
+                try:
+                    request = self.requests.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                batch.append(request)
+                points += len(request.speed)
+
+            groups = {}
+            for request in batch:
+                groups.setdefault(request.key, []).append(request)
+            for requests in groups.values():
+                # Wait for a free slot, meanwhile the queue fills up and further requests are rejected
+                while not self._slots.acquire(timeout=0.1):
+                    if not self._running:
+                        for request in batch:
+                            if not request.future.done():
+                                request.future.set_exception(Exception("The service is shut down!"))
+                        return
+                future = self.executor.submit(self._evaluate, requests)
+                future.add_done_callback(lambda _: self._slots.release())
+
+    def _evaluate(self, requests):
+        """ Evaluate the concatenated requests of a batch and set the results of their futures """
+
+        try:
+            parameters = requests[0].parameters
+            offsets = np.cumsum([0] + [len(request.speed) for request in requests])
+            with stage('service_batch', requests=len(requests), points=int(offsets[-1])):
+                model = create_model(parameters.get('model', 'phys'), parameters.get('consumption_type', 'fuel'),
+                                     parameters.get('model_parameters'))
+                vehicle = Car(**(parameters.get('vehicle') or {}))
+                consumption = calculate_consumption(
+                    model, np.concatenate([request.speed for request in requests]),
+                    np.concatenate([request.acceleration for request in requests]),
+                    np.concatenate([request.gradient_angle for request in requests]), vehicle,
+                    np.concatenate([request.cr for request in requests]), trusted=True)
+            count('service_batches')
+            for request, start, end in zip(requests, offsets[:-1], offsets[1:]):
+                request.future.set_result(consumption[start:end])
+        except Exception as err:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(err)
+
+
+def _check_parameters(parameters):
+    """ Create the model and vehicle of a request once to reject invalid parameters before batching """
+
+    if not isinstance(parameters, dict):
+        raise Exception("The parameters must be a JSON object!")
+    if parameters.get('consumption_type', 'fuel') not in ('fuel', 'energy'):
+        raise Exception("consumption_type " + str(parameters['consumption_type']) + " is unknown!")
+    try:
+        create_model(parameters.get('model', 'phys'), parameters.get('consumption_type', 'fuel'),
+                     parameters.get('model_parameters'))
+        Car(**(parameters.get('vehicle') or {}))
+    except (TypeError, ValueError, AttributeError) as err:
+        raise Exception("Invalid model or vehicle parameters: " + str(err))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Large listen backlog, otherwise bursts of connections are delayed by TCP retransmits
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self._send_json(404, {'error': 'Not found'})
+        self._send_json(200, {'status': 'ok', 'queue': self.server.service.requests.qsize()})
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path != '/consumption':
+            return self._send_json(404, {'error': 'Not found'})
+
+        content_type = self.headers.get('Content-Type', JSON_TYPE).split(';')[0].strip()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            parameters, arrays = _decode(body, content_type)
+            future = service.submit(parameters, arrays['speed'], arrays['acceleration'], arrays['gradient_angle'],
+                                    arrays.get('cr', parameters.get('cr', 0.02)))
+        except queue.Full:
+            count('service_rejected')
+            return self._send_json(503, {'error': 'Too many requests, retry later'}, {'Retry-After': '1'})
+        except Exception as err:
+            return self._send_json(400, {'error': str(err)})
+
+        try:
+            result = {'consumption': future.result(timeout=service.timeout)}
+        except Exception as err:
+            return self._send_json(500, {'error': str(err)})
+        if 'dt' in arrays:
+            result['total'] = np.asarray(accumulate_consumption(result['consumption'], np.asarray(arrays['dt'])))
+
+        self._send(200, _encode(result, content_type), content_type)
+
+    def _send_json(self, status, content, headers=None):
+        self._send(status, json.dumps(content).encode(), JSON_TYPE, headers)
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _decode(body, content_type):
+    """ Decode a request body into parameters and arrays """
+
+    if content_type == NPZ_TYPE:
+        with np.load(io.BytesIO(body), allow_pickle=False) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+        parameters = json.loads(str(arrays.pop('parameters'))) if 'parameters' in arrays else {}
+    elif content_type == ARROW_TYPE:
+        if pyarrow is None:
+            raise Exception("Arrow payloads require pyarrow!")
+        table = pyarrow.ipc.open_stream(body).read_all()
+        arrays = {name: table.column(name).to_numpy() for name in table.column_names}
+        metadata = table.schema.metadata or {}
+        parameters = json.loads(metadata[b'parameters']) if b'parameters' in metadata else {}
+    elif content_type == JSON_TYPE:
+        parameters = json.loads(body)
+        arrays = {name: np.asarray(parameters.pop(name), dtype=float)
+                  for name in ('speed', 'acceleration', 'gradient_angle', 'dt') if name in parameters}
+        if isinstance(parameters.get('cr'), list):
+            arrays['cr'] = np.asarray(parameters.pop('cr'), dtype=float)
+    else:
+        raise Exception("Content-Type " + content_type + " is not supported!")
+
+    for name in ('speed', 'acceleration', 'gradient_angle'):
+        if name not in arrays:
+            raise Exception("The array " + name + " is missing!")
+
+    return [parameters, arrays]
+
+
+def _encode(result, content_type):
+    """ Encode the result arrays in the format of the request """
+
+    if content_type == NPZ_TYPE:
+        buffer = io.BytesIO()
+        np.savez(buffer, **result)
+        return buffer.getvalue()
+    if content_type == ARROW_TYPE:
+        table = pyarrow.table({'consumption': result['consumption']},
+                              metadata={'total': json.dumps(result['total'].tolist())} if 'total' in result else None)
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    return json.dumps({name: values.tolist() for name, values in result.items()}).encode()
+
+
+def request_consumption(url, parameters, speed, acceleration, gradient_angle, dt=None, payload='npz', timeout=30.0):
+    """ Request the consumption from a running service
+
+    Parameters
+    ----------
+    url: str
+        base URL of the service, e.g. 'http://127.0.0.1:8080'
+    parameters: dictionary
+        model, consumption_type, model_parameters, vehicle and cr (see class ConsumptionService)
+    speed, acceleration, gradient_angle: numpy arrays
+        inputs of the consumption model
+    dt: numpy array
+        interval times in seconds to calculate the total consumption (default None)
+    payload: str
+        'json', 'npz' or 'arrow' (default 'npz')
+    timeout: float
+        timeout in seconds (default 30.0)
+
+    Returns
+    -------
+    result: dictionary of numpy arrays
+        'consumption' and, if dt is given, 'total'
+    """
+
+    arrays = {'speed': speed, 'acceleration': acceleration, 'gradient_angle': gradient_angle}
+    if dt is not None:
+        arrays['dt'] = dt
+
+    if payload == 'json':
+        content_type = JSON_TYPE
+        body = json.dumps(dict(parameters, **{name: np.asarray(values).tolist()
+                                              for name, values in arrays.items()})).encode()
+    elif payload == 'npz':
+        content_type = NPZ_TYPE
+        buffer = io.BytesIO()
+        np.savez(buffer, parameters=np.array(json.dumps(parameters)), **arrays)
+        body = buffer.getvalue()
+    elif payload == 'arrow':
+        content_type = ARROW_TYPE
+        table = pyarrow.table({name: np.asarray(values, dtype=float) for name, values in arrays.items()},
+                              metadata={'parameters': json.dumps(parameters)})
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        body = sink.getvalue().to_pybytes()
+    else:
+        raise Exception("payload " + payload + " is unknown!")
+
+    request = urllib.request.Request(url.rstrip('/') + '/consumption', data=body,
+                                     headers={'Content-Type': content_type})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        content = response.read()
+
+    if payload == 'npz':
+        with np.load(io.BytesIO(content), allow_pickle=False) as npz:
+            return {name: npz[name] for name in npz.files}
+    if payload == 'arrow':
+        table = pyarrow.ipc.open_stream(content).read_all()
+        result = {'consumption': table.column('consumption').to_numpy()}
+        if table.schema.metadata and b'total' in table.schema.metadata:
+            result['total'] = np.asarray(json.loads(table.schema.metadata[b'total']))
+        return result
+    return {name: np.asarray(values) for name, values in json.loads(content).items()}
+
+
+def benchmark(url=None, n_requests=2000, concurrency=32, points=600, payload='npz', parameters=None, **kwargs):
+    """ Measure the latency of the service under concurrent load
+
+    Parameters
+    ----------
+    url: str
+        base URL of a running service, None to start a service on a free localhost port (default None)
+    n_requests: int
+        number of requests (default 2000)
+    concurrency: int
+        number of concurrent clients (default 32)
+    points: int
+        number of sampling points per request (default 600)
+    payload: str
+        'json', 'npz' or 'arrow' (default 'npz')
+    parameters: dictionary
+        request parameters (default ConsumptionPhys with the default Car)
+    kwargs:
+        parameters of class ConsumptionService if the service is started
+
+    Returns
+    -------
+    results: dictionary
+        latency percentiles 'p50', 'p90', 'p99', 'max' in ms, 'requests_per_s', 'points_per_s' and the number of
+        'rejected' (503) and 'failed' requests
+    """
+
+    service = None
+    if url is None:
+        service = ConsumptionService(port=0, **kwargs)
+        service.start()
+        url = 'http://{}:{}'.format(*service.address)
+
+    rng = np.random.default_rng(0)
+    speed = np.clip(np.cumsum(rng.normal(0, 2, points)) + 50, 0, None)
+    acceleration = np.zeros(points)
+    acceleration[1:] = np.diff(speed) / 3.6
+    gradient_angle = np.zeros(points)
+    parameters = parameters if parameters is not None else {'model': 'phys', 'consumption_type': 'fuel'}
+
+    def send(_):
+        start = time.perf_counter()
+        try:
+            request_consumption(url, parameters, speed, acceleration, gradient_angle, payload=payload)
+        except urllib.error.HTTPError as err:
+            return [None, 'rejected' if err.code == 503 else 'failed']
+        except Exception:
+            return [None, 'failed']
+        return [time.perf_counter() - start, None]
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(send, range(n_requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if service is not None:
+            service.shutdown()
+
+    latencies = np.array([latency for latency, _ in results if latency is not None]) * 1000
+    p50, p90, p99, p100 = np.percentile(latencies, [50, 90, 99, 100]) if len(latencies) else [np.nan] * 4
+
+    return {'p50': float(p50), 'p90': float(p90), 'p99': float(p99), 'max': float(p100),
+            'requests_per_s': len(latencies) / elapsed, 'points_per_s': len(latencies) * points / elapsed,
+            'rejected': sum(error == 'rejected' for _, error in results),
+            'failed': sum(error == 'failed' for _, error in results)}
+
+
+def main(argv=None):
+    """ Command line entry point (vehicle-eco-balance-service) """
+
+    parser = argparse.ArgumentParser(prog='vehicle-eco-balance-service',
+                                     description='HTTP service for the consumption models.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='run the service')
+    bench = subparsers.add_parser('benchmark', help='measure the latency of a (local) service')
+    for subparser in (serve, bench):
+        subparser.add_argument('--host', default='127.0.0.1', help='host name (default: 127.0.0.1)')
+        subparser.add_argument('--port', type=int, default=8080, help='port (default: 8080)')
+        subparser.add_argument('--workers', type=int, default=4, help='evaluation threads (default: 4)')
+        subparser.add_argument('--max-queue', type=int, default=1024, help='maximum queued requests (default: 1024)')
+        subparser.add_argument('--batch-wait', type=float, default=0.002,
+                               help='seconds to wait for requests of a batch (default: 0.002)')
+    bench.add_argument('--url', default=None, help='URL of a running service (default: start a local service)')
+    bench.add_argument('--requests', type=int, default=2000, help='number of requests (default: 2000)')
+    bench.add_argument('--concurrency', type=int, default=32, help='concurrent clients (default: 32)')
+    bench.add_argument('--points', type=int, default=600, help='sampling points per request (default: 600)')
+    bench.add_argument('--payload', choices=['json', 'npz', 'arrow'], default='npz',
+                       help='payload format (default: npz)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        service = ConsumptionService(args.host, args.port, args.workers, args.max_queue, batch_wait=args.batch_wait)
+        print('Serving on http://{}:{}'.format(*service.address), file=sys.stderr)
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            service.shutdown()
+        return 0
+
+    results = benchmark(args.url, args.requests, args.concurrency, args.points, args.payload, workers=args.workers,
+                        max_queue=args.max_queue, batch_wait=args.batch_wait)
+    print('Latency: p50 {p50:.2f} ms, p90 {p90:.2f} ms, p99 {p99:.2f} ms, max {max:.2f} ms'.format(**results))
+    print('Throughput: {requests_per_s:.0f} requests/s, {points_per_s:.0f} points/s, {rejected} rejected, '
+          '{failed} failed'.format(**results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,136 @@
+import numpy as np
+from vehicle_eco_balance.kinematics import calc_acceleration
+from vehicle_eco_balance.geo import calc_distance_array, calc_cumulative_distance, calc_gradient_angle_array, \
+    calc_gradient_angle_smoothed
+from vehicle_eco_balance.consumption import accumulate_consumption
+from vehicle_eco_balance.utils import segment_sum
+
+
+class TrackCollection:
+    """
+    Collection of many tracks stored as concatenated arrays with offsets (ragged arrays)
+
+    All tracks are processed by a few large array operations instead of one function call per track. The kernels
+    reset at the track boundaries, i.e. acceleration, distance and gradient angle are 0 at the first point of each
+    track and windows of the smoothed gradient do not cross tracks.
+
+    Example:
+        tracks = TrackCollection.from_tracks([{'speed': speed1, 'dt': dt1}, {'speed': speed2, 'dt': dt2}])
+        tracks.calc_acceleration()
+        consumption = ConsumptionPhys('fuel').calculate_consumption(tracks['speed'], tracks['acceleration'],
+                                                                    np.zeros(len(tracks['speed'])), Car())
+        per_track = tracks.accumulate_consumption(consumption)
+
+    Parameters
+    ----------
+    columns: dictionary of numpy arrays
+        concatenated values of all tracks, e.g. 'speed' (km/h), 'dt' (s), 'lats', 'lngs' (degrees), 'altitudes' (m)
+    offsets: numpy array
+        start index of each track and the total length as last element, e.g. [0, 120, 300] for two tracks with 120 and
+        180 points
+
+    Attributes
+    ----------
+    columns: dictionary of numpy arrays
+        concatenated values, calculated columns (e.g. 'acceleration', 'distance', 'gradient_angle') are added
+    offsets: numpy array
+        start index of each track and the total length as last element
+    """
+
+    def __init__(self, columns, offsets):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.columns = {name: np.asarray(values) for name, values in columns.items()}
+
+        if self.offsets[0] != 0 or np.any(np.diff(self.offsets) < 0):
+            raise Exception("The offsets must start with 0 and must be non-decreasing!")
+        for name, values in self.columns.items():
+            if len(values) != self.offsets[-1]:
+                raise Exception("The column " + name + " must have the length offsets[-1]!")
+
+    @classmethod
+    def from_tracks(cls, tracks):
+        """ Create a collection from a list of tracks
+
+        Parameters
+        ----------
+        tracks: list of dictionaries
+            one dictionary of numpy arrays per track, all tracks must have the same keys
+
+        Returns
+        -------
+        tracks: class TrackCollection
+        """
+
+        names = list(tracks[0].keys()) if len(tracks) > 0 else []
+        lengths = [len(track[names[0]]) for track in tracks] if names else [0] * len(tracks)
+        offsets = np.concatenate(([0], np.cumsum(lengths, dtype=np.int64)))
+        columns = {name: np.concatenate([np.asarray(track[name]) for track in tracks]) for name in names}
+
+        return cls(columns, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        if len(values) != self.offsets[-1]:
+            raise Exception("The column " + name + " must have the length offsets[-1]!")
+        self.columns[name] = values
+
+    @property
+    def lengths(self):
+        """ Number of points per track """
+        return np.diff(self.offsets)
+
+    def track(self, i):
+        """ Get the columns of a single track as dictionary of numpy arrays (views, no copies) """
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return {name: values[start:end] for name, values in self.columns.items()}
+
+    def to_tracks(self):
+        """ Split the collection into a list of tracks """
+        return [self.track(i) for i in range(len(self))]
+
+    def calc_acceleration(self):
+        """ Calculate the acceleration (m/s²) from 'speed' and 'dt' and store it as column 'acceleration' """
+        self.columns['acceleration'] = calc_acceleration(self['speed'], self['dt'], offsets=self.offsets)
+        return self.columns['acceleration']
+
+    def calc_distance(self):
+        """ Calculate the distance (m) to the previous point from 'lats' and 'lngs' and store it as column 'distance' """
+        self.columns['distance'] = calc_distance_array(self['lats'], self['lngs'], offsets=self.offsets)
+        return self.columns['distance']
+
+    def calc_gradient_angle(self, window=None):
+        """ Calculate the gradient angle (rad) and store it as column 'gradient_angle'
+
+        Parameters
+        ----------
+        window: float
+            length of the distance window in meters for the smoothed gradient (see calc_gradient_angle_smoothed),
+            None for the gradient between consecutive points (default None)
+        """
+
+        if window is None:
+            gradient_angle = calc_gradient_angle_array(self['lats'], self['lngs'], self['altitudes'],
+                                                       offsets=self.offsets)
+        else:
+            distance = calc_cumulative_distance(self['lats'], self['lngs'], offsets=self.offsets)
+            gradient_angle = calc_gradient_angle_smoothed(distance, self['altitudes'], window, offsets=self.offsets)
+        self.columns['gradient_angle'] = gradient_angle
+        return gradient_angle
+
+    def accumulate_consumption(self, consumption):
+        """ Sum instantaneous consumption (l/h or kW) per track in l or kWh (see accumulate_consumption) """
+        return accumulate_consumption(consumption, self['dt'], offsets=self.offsets)
+
+    def total_distance(self):
+        """ Distance per track in km, calculated from 'speed' and 'dt' """
+        return segment_sum(self['speed'] * self['dt'], self.offsets) / 3600
+
+    def consumption_per100km(self, consumption):
+        """ Consumption per track in l or kWh per 100 km (distance calculated from 'speed' and 'dt') """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100 * self.accumulate_consumption(consumption) / self.total_distance()
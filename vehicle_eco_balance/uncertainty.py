@@ -0,0 +1,397 @@
+import copy
+from statistics import NormalDist
+import numpy as np
+from vehicle_eco_balance.consumption import ConsumptionPhys
+from vehicle_eco_balance.geo import calc_gradient_angle_smoothed
+from vehicle_eco_balance.kinematics import calc_acceleration
+from vehicle_eco_balance.sensitivity import Sensitivity
+from vehicle_eco_balance.utils import segment_sum, segment_starts, smoothing_windows, window_sum
+from vehicle_eco_balance.validation import validate_arrays, as_float_array
+
+# Error sources which are independent between sampling points, all others are constant within a track
+_white_sources = ('speed', 'altitude', 'time')
+
+
+class Uncertainty:
+    """ Propagation of measurement errors and parameter uncertainty to the consumption of tracks and fleets
+    (physical consumption model, class ConsumptionPhys).
+
+    Error model (all errors normally distributed with mean 0 and the given standard deviation):
+        speed_std: independent error of each speed measurement, also changes the acceleration of the two adjacent
+            intervals
+        speed_bias, speed_scale: constant offset and relative scale error of the speed (e.g. speedometer), constant
+            within a track
+        altitude_std: independent error of each altitude measurement, propagated through the gradient angle (a
+            constant altitude offset does not change the gradient)
+        time_std: independent jitter of each timestamp, changes the interval times (integration and acceleration)
+        mass_std, cw_std: uncertainty of the vehicle parameters, constant within a track
+
+    Errors constant within a track are fully correlated between the tracks if shared is True (same vehicle and sensors,
+    e.g. a TrackCollection of one car) and independent otherwise (fleet of different vehicles).
+
+    propagate() calculates the variances analytically from the first order derivatives of class Sensitivity: the total
+    consumption is linear in the errors, so the variance of each source is a sum of squared coefficients (independent
+    errors) or a squared sum (constant errors) per track, which needs only a few passes over the sampling points. The
+    derivatives include the dependence of the efficiency on the driving resistance. Kinks of the model (idle power,
+    efficiency limits) and very short distance steps of the gradient are not linear, for large errors or tracks with
+    many sampling points close to them monte_carlo() evaluates the full model for random samples of all errors instead.
+
+    Example:
+        uncertainty = Uncertainty(speed_std=1.0, altitude_std=2.0, mass_std=100.0)
+        results = uncertainty.propagate(speed, dt, Car(), altitudes=altitudes, distance=distance, window=100.0,
+                                        offsets=offsets)
+        results['lower'], results['upper']
+
+    Parameters
+    ----------
+    speed_std: float
+        standard deviation of the independent speed error in km/h (default 0.0)
+    speed_bias: float
+        standard deviation of the constant speed offset in km/h (default 0.0)
+    speed_scale: float
+        standard deviation of the relative speed scale error, e.g. 0.02 for 2 % (default 0.0)
+    altitude_std: float
+        standard deviation of the independent altitude error in m (default 0.0)
+    time_std: float
+        standard deviation of the independent timestamp jitter in s (default 0.0)
+    mass_std: float
+        standard deviation of the vehicle mass in kg (default 0.0)
+    cw_std: float
+        standard deviation of the air drag coefficient (default 0.0)
+    confidence: float
+        confidence level of the intervals (default 0.95)
+    shared: bool
+        errors constant within a track are the same for all tracks (default True)
+    consumption_type: str
+        'energy' or 'fuel' (default 'fuel')
+    g: float
+        gravitational acceleration in m/s² (default 9.81)
+    rho_air: float
+        air mass density in kg/m³ (default 1.225)
+
+    Attributes
+    ----------
+    identical to parameters
+    """
+
+    def __init__(self, speed_std=0.0, speed_bias=0.0, speed_scale=0.0, altitude_std=0.0, time_std=0.0, mass_std=0.0,
+                 cw_std=0.0, confidence=0.95, shared=True, consumption_type='fuel', g=9.81, rho_air=1.225):
+        self.speed_std = speed_std
+        self.speed_bias = speed_bias
+        self.speed_scale = speed_scale
+        self.altitude_std = altitude_std
+        self.time_std = time_std
+        self.mass_std = mass_std
+        self.cw_std = cw_std
+        self.confidence = confidence
+        self.shared = shared
+        self.consumption_type = consumption_type
+        self.g = g
+        self.rho_air = rho_air
+
+    def propagate(self, speed, dt, vehicle, gradient_angle=None, altitudes=None, distance=None, window=None, cr=0.02,
+                  offsets=None):
+        """ Propagate the errors analytically (first order)
+
+        Without a window, the gradient angle between consecutive points divides the altitude error by the distance
+        step, which is very short around stops. The linearization is only valid for altitude errors that are small
+        compared to these steps: on the WLTC class 3b cycle it agrees with monte_carlo() for altitude_std=0.001 m, but
+        overestimates the standard deviation about 3 times for altitude_std=0.5 m. Use a window (e.g. 100 m, which
+        agrees within a few percent) or monte_carlo() for realistic altitude errors.
+
+        Parameters
+        ----------
+        speed: numpy array
+            vehicle speed in km/h
+        dt: numpy array
+            interval times between measurements in seconds
+        vehicle: class Car
+            vehicle containing parameters like mass, air drag coefficient, etc.
+        gradient_angle: numpy array
+            gradient angle in radians, only used without altitudes (default None, i.e. 0)
+        altitudes: numpy array
+            altitudes in m, the gradient angle is calculated from them (default None)
+        distance: numpy array
+            cumulative distance in m for the gradient angle (see calc_cumulative_distance)
+            (default None, i.e. calculated from speed and dt)
+        window: float
+            distance window in m of the smoothed gradient angle (see calc_gradient_angle_smoothed), None for the
+            gradient between consecutive points (default None)
+        cr: float or numpy array
+            rolling resistance coefficient (default 0.02)
+        offsets: numpy array
+            start index of each track and the total length as last element for concatenated tracks
+            (default None, i.e. a single track)
+
+        Returns
+        -------
+        results: dictionary
+            per track (numpy arrays with one value per track):
+                'total': consumption in l or kWh, 'std': standard deviation, 'lower', 'upper': confidence interval,
+                'variance': dictionary of the variance per error source
+            for all tracks together (floats):
+                'fleet_total', 'fleet_std', 'fleet_lower', 'fleet_upper', 'fleet_variance'
+        """
+
+        track = self._prepare(speed, dt, gradient_angle, altitudes, distance, window, cr, offsets)
+        speed, dt, gradient_angle, altitudes, distance, cr, offsets = track
+        is_start = self._is_start(len(speed), offsets)
+
+        model = ConsumptionPhys(self.consumption_type, g=self.g, rho_air=self.rho_air)
+        acceleration = calc_acceleration(speed, dt, offsets=offsets)
+        consumption = model.calculate_consumption(speed, acceleration, gradient_angle, vehicle, cr, trusted=True)
+
+        sensitivity = Sensitivity.from_vehicle(vehicle, cr, model.efficiency, self.rho_air, self.g)
+        if self.consumption_type == 'energy':
+            sensitivity.calorific_value = 1.0  # derivatives in kW instead of l/h
+        # Derivatives of the consumption (per unit of the error) through the power; they vanish where the power is
+        # limited to the idle power
+        active = model.power > vehicle.idle_power if vehicle.fuel_type != 'electric' else 1.0
+        derivatives = {
+            'speed': sensitivity.dQ_speed(speed, acceleration, gradient_angle, 1.0) * active,
+            'acceleration': sensitivity.dQ_acceleration(speed, 1.0) * active,
+            'gradient_angle': sensitivity.dQ_grad_angle(speed, gradient_angle, 1.0) * active,
+            'mass': sensitivity.dQ_mass(speed, acceleration, gradient_angle, 1.0) * active,
+            'cw': sensitivity.dQ_cw(speed, 1.0) * active
+        }
+        # The derivatives of class Sensitivity assume a constant efficiency, but the efficiency of ConsumptionPhys
+        # increases with the driving resistance (see calc_efficiency): d consumption / d efficiency * d efficiency / d
+        # driving resistance times the derivative of the driving resistance
+        resistance = model.driving_resistance
+        efficiency_slope = np.where(np.abs(resistance) < 2000,
+                                    (vehicle.max_efficiency - vehicle.min_efficiency) / 4000, 0.0)
+        efficiency_term = consumption * efficiency_slope / model.efficiency
+        resistance_derivatives = {
+            'speed': self.rho_air * vehicle.cw * vehicle.cross_section * speed / 3.6 ** 2,
+            'acceleration': vehicle.mass,
+            'gradient_angle': vehicle.mass * self.g * (np.cos(gradient_angle) - cr * np.sin(gradient_angle)),
+            'mass': self.g * (cr * np.cos(gradient_angle) + np.sin(gradient_angle)) + acceleration,
+            'cw': model.aerodynamic_drag / vehicle.cw
+        }
+        for name, derivative in resistance_derivatives.items():
+            derivatives[name] = derivatives[name] - efficiency_term * derivative
+
+        # Coefficients of the errors in the total consumption (dT = sum(coefficient * error))
+        weight = dt / 3600
+        has_acceleration = ~is_start & (dt != 0)
+        coefficients = {}
+        if self.speed_std or self.speed_bias or self.speed_scale:
+            d_speed = weight * derivatives['speed']
+            # acceleration[i] = (speed[i] - speed[i-1]) / (3.6 * dt[i])
+            m = np.where(has_acceleration, derivatives['acceleration'] / (3600 * 3.6), 0.0)
+            coefficients['speed'] = d_speed + m - _next(m)
+            coefficients['speed_bias'] = d_speed
+            coefficients['speed_scale'] = d_speed * speed + weight * derivatives['acceleration'] * acceleration
+        if self.altitude_std and altitudes is not None:
+            coefficients['altitude'] = self._altitude_coefficients(weight * derivatives['gradient_angle'], altitudes,
+                                                                   distance, window, offsets)
+        if self.time_std:
+            # dt[i] = time[i] - time[i-1] weights consumption[i] and divides the speed difference of acceleration[i]
+            u = np.where(is_start, 0.0, consumption / 3600)
+            u = u - np.where(has_acceleration, derivatives['acceleration'] * acceleration / 3600, 0.0)
+            coefficients['time'] = u - _next(u)
+        if self.mass_std:
+            coefficients['mass'] = weight * derivatives['mass']
+        if self.cw_std:
+            coefficients['cw'] = weight * derivatives['cw']
+
+        stds = {'speed': self.speed_std, 'speed_bias': self.speed_bias, 'speed_scale': self.speed_scale,
+                'altitude': self.altitude_std, 'time': self.time_std, 'mass': self.mass_std, 'cw': self.cw_std}
+        variance, fleet_variance = {}, {}
+        for source, coefficient in coefficients.items():
+            coefficient = np.nan_to_num(coefficient)
+            if source in _white_sources:
+                variance[source] = segment_sum(coefficient ** 2, offsets) * stds[source] ** 2
+                fleet_variance[source] = float(np.sum(variance[source]))
+            else:
+                per_track = segment_sum(coefficient, offsets)
+                variance[source] = per_track ** 2 * stds[source] ** 2
+                fleet_variance[source] = float((np.sum(per_track) ** 2 if self.shared else np.sum(per_track ** 2)) *
+                                               stds[source] ** 2)
+
+        total = segment_sum(np.nan_to_num(consumption * dt), offsets) / 3600
+        std = np.sqrt(sum(variance.values(), np.zeros(len(total))))
+        fleet_total = float(np.sum(total))
+        fleet_std = float(np.sqrt(sum(fleet_variance.values(), 0.0)))
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+
+        return {'total': total, 'std': std, 'lower': total - z * std, 'upper': total + z * std, 'variance': variance,
+                'fleet_total': fleet_total, 'fleet_std': fleet_std, 'fleet_lower': fleet_total - z * fleet_std,
+                'fleet_upper': fleet_total + z * fleet_std, 'fleet_variance': fleet_variance}
+
+    def monte_carlo(self, speed, dt, vehicle, gradient_angle=None, altitudes=None, distance=None, window=None,
+                    cr=0.02, offsets=None, n_samples=1000, seed=None, max_elements=2 ** 23):
+        """ Propagate the errors by a Monte Carlo simulation of the full model
+
+        The samples are evaluated vectorized as matrix (samples x sampling points) in batches of at most max_elements
+        elements. Noisy speeds are limited to non-negative values.
+
+        Parameters
+        ----------
+        speed, dt, vehicle, gradient_angle, altitudes, distance, window, cr, offsets:
+            see propagate
+        n_samples: int
+            number of samples (default 1000)
+        seed: int
+            seed of the random number generator (default None)
+        max_elements: int
+            maximum number of matrix elements evaluated at once (default 2**23)
+
+        Returns
+        -------
+        results: dictionary
+            per track (numpy arrays with one value per track):
+                'total': consumption without errors in l or kWh, 'mean', 'std': mean and standard deviation of the
+                samples, 'lower', 'upper': confidence interval (percentiles of the samples),
+                'samples': total consumption of all samples (samples x tracks)
+            for all tracks together (floats):
+                'fleet_total', 'fleet_mean', 'fleet_std', 'fleet_lower', 'fleet_upper'
+        """
+
+        track = self._prepare(speed, dt, gradient_angle, altitudes, distance, window, cr, offsets)
+        speed, dt, gradient_angle, altitudes, distance, cr, offsets = track
+        is_start = self._is_start(len(speed), offsets)
+        lengths = np.diff(offsets)
+        rng = np.random.default_rng(seed)
+        model = ConsumptionPhys(self.consumption_type, g=self.g, rho_air=self.rho_air)
+
+        def draw_constant(std, size):
+            # one value per sample (shared) or per sample and track, repeated for the sampling points of the track
+            if self.shared:
+                return rng.normal(0.0, std, (size, 1))
+            return np.repeat(rng.normal(0.0, std, (size, len(lengths))), lengths, axis=1)
+
+        samples = np.empty((n_samples, len(lengths)))
+        batch_size = max(1, max_elements // max(1, len(speed)))
+        for start in range(0, n_samples, batch_size):
+            size = min(batch_size, n_samples - start)
+            shape = (size, len(speed))
+
+            speed_sample = speed
+            if self.speed_scale:
+                speed_sample = speed_sample * (1 + draw_constant(self.speed_scale, size))
+            if self.speed_bias:
+                speed_sample = speed_sample + draw_constant(self.speed_bias, size)
+            if self.speed_std:
+                speed_sample = speed_sample + rng.normal(0.0, self.speed_std, shape)
+            speed_sample = np.broadcast_to(np.clip(speed_sample, 0.0, None), shape)
+
+            dt_sample = np.broadcast_to(dt, shape)
+            if self.time_std:
+                jitter = rng.normal(0.0, self.time_std, shape)
+                dt_sample = dt + np.where(is_start, 0.0, jitter - np.roll(jitter, 1, axis=1))
+
+            acceleration = np.zeros(shape)
+            np.divide(np.diff(speed_sample, axis=1) / 3.6, dt_sample[:, 1:], out=acceleration[:, 1:],
+                      where=dt_sample[:, 1:] != 0.0)
+            acceleration[:, is_start] = 0.0
+
+            gradient_sample = gradient_angle
+            if self.altitude_std and altitudes is not None:
+                gradient_sample = _gradient_angle(altitudes + rng.normal(0.0, self.altitude_std, shape), distance,
+                                                  window, offsets)
+
+            vehicle_sample = copy.copy(vehicle)
+            if self.mass_std:
+                vehicle_sample.mass = vehicle.mass + draw_constant(self.mass_std, size)
+            if self.cw_std:
+                vehicle_sample.cw = vehicle.cw + draw_constant(self.cw_std, size)
+
+            consumption = model.calculate_consumption(speed_sample, acceleration, gradient_sample, vehicle_sample, cr,
+                                                      trusted=True)
+            values = consumption * dt_sample
+            values[np.isnan(values)] = 0.0
+            samples[start:start + size] = segment_sum(values, offsets) / 3600
+
+        nominal = model.calculate_consumption(speed, calc_acceleration(speed, dt, offsets=offsets), gradient_angle,
+                                              vehicle, cr, trusted=True)
+        total = segment_sum(np.nan_to_num(nominal * dt), offsets) / 3600
+        fleet = np.sum(samples, axis=1)
+        q = [50 * (1 - self.confidence), 50 * (1 + self.confidence)]
+        lower, upper = np.percentile(samples, q, axis=0)
+        fleet_lower, fleet_upper = np.percentile(fleet, q)
+
+        return {'total': total, 'mean': np.mean(samples, axis=0), 'std': np.std(samples, axis=0, ddof=1),
+                'lower': lower, 'upper': upper, 'samples': samples,
+                'fleet_total': float(np.sum(total)), 'fleet_mean': float(np.mean(fleet)),
+                'fleet_std': float(np.std(fleet, ddof=1)), 'fleet_lower': float(fleet_lower),
+                'fleet_upper': float(fleet_upper)}
+
+    def _prepare(self, speed, dt, gradient_angle, altitudes, distance, window, cr, offsets):
+        """ Validate the inputs, complete offsets and distance and calculate the gradient angle from altitudes """
+
+        speed, dt = validate_arrays(['speed', 'dt'], speed, dt)
+        offsets = np.array([0, len(speed)]) if offsets is None else np.asarray(offsets)
+        cr = as_float_array(cr)
+
+        if altitudes is not None:
+            altitudes, = validate_arrays(['altitudes'], altitudes)
+            if distance is None:
+                distance = np.cumsum(speed * dt / 3.6)
+                distance -= np.repeat(distance[segment_starts(offsets)], np.diff(offsets))
+            speed, altitudes, distance = validate_arrays(['speed', 'altitudes', 'distance'], speed, altitudes,
+                                                         distance)
+            gradient_angle = _gradient_angle(altitudes, distance, window, offsets)
+        elif gradient_angle is None:
+            gradient_angle = np.zeros(len(speed))
+        else:
+            speed, gradient_angle = validate_arrays(['speed', 'gradient_angle'], speed, gradient_angle)
+
+        return [speed, dt, gradient_angle, altitudes, distance, cr, offsets]
+
+    def _altitude_coefficients(self, d_gradient, altitudes, distance, window, offsets):
+        """ Coefficients of the altitude errors, d_gradient is the derivative of the total by the gradient angle """
+
+        if window is None:
+            # gradient_angle[i] = arctan((altitude[i] - altitude[i-1]) / step[i])
+            step, rise = _steps(altitudes, distance, offsets)
+            slope = np.divide(rise, step, out=np.zeros(len(step)), where=step > 0)
+            k = np.divide(d_gradient, step * (1 + slope ** 2), out=np.zeros(len(step)), where=step > 0)
+            return k - _next(k)
+
+        # gradient_angle[i] = arctan(slope[i]) of the least squares line in window i:
+        # d slope[i] = sum over j in window i of (distance[j] - mean distance[i]) * d altitude[j] / var_s[i]
+        lower, upper, distance = smoothing_windows(distance, window, offsets)
+        n = upper - lower
+        sum_s = window_sum(distance, lower, upper)
+        var_s = window_sum(distance * distance, lower, upper) - sum_s * sum_s / n
+        cov_sh = window_sum(distance * altitudes, lower, upper) - sum_s * window_sum(altitudes, lower, upper) / n
+        valid = var_s > 1e-9 * n
+        slope = np.divide(cov_sh, var_s, out=np.zeros(len(n)), where=valid)
+        k = np.divide(d_gradient, (1 + slope ** 2) * var_s, out=np.zeros(len(n)), where=valid)
+
+        # j lies in window i if and only if i lies in window j, so the sums over i are window sums as well
+        return distance * window_sum(k, lower, upper) - window_sum(k * sum_s / n, lower, upper)
+
+    def _is_start(self, n, offsets):
+        is_start = np.zeros(n, dtype=bool)
+        starts = offsets[:-1]
+        is_start[starts[starts < n]] = True
+        return is_start
+
+
+def _next(values):
+    """ Values shifted by one to the left (value of the next point), 0 for the last point """
+    shifted = np.zeros(len(values))
+    shifted[:-1] = values[1:]
+    return shifted
+
+
+def _steps(altitudes, distance, offsets):
+    """ Horizontal distance and altitude difference to the previous point (0 at the start of each track) """
+    step = np.zeros(len(distance))
+    step[1:] = np.diff(distance)
+    rise = np.zeros(np.shape(altitudes))
+    rise[..., 1:] = np.diff(altitudes, axis=-1)
+    starts = offsets[:-1][offsets[:-1] < len(distance)]
+    step[starts] = 0.0
+    rise[..., starts] = 0.0
+    return step, rise
+
+
+def _gradient_angle(altitudes, distance, window, offsets):
+    """ Gradient angle from (a 2d array of) altitude profiles, smoothed over a window or between consecutive points """
+    if window is not None:
+        return calc_gradient_angle_smoothed(distance, altitudes, window, offsets=offsets)
+    step, rise = _steps(altitudes, distance, offsets)
+    return np.arctan(np.divide(rise, step, out=np.zeros(rise.shape), where=step > 0))
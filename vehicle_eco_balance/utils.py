@@ -1,5 +1,6 @@
 from datetime import datetime
 import numpy as np
+from vehicle_eco_balance.backend import get_namespace
 
 
 def get_interval_time(time1, time2):
@@ -43,10 +44,11 @@ def calc_efficiency(res, res_min, res_max, eff_min, eff_max):
         interpolated efficiency
     """
 
-    return np.interp(res, [res_min, res_max], [eff_min, eff_max])
+    xp = get_namespace(res)
+    return eff_min + (eff_max - eff_min) * xp.clip((res - res_min) / (res_max - res_min), 0.0, 1.0)
 
 
-def error_mean(consumption1, consumption2, dt):
+def error_mean(consumption1, consumption2, dt, axis=None):
     """ Calculate time-weighted mean error between tow consumption series
 
     Parameters
@@ -57,16 +59,21 @@ def error_mean(consumption1, consumption2, dt):
         consumption in l/h or kW
     dt: numpy array
         time interval in seconds
+    axis: int
+        axis along which the time series are summed, e.g. -1 for a batch of series stacked in a 2d array
+        (default None, i.e. all values)
 
     Returns
     -------
     mean error: float
         mean error in l/h or kW
     """
-    return np.abs(np.sum(consumption1 * dt) / np.sum(dt) - np.sum(consumption2 * dt) / np.sum(dt))
+    xp = get_namespace(consumption1, consumption2, dt)
+    return xp.abs(xp.sum(consumption1 * dt, axis=axis) - xp.sum(consumption2 * dt, axis=axis)) / \
+        xp.sum(dt, axis=axis)
 
 
-def error_measure(consumption1, consumption2, dt):
+def error_measure(consumption1, consumption2, dt, axis=None):
     """ Calculate time-weighted measurement error between tow consumption series
 
     Parameters
@@ -77,6 +84,9 @@ def error_measure(consumption1, consumption2, dt):
         consumption in l/h or kW
     dt: numpy array
         time interval in seconds
+    axis: int
+        axis along which the time series are summed, e.g. -1 for a batch of series stacked in a 2d array
+        (default None, i.e. all values)
 
     Returns
     -------
@@ -84,10 +94,11 @@ def error_measure(consumption1, consumption2, dt):
         measurement error in l/h or kW
     """
 
-    return np.sum(np.abs(consumption1 - consumption2) * dt) / np.sum(dt)
+    xp = get_namespace(consumption1, consumption2, dt)
+    return xp.sum(xp.abs(consumption1 - consumption2) * dt, axis=axis) / xp.sum(dt, axis=axis)
 
 
-def error_100km(consumption1, consumption2, dt, speed):
+def error_100km(consumption1, consumption2, dt, speed, axis=None):
     """ Calculate time-weighted mean error between tow consumption series
 
     Parameters
@@ -100,6 +111,9 @@ def error_100km(consumption1, consumption2, dt, speed):
         time interval in seconds
     speed: numpy array
         speed in km/h
+    axis: int
+        axis along which the time series are summed, e.g. -1 for a batch of series stacked in a 2d array
+        (default None, i.e. all values)
 
     Returns
     -------
@@ -107,4 +121,229 @@ def error_100km(consumption1, consumption2, dt, speed):
          consumption error in litres or kWh per 100 km
     """
 
-    return 100 * np.abs(np.sum(consumption1 * dt) - np.sum(consumption2 * dt)) / np.sum(speed * dt)
+    xp = get_namespace(consumption1, consumption2, dt, speed)
+    return 100 * xp.abs(xp.sum(consumption1 * dt, axis=axis) - xp.sum(consumption2 * dt, axis=axis)) / \
+        xp.sum(speed * dt, axis=axis)
+
+
+def segment_sum(values, offsets):
+    """ Sum values per segment of concatenated tracks
+
+    Parameters
+    ----------
+    values: numpy array
+        concatenated values of all tracks, for a 2d array the segments are summed along the last axis (e.g. one
+        scenario per row)
+    offsets: numpy array
+        start index of each track and the total length as last element (length: number of tracks + 1),
+        e.g. [0, 120, 120, 300] for three tracks with 120, 0 and 180 values
+
+    Returns
+    -------
+    sums: numpy array
+        sum per track (0 for empty tracks), accumulated in float64 for float32 values
+    """
+
+    values = np.asarray(values)
+    offsets = np.asarray(offsets)
+    starts = offsets[:-1]
+    non_empty = offsets[1:] > starts
+
+    sums = np.zeros(values.shape[:-1] + (len(starts),), dtype=np.result_type(values.dtype, float))
+    if np.any(non_empty):
+        sums[..., non_empty] = np.add.reduceat(values, starts[non_empty], axis=-1, dtype=sums.dtype)
+
+    return sums
+
+
+def segment_starts(offsets):
+    """ Start index of each segment of concatenated tracks
+
+    Parameters
+    ----------
+    offsets: numpy array
+        start index of each track and the total length as last element (length: number of tracks + 1)
+
+    Returns
+    -------
+    starts: numpy array
+        start index per track, empty tracks point to index 0 (their values are never used)
+    """
+
+    offsets = np.asarray(offsets)
+    return np.where(offsets[1:] > offsets[:-1], offsets[:-1], 0)
+
+
+def smoothing_windows(distance, window, offsets=None):
+    """ Distance windows around each sampling point as index ranges [lower, upper)
+
+    A point j lies within the window of point i if and only if i lies within the window of j (symmetric windows).
+    Windows never extend over the borders of concatenated tracks.
+
+    Parameters
+    ----------
+    distance: numpy array
+        cumulative distance in meters, non-decreasing within each track
+    window: float
+        width of the window in meters (+/- window/2 around each point)
+    offsets: numpy array
+        start index of each track and the total length as last element (default None, i.e. a single track)
+
+    Returns
+    -------
+    lower, upper: numpy arrays
+        first and one past the last index of the window of each point
+    distance: numpy array
+        distance from the first point of the (respective) track
+    """
+
+    # Search key for the window borders
+    key = distance
+    if offsets is not None and len(distance) > 0:
+        # Shift each track behind the previous one with a gap larger than the window, the window sums use the
+        # unshifted distance (the slope does not depend on a constant shift within a track)
+        offsets = np.asarray(offsets)
+        lengths = np.diff(offsets)
+        starts = segment_starts(offsets)
+        ends = np.where(lengths > 0, offsets[1:] - 1, 0)
+        extent = np.where(lengths > 0, distance[ends] - distance[starts], 0.0) + window + 1.0
+        shift = np.concatenate(([0.0], np.cumsum(extent)[:-1])) - np.where(lengths > 0, distance[starts], 0.0)
+        key = distance + np.repeat(shift, lengths)
+        distance = distance - np.repeat(np.where(lengths > 0, distance[starts], 0.0), lengths)
+
+    lower = np.searchsorted(key, key - window / 2, side='left')
+    upper = np.searchsorted(key, key + window / 2, side='right')
+
+    return lower, upper, distance
+
+
+def window_sum(values, lower, upper):
+    """ Sum values over the index ranges [lower, upper) along the last axis
+
+    Parameters
+    ----------
+    values: numpy array
+        values to sum, for a 2d array the windows apply to each row
+    lower, upper: numpy arrays
+        first and one past the last index of each window, e.g. from smoothing_windows
+
+    Returns
+    -------
+    sums: numpy array
+        sum per window (from cumulative sums, i.e. in linear time for arbitrary window sizes)
+    """
+
+    cumulative = np.cumsum(values, axis=-1)
+    cumulative = np.concatenate((np.zeros(cumulative.shape[:-1] + (1,)), cumulative), axis=-1)
+    return cumulative[..., upper] - cumulative[..., lower]
+
+
+def segment_weighted_percentile(values, weights, offsets, q):
+    """ Calculate weighted percentiles per segment of concatenated tracks
+
+    The percentile is the smallest value whose cumulative weight (values sorted ascending) reaches q percent of the
+    total weight of the track.
+
+    Parameters
+    ----------
+    values: numpy array
+        concatenated values of all tracks
+    weights: numpy array
+        non-negative weights, e.g. interval times
+    offsets: numpy array
+        start index of each track and the total length as last element (see segment_sum)
+    q: float
+        percentile between 0 and 100
+
+    Returns
+    -------
+    percentiles: numpy array
+        weighted percentile per track (NaN for empty tracks)
+    """
+
+    values = np.asarray(values, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    offsets = np.asarray(offsets)
+    starts, ends = offsets[:-1], offsets[1:]
+
+    # Sort values within each track
+    track = np.repeat(np.arange(len(starts)), ends - starts)
+    order = np.lexsort((values, track))
+    values, weights = values[order], weights[order]
+
+    cumulative = np.concatenate(([0.0], np.cumsum(weights)))
+    target = cumulative[starts] + q / 100 * (cumulative[ends] - cumulative[starts])
+    index = np.searchsorted(cumulative[1:], target, side='left')
+    index = np.clip(index, starts, np.maximum(ends - 1, starts))
+
+    percentiles = np.full(len(starts), np.nan)
+    non_empty = ends > starts
+    percentiles[non_empty] = values[index[non_empty]]
+
+    return percentiles
+
+
+def error_batch(consumption1, consumption2, dt, speed, offsets, percentiles=None):
+    """ Calculate the error metrics for many tracks at once
+
+    The tracks are concatenated and separated by offsets (CSR layout), all metrics are calculated by segmented
+    reductions over the concatenated arrays instead of one function call per track.
+
+    Parameters
+    ----------
+    consumption1: numpy array
+        consumption in l/h or kW (all tracks concatenated)
+    consumption2: numpy array
+        consumption in l/h or kW (all tracks concatenated)
+    dt: numpy array
+        time interval in seconds (all tracks concatenated)
+    speed: numpy array
+        speed in km/h (all tracks concatenated)
+    offsets: numpy array
+        start index of each track and the total length as last element (see segment_sum)
+    percentiles: list of float
+        percentiles (0 - 100) of the time-weighted absolute error to calculate per track (default None)
+
+    Returns
+    -------
+    table: dictionary of numpy arrays
+        one row per track (can be passed to pandas.DataFrame) with the columns
+        'track', 'n_points', 'duration' (s), 'distance' (km), 'total1' and 'total2' (accumulated consumption in l or
+        kWh), 'error_mean', 'error_measure', 'error_100km' (see the single track functions) and 'error_p<q>' for each
+        percentile
+    """
+
+    consumption1 = np.asarray(consumption1, dtype=float)
+    consumption2 = np.asarray(consumption2, dtype=float)
+    dt = np.asarray(dt, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    offsets = np.asarray(offsets)
+
+    if not len(consumption1) == len(consumption2) == len(dt) == len(speed) == offsets[-1]:
+        raise Exception("The arrays consumption1, consumption2, dt and speed must have the length offsets[-1]!")
+
+    absolute_error = np.abs(consumption1 - consumption2)
+
+    duration = segment_sum(dt, offsets)
+    sum1 = segment_sum(consumption1 * dt, offsets)
+    sum2 = segment_sum(consumption2 * dt, offsets)
+    sum_speed = segment_sum(speed * dt, offsets)
+    sum_error = segment_sum(absolute_error * dt, offsets)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        table = {
+            'track': np.arange(len(offsets) - 1),
+            'n_points': np.diff(offsets),
+            'duration': duration,
+            'distance': sum_speed / 3600,
+            'total1': sum1 / 3600,
+            'total2': sum2 / 3600,
+            'error_mean': np.abs(sum1 - sum2) / duration,
+            'error_measure': sum_error / duration,
+            'error_100km': 100 * np.abs(sum1 - sum2) / sum_speed
+        }
+
+    for q in percentiles or []:
+        table['error_p{:g}'.format(q)] = segment_weighted_percentile(absolute_error, dt, offsets, q)
+
+    return table
@@ -0,0 +1,71 @@
+import numpy as np
+
+
+def as_float_array(values, dtype=None):
+    """ Convert input values to a contiguous float array
+
+    Lists, tuples and pandas Series are converted to numpy arrays. NumPy arrays are only copied if they are not of a
+    float type (of the given dtype) or not contiguous. Arrays of other array libraries (e.g. Dask) are returned
+    unchanged, as well as scalars if no dtype is given.
+
+    Parameters
+    ----------
+    values: list, tuple, pandas Series, numpy array or scalar
+        input values
+    dtype: numpy dtype
+        float type of the result, e.g. np.float32 (default None, i.e. float arrays keep their type and other values are
+        converted to float64)
+
+    Returns
+    -------
+    values: numpy array or scalar
+        contiguous float array (or the unchanged input)
+    """
+
+    if hasattr(values, 'to_numpy'):
+        values = values.to_numpy()
+    if isinstance(values, (list, tuple)):
+        return np.ascontiguousarray(values, dtype=float if dtype is None else dtype)
+    if isinstance(values, np.ndarray):
+        if dtype is not None:
+            return np.ascontiguousarray(values, dtype=dtype)
+        if values.dtype.kind == 'f':
+            return np.ascontiguousarray(values)
+        return np.ascontiguousarray(values, dtype=float)
+    if dtype is not None and isinstance(values, (int, float, np.number)):
+        # scalars of another float type would promote the arrays they are combined with
+        return np.dtype(dtype).type(values)
+    return values
+
+
+def validate_arrays(names, *arrays, dtype=None):
+    """ Convert input arrays to contiguous float arrays and check that they have the same length
+
+    Parameters
+    ----------
+    names: list of str
+        names of the arrays (for the error message)
+    arrays: lists, tuples, pandas Series or numpy arrays
+        input arrays
+    dtype: numpy dtype
+        float type of the arrays, e.g. np.float32 (default None, see as_float_array)
+
+    Returns
+    -------
+    arrays: list of numpy arrays
+        converted arrays (see as_float_array)
+    """
+
+    arrays = [as_float_array(array, dtype) for array in arrays]
+
+    if len({np.shape(array) for array in arrays}) > 1:
+        raise Exception("The arrays {} and {} must have the same length!".format(', '.join(names[:-1]), names[-1]))
+
+    return arrays
+
+
+def check_gradient_angle(gradient_angle):
+    """ Check that gradient angles are given in radians (NaN values are ignored) """
+
+    if isinstance(gradient_angle, np.ndarray) and np.any(np.abs(gradient_angle) > np.pi / 2):
+        raise Exception("The gradient_angle must be given in radians between -pi/2 and pi/2!")
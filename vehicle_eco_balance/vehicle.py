@@ -2,17 +2,20 @@ fuel_types = {
     'electric': {
         'calorific_value': None,
         'min_efficiency': 0.9,
-        'max_efficiency': 0.9
+        'max_efficiency': 0.9,
+        'emission_factors': {'co2': None}  # depends on the grid mix, see emissions.grid_mixes
     },
     'gasoline': {
         'calorific_value': 9.12,  # in kWh/l
         'min_efficiency': 0.1,
-        'max_efficiency': 0.38
+        'max_efficiency': 0.38,
+        'emission_factors': {'co2': 2.37}  # in kg/l
     },
     'diesel': {
         'calorific_value': 9.97,  # in kWh/l
         'min_efficiency': 0.1,
-        'max_efficiency': 0.43
+        'max_efficiency': 0.43,
+        'emission_factors': {'co2': 2.65}  # in kg/l
     }
 }
 
@@ -44,6 +47,9 @@ class Car(Vehicle):
         minimum efficiency (default for gasoline/diesel 0.1 (i.e. 10 %), default for electric 0.9 (i.e. 90 %))
     max_efficiency³: float
         maximum efficiency (default for gasoline 0.38 (i.e. 38 %), default for diesel 0.43 (i.e. 43 %), default for electric 0.9 (i.e. 90 %))
+    emission_factors: dictionary
+        emission factor per pollutant in kg/l, e.g. {'co2': 2.37} (default for gasoline {'co2': 2.37}, default for
+        diesel {'co2': 2.65}, for electric cars the factors depend on the grid mix (see emissions.grid_mixes))
 
     References for default values:
     ¹ Martin Treiber and Arne Kesting. “Traffic flow dynamics.” In: Traffic Flow Dynamics: Data, Models and Simulation,
@@ -53,7 +59,7 @@ class Car(Vehicle):
     ³ Stefan Pischinger und Ulrich Seiffert. Vieweg Handbuch Kraftfahrzeugtechnik. Springer, 2016. Page 261.
     """
     def __init__(self, mass=1500, cross_section=2.635, cw=0.3, fuel_type='gasoline', idle_power=2.0,
-                 calorific_value=None, min_efficiency=None, max_efficiency=None):
+                 calorific_value=None, min_efficiency=None, max_efficiency=None, emission_factors=None):
 
         super().__init__(mass)
         self.cross_section = cross_section
@@ -72,11 +78,15 @@ class Car(Vehicle):
             self.max_efficiency = fuel_types.get(self.fuel_type).get('max_efficiency')
         else:
             self.max_efficiency = max_efficiency
+        if emission_factors is None:
+            self.emission_factors = dict(fuel_types.get(self.fuel_type).get('emission_factors'))
+        else:
+            self.emission_factors = emission_factors
 
     def __str__(self):
-        return "Car properties: \n mass: {} \n cross_section: {} \n cw: {} \n fuel_type: {} \n idle_power: {} \n calorific_value: {} \n min_efficiency: {} \n max_efficiency: {}".format(
+        return "Car properties: \n mass: {} \n cross_section: {} \n cw: {} \n fuel_type: {} \n idle_power: {} \n calorific_value: {} \n min_efficiency: {} \n max_efficiency: {} \n emission_factors: {}".format(
             self.mass, self.cross_section, self.cw, self.fuel_type, self.idle_power, self.calorific_value,
-            self.min_efficiency, self.max_efficiency)
+            self.min_efficiency, self.max_efficiency, self.emission_factors)
 
 
 class Airplane(Vehicle):